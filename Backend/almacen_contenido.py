@@ -0,0 +1,69 @@
+import os
+import tempfile
+import threading
+
+
+class AlmacenContenido:
+    """Almacén en disco direccionado por hash, con tope de tamaño y expulsión de lo menos usado.
+
+    Cada entrada es un archivo <hash[:2]>/<hash>; la fecha de modificación
+    hace de marca de último acceso para decidir qué expulsar.
+    """
+
+    def __init__(self, directorio, max_bytes):
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directorio, exist_ok=True)
+        self._total = sum(tamano for _, tamano, _ in self._entradas())
+
+    def obtener(self, huella):
+        ruta = self._ruta(huella)
+        try:
+            with open(ruta, "rb") as archivo:
+                contenido = archivo.read()
+            os.utime(ruta)
+            return contenido
+        except FileNotFoundError:
+            return None
+
+    def guardar(self, huella, contenido):
+        ruta = self._ruta(huella)
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        descriptor, temporal = tempfile.mkstemp(dir=os.path.dirname(ruta), suffix=".tmp")
+        with os.fdopen(descriptor, "wb") as archivo:
+            archivo.write(contenido)
+
+        with self._lock:
+            try:
+                self._total -= os.path.getsize(ruta)
+            except FileNotFoundError:
+                pass
+            os.replace(temporal, ruta)
+            self._total += len(contenido)
+            if self._total > self.max_bytes:
+                self._expulsar()
+
+    def _ruta(self, huella):
+        return os.path.join(self.directorio, huella[:2], huella)
+
+    def _entradas(self):
+        for subdirectorio in os.scandir(self.directorio):
+            if not subdirectorio.is_dir():
+                continue
+            for entrada in os.scandir(subdirectorio.path):
+                if entrada.is_file() and not entrada.name.endswith(".tmp"):
+                    estado = entrada.stat()
+                    yield entrada.path, estado.st_size, estado.st_mtime
+
+    def _expulsar(self):
+        # Se libera hasta el 90% del tope para no expulsar en cada escritura
+        objetivo = int(self.max_bytes * 0.9)
+        for ruta, tamano, _ in sorted(self._entradas(), key=lambda e: e[2]):
+            if self._total <= objetivo:
+                break
+            try:
+                os.remove(ruta)
+                self._total -= tamano
+            except FileNotFoundError:
+                pass
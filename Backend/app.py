@@ -1,87 +1,211 @@
-from flask import Flask, request, jsonify, send_file
-import google.generativeai as genai
+from flask import Flask, request, jsonify, Response, stream_with_context, g
 import os
 import re
-import numpy as np
-import io
-from fpdf import FPDF
+import json
+import time
+import random
+import itertools
+import threading
+import contextvars
+import hashlib
+import atexit
+import multiprocessing
+from urllib.parse import urlsplit
 from unidecode import unidecode
 from dotenv import load_dotenv
-import fitz
 from flask_cors import CORS
-from bs4 import BeautifulSoup
-
-def html_a_texto_plano(html):
-    """Convierte contenido HTML a texto plano legible para el PDF"""
-    soup = BeautifulSoup(html, "html.parser")
-    return soup.get_text(separator="\n").strip()
-
+from markdown_html import markdown_to_html, MarkdownIncremental
+from cliente_modelo import ClienteModelo, BackendGemini, BackendFalso
+from cache_modelo import CacheRespuestas, ModeloConCache, texto_fragmento, CONSULTAS_CACHE
+from almacen_contenido import AlmacenContenido
+from lotes import PlanificadorLotes
+from cola_trabajos import ColaTrabajos
+from pool_casos import PoolCasos
+from ingesta_pdf import PDFRechazado, guardar_temporal, extraer_texto, dividir_texto, precargar as precargar_pdf
+from metricas import REGISTRO, medir, span, con_contexto
+from informe_pdf import renderizar_informe, html_a_texto_plano
+from sesiones import AlmacenSesiones
+from calentamiento import Calentamiento
+from intenciones import clasificar, plegar, senales
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future, CancelledError, TimeoutError as FutureTimeoutError
 
 def eliminar_emojis(texto):
     return emoji.replace_emoji(texto, replace='')
 
-def markdown_to_html(text):
-    # ❗ Eliminar cualquier etiqueta HTML residual que se haya colado del modelo
-    text = re.sub(r'<[^>]+>', '', text)
 
-    # Convertir encabezados markdown ### a <h3>
-    text = re.sub(r'^### (.*?)$', r'<h3>\1</h3>', text, flags=re.MULTILINE)
+# Cargar variables de entorno
+load_dotenv()
 
-    # Convertir negritas markdown **texto** a <strong>
-    text = re.sub(r'\*\*(.*?)\*\*', r'<strong>\1</strong>', text)
+# Usar modelo Gemini 1.5 Pro más reciente
+NOMBRE_MODELO = "gemini-2.0-flash"
+TIMEOUT_ETAPA = float(os.getenv("TIMEOUT_ETAPA_MODELO", "45"))
+
+# Backend del modelo: "gemini" (por defecto) o "falso" para pruebas y benchmarks sin red
+MODELO_BACKEND = os.getenv("MODELO_BACKEND", "gemini")
+if MODELO_BACKEND == "falso":
+    BACKEND = BackendFalso(
+        latencia=float(os.getenv("FALSO_LATENCIA", "0.05")),
+        tokens_por_segundo=float(os.getenv("FALSO_TOKENS_POR_SEGUNDO", "0")) or None,
+        tasa_error=float(os.getenv("FALSO_TASA_ERROR", "0"))
+    )
+else:
+    # Configurar la API de Gemini
+    gemini_api_key = os.getenv("GEMINI_API_KEY")
+    if not gemini_api_key:
+        raise ValueError("❌ ERROR: No se encontró la clave API de Gemini. Verifica tu archivo .env.")
+    BACKEND = BackendGemini(NOMBRE_MODELO, gemini_api_key)
+
+# Todas las rutas pasan por el mismo cliente: ritmo, concurrencia, reintentos y circuit breaker
+CLIENTE_MODELO = ClienteModelo(
+    BACKEND,
+    solicitudes_por_segundo=float(os.getenv("MODELO_SOLICITUDES_POR_SEGUNDO", "10")),
+    tokens_por_minuto=int(os.getenv("MODELO_TOKENS_POR_MINUTO", "1000000")),
+    max_concurrencia=int(os.getenv("MODELO_MAX_CONCURRENCIA", "8")),
+    reintentos=int(os.getenv("MODELO_REINTENTOS", "3")),
+    timeout=TIMEOUT_ETAPA,
+    umbral_fallos=int(os.getenv("MODELO_UMBRAL_FALLOS", "5")),
+    enfriamiento=float(os.getenv("MODELO_ENFRIAMIENTO_SEGUNDOS", "30")),
+    # Reintentos incluidos: una etapa no sigue llamando al modelo después de que esperar_etapas se rindió
+    plazo_total=float(os.getenv("MODELO_PLAZO_TOTAL_SEGUNDOS", str(TIMEOUT_ETAPA)))
+)
+
+# Cache de respuestas: LRU en memoria + SQLite en disco. Las llamadas con
+# temperature 0 se cachean siempre; las creativas solo en las rutas listadas
+# en CACHE_RUTAS_CREATIVAS, y CACHE_RUTAS_EXCLUIDAS desactiva el cache por ruta.
+DIRECTORIO_CACHE = os.getenv("DIRECTORIO_CACHE", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache"))
+CACHE_MODELO = CacheRespuestas(
+    os.path.join(DIRECTORIO_CACHE, "respuestas_modelo.sqlite3"),
+    max_memoria=int(os.getenv("CACHE_MAX_MEMORIA", "512")),
+    max_disco=int(os.getenv("CACHE_MAX_DISCO", "20000")),
+    ttl=float(os.getenv("CACHE_TTL_SEGUNDOS", str(7 * 24 * 3600)))
+)
+CACHE_RUTAS_CREATIVAS = {r.strip() for r in os.getenv("CACHE_RUTAS_CREATIVAS", "").split(",") if r.strip()}
+CACHE_RUTAS_EXCLUIDAS = {r.strip() for r in os.getenv("CACHE_RUTAS_EXCLUIDAS", "").split(",") if r.strip()}
+
+MODEL = ModeloConCache(CLIENTE_MODELO, CACHE_MODELO, NOMBRE_MODELO)
+
+
+def politica_cache(ruta):
+    """True/False fuerza el cache para la ruta; None deja la regla por temperatura"""
+    if ruta in CACHE_RUTAS_EXCLUIDAS:
+        return False
+    if ruta in CACHE_RUTAS_CREATIVAS:
+        return True
+    return None
+
+
+# Ejecutor compartido para las llamadas al modelo que pueden correr en paralelo
+HILOS_ETAPAS = int(os.getenv("HILOS_ETAPAS_MODELO", "8"))
+EJECUTOR_ETAPAS = ThreadPoolExecutor(
+    max_workers=HILOS_ETAPAS,
+    thread_name_prefix="etapa-modelo"
+)
+
+
+def generar_texto(prompt, generation_config, cache=None, tipo="otro"):
+    """Llamada simple al modelo con timeout propio, devuelve el texto limpio"""
+    return MODEL.generate_content(
+        prompt,
+        generation_config=generation_config,
+        cache=cache,
+        tipo=tipo,
+        request_options={"timeout": TIMEOUT_ETAPA}
+    ).text.strip()
+
+
+def encadenar(futuro, funcion):
+    """Programa funcion(resultado) en el ejecutor apenas termina futuro, sin dejar un hilo bloqueado esperando"""
+    siguiente = Future()
+    # El callback corre en el hilo que completó futuro: la traza se toma de quien encadena
+    contexto = contextvars.copy_context()
+
+    def ejecutar(resultado):
+        # Si esperar_etapas canceló la etapa mientras estaba en cola, no se llama al modelo
+        if not siguiente.set_running_or_notify_cancel():
+            return
+        try:
+            siguiente.set_result(contexto.run(funcion, resultado))
+        except BaseException as e:
+            siguiente.set_exception(e)
+
+    def al_terminar(previo):
+        if siguiente.cancelled():
+            return
+        if previo.cancelled():
+            siguiente.cancel()
+        elif previo.exception() is not None:
+            if siguiente.set_running_or_notify_cancel():
+                siguiente.set_exception(previo.exception())
+        else:
+            try:
+                EJECUTOR_ETAPAS.submit(ejecutar, previo.result())
+            except Exception as e:
+                if siguiente.set_running_or_notify_cancel():
+                    siguiente.set_exception(e)
 
-    # Procesar listas
-    lines = text.split('\n')
-    html_lines = []
-    in_list = False
+    futuro.add_done_callback(al_terminar)
+    return siguiente
 
-    for line in lines:
-        if line.strip().startswith('*'):
-            if not in_list:
-                html_lines.append('<ul>')
-                in_list = True
-            html_lines.append(f"<li>{line.strip()[1:].strip()}</li>")
-        else:
-            if in_list:
-                html_lines.append('</ul>')
-                in_list = False
-            if line.strip():
-                html_lines.append(f"<p>{line.strip()}</p>")
-            else:
-                html_lines.append("<br>")
 
-    if in_list:
-        html_lines.append('</ul>')
+def esperar_etapas(futuros, limites):
+    """Espera cada etapa hasta su límite; devuelve (resultados, errores) sin abortar por un fallo parcial"""
+    resultados, errores = {}, {}
+    for nombre, futuro in futuros.items():
+        try:
+            restante = max(0.0, limites[nombre] - time.monotonic())
+            resultados[nombre] = futuro.result(timeout=restante)
+        except FutureTimeoutError:
+            futuro.cancel()
+            errores[nombre] = "Tiempo de espera agotado"
+        except CancelledError:
+            errores[nombre] = "Etapa cancelada"
+        except Exception as e:
+            errores[nombre] = str(e)
+    return resultados, errores
 
-    return '\n'.join(html_lines)
+# Inicializar Flask
+app = Flask(__name__)
+CORS(app)
+app.secret_key = os.getenv("FLASK_SECRET_KEY", "clave_secreta_segura")
 
+# Métricas por ruta: latencia, solicitudes en curso y un span raíz por solicitud
+DURACION_SOLICITUD = REGISTRO.histograma("http_solicitud_duracion_segundos", "Latencia de cada ruta hasta armar la respuesta")
+SOLICITUDES_EN_CURSO = REGISTRO.medidor("http_solicitudes_en_curso", "Solicitudes atendiéndose por ruta")
 
-# Cargar variables de entorno
-load_dotenv()
 
-# Configurar la API de Gemini
-gemini_api_key = os.getenv("GEMINI_API_KEY")
-if not gemini_api_key:
-    raise ValueError("❌ ERROR: No se encontró la clave API de Gemini. Verifica tu archivo .env.")
+def ruta_metrica():
+    # La regla y no la URL: /jobs/<id_trabajo> es una sola serie
+    return request.url_rule.rule if request.url_rule else "no_encontrada"
 
-genai.configure(api_key=gemini_api_key)
 
-# Usar modelo Gemini 1.5 Pro más reciente
-MODEL = genai.GenerativeModel("gemini-2.0-flash")
+@app.before_request
+def iniciar_medicion():
+    g.inicio_solicitud = time.perf_counter()
+    g.ruta_metrica = ruta_metrica()
+    SOLICITUDES_EN_CURSO.inc(ruta=g.ruta_metrica)
+    g.span_solicitud = span("http", ruta=g.ruta_metrica, metodo=request.method)
+    g.span_solicitud.__enter__()
 
-# Inicializar Flask
-app = Flask(__name__)
-CORS(app)
-app.secret_key = os.getenv("FLASK_SECRET_KEY", "clave_secreta_segura")
 
-ISO_9001_KEYWORDS = [
-    "auditoría", "ISO 9001", "calidad", "requisitos", "sistema de gestión",
-    "mejora continua", "documentación", "procesos", "indicadores", "no conformidad"
-]
+@app.after_request
+def registrar_medicion(response):
+    if "inicio_solicitud" in g:
+        DURACION_SOLICITUD.observar(
+            time.perf_counter() - g.inicio_solicitud,
+            ruta=g.ruta_metrica, metodo=request.method, codigo=response.status_code
+        )
+    return response
+
+
+@app.teardown_request
+def terminar_medicion(error=None):
+    # Corre también si la vista lanzó una excepción, y tras el último evento en SSE
+    if "span_solicitud" in g:
+        g.span_solicitud.__exit__(None, None, None)
+        SOLICITUDES_EN_CURSO.dec(ruta=g.ruta_metrica)
 
 def es_pregunta_iso9001(texto):
-    texto = texto.lower()
-    return any(kw in texto for kw in ISO_9001_KEYWORDS)
+    return "iso" in senales(plegar(texto))
 
 def limpiar_texto(texto):
     if not texto:
@@ -91,172 +215,1050 @@ def limpiar_texto(texto):
     return texto[:3000]
 
 def pide_caso_estudio_real(texto):
-    texto = texto.lower()
-    return any(kw in texto for kw in ["dame un caso de estudio", "caso de empresa real", "quiero un caso real", "proporcióname un caso de estudio"])
+    return "caso_real" in senales(plegar(texto))
+
+
+CASO_REAL_PROMPT = (
+    "Proporcióname un caso de estudio real y diferente de una empresa conocida que haya implementado la norma ISO 9001.\n"
+    "Cada vez que se te solicite, elige una empresa distinta que opere en un país y sector diferentes. Describe el nombre de la empresa, el sector en el que opera, los problemas que enfrentaba antes de certificarse, los cambios que aplicó para cumplir con la norma y los beneficios obtenidos luego de su certificación."
+)
+CASO_REAL_CONTENIDO = [{"role": "user", "parts": [f"Eres un experto en certificaciones ISO 9001.\n\n{CASO_REAL_PROMPT}"]}]
+
+CONFIG_ANALISIS = {
+    "temperature": 0.7,
+    "max_output_tokens": 2048
+}
+
+PROCEDIMIENTO_PROMPT = (
+    "En base al caso de estudio anterior, redacta los pasos detallados que un auditor ISO 9001 seguiría para realizar una auditoría específica a este caso. "
+    "Incluye las fases reales aplicables:\n"
+    "- Planificación\n- Revisión documental\n- Listas de verificación\n- Entrevistas y observaciones\n"
+    "- Revisión de registros\n- Elaboración del informe y acciones de seguimiento.\n"
+    "Evita explicaciones generales. Todo debe enfocarse en el contexto del caso."
+)
+PROCEDIMIENTO_ENCABEZADO = "<strong>🧭 Procedimiento General de Auditoría aplicado al caso:</strong><br><br>"
+
+
+# Mensajes que no son un caso de estudio: se responden sin el análisis de dos llamadas
+MIN_PALABRAS_CASO = int(os.getenv("MIN_PALABRAS_CASO", "4"))
+MAX_PALABRAS_PREGUNTA = int(os.getenv("MAX_PALABRAS_PREGUNTA", "40"))
+INTENCIONES_CHAT = REGISTRO.contador("chat_intenciones_total", "Mensajes de /chat por intención detectada")
+RESPUESTAS_PLANTILLA = {
+    "saludo": (
+        "¡Hola! 👋 Soy tu asistente de auditoría ISO 9001. Describe el caso de estudio de una empresa "
+        "(sector, problemas, procesos, registros) y lo analizaré según la norma. También puedes pedirme "
+        "<em>\"dame un caso de estudio\"</em> o hacerme una pregunta sobre ISO 9001."
+    ),
+    "muy_corto": (
+        "El mensaje es muy corto para analizarlo. Describe el caso de estudio con más detalle: qué hace la "
+        "empresa, qué problemas tiene y qué controles o registros existen."
+    ),
+    "fuera_de_tema": (
+        "Solo puedo ayudarte con auditorías y la norma ISO 9001. Describe el caso de estudio de una empresa "
+        "o haz una pregunta sobre la norma."
+    ),
+}
+CONFIG_PREGUNTA_ISO = {"temperature": 0.3, "max_output_tokens": 700}
+
+
+def prompt_pregunta_iso(pregunta):
+    return (
+        "Eres un auditor experto en la norma ISO 9001. Responde de forma breve y precisa la siguiente pregunta, "
+        "citando las cláusulas de la norma cuando corresponda. Usa Markdown con listas si ayuda a la claridad.\n\n"
+        f"Pregunta: {pregunta}"
+    )
+
+
+def responder_intencion(intencion, full_prompt):
+    """(payload, código HTTP) para los mensajes que no son un caso de estudio; None si lo son"""
+    if intencion in RESPUESTAS_PLANTILLA:
+        return {"respuesta": RESPUESTAS_PLANTILLA[intencion], "intencion": intencion}, 200
+    if intencion == "pregunta_iso":
+        try:
+            response = MODEL.generate_content(
+                prompt_pregunta_iso(full_prompt),
+                generation_config=CONFIG_PREGUNTA_ISO,
+                cache=politica_cache("pregunta_iso"),
+                tipo="pregunta_iso"
+            )
+            return {"respuesta": markdown_to_html(response.text.strip()), "intencion": intencion}, 200
+        except Exception as e:
+            print(f"❌ Error respondiendo pregunta ISO: {str(e)}")
+            return {"error": "Error al comunicarse con el modelo."}, 500
+    return None
 
 
-@app.route("/")
-def index():
-    return jsonify({"message": "API para Chatbot ISO 9001 funcionando correctamente."})
+# Modo de /chat: "encadenado" (dos turnos), "estructurado" (una llamada JSON) o "ab" para repartir entre ambos
+MODO_CHAT = os.getenv("MODO_CHAT", "encadenado")
+FRACCION_ESTRUCTURADO = float(os.getenv("FRACCION_AB_ESTRUCTURADO", "0.5"))
 
-@app.route("/chat", methods=["POST"]) 
-def chat():
-    data = request.get_json()
-    user_input = data.get("message", "").strip()
-    image_data = data.get("image_data")
-    extracted_text = ""
+SECCIONES_ESTRUCTURADAS = [
+    ("procedimiento", PROCEDIMIENTO_ENCABEZADO),
+    ("procedimiento_aplicado", "<strong>🧭 Procedimiento Aplicado:</strong>"),
+    ("evidencia", "<strong>🔬 Evidencia Recolectada:</strong>"),
+    ("hallazgos", "<strong>🧠 Hallazgos Identificados:</strong>"),
+    ("recomendaciones", "<strong>🚀 Mejoras o Recomendaciones:</strong>"),
+]
+CONFIG_ESTRUCTURADO = {
+    "temperature": 0.7,
+    "max_output_tokens": 4096,
+    "response_mime_type": "application/json",
+    "response_schema": {
+        "type": "OBJECT",
+        "properties": {clave: {"type": "STRING"} for clave, _ in SECCIONES_ESTRUCTURADAS},
+        "required": [clave for clave, _ in SECCIONES_ESTRUCTURADAS],
+    },
+}
+
+_AB_LOCK = threading.Lock()
+ESTADISTICAS_AB = {
+    modo: {"solicitudes": 0, "errores": 0, "segundos": 0.0, "tokens_entrada": 0, "tokens_salida": 0, "con_uso": 0}
+    for modo in ("encadenado", "estructurado")
+}
+
+
+def elegir_modo_chat():
+    if MODO_CHAT == "ab":
+        return "estructurado" if random.random() < FRACCION_ESTRUCTURADO else "encadenado"
+    return "estructurado" if MODO_CHAT == "estructurado" else "encadenado"
+
+
+def sumar_uso(*respuestas):
+    """Suma tokens de entrada/salida; None si alguna respuesta (p. ej. del cache) no trae uso"""
+    entrada = salida = 0
+    for respuesta in respuestas:
+        uso = getattr(respuesta, "usage_metadata", None)
+        if uso is None:
+            return None
+        entrada += uso.prompt_token_count
+        salida += uso.candidates_token_count
+    return entrada, salida
+
+
+def registrar_ab(modo, segundos, uso, error=False):
+    with _AB_LOCK:
+        datos = ESTADISTICAS_AB[modo]
+        datos["solicitudes"] += 1
+        datos["errores"] += int(error)
+        if not error:
+            datos["segundos"] += segundos
+        if uso is not None:
+            datos["con_uso"] += 1
+            datos["tokens_entrada"] += uso[0]
+            datos["tokens_salida"] += uso[1]
+
+
+def prompt_estructurado(caso):
+    return (
+        "Eres un auditor experto en la norma ISO 9001.\n\n"
+        "Analiza el siguiente caso de estudio de forma estructurada. No respondas de forma general. Todo debe estar enfocado exclusivamente en el caso proporcionado.\n"
+        "Responde únicamente con un objeto JSON con estas claves, cada una con texto en Markdown:\n"
+        "- procedimiento: los pasos detallados que un auditor ISO 9001 seguiría para auditar este caso, con las fases de "
+        "Planificación, Revisión documental, Listas de verificación, Entrevistas y observaciones, Revisión de registros y "
+        "Elaboración del informe y acciones de seguimiento.\n"
+        "- procedimiento_aplicado: los procedimientos reales auditados según el caso.\n"
+        "- evidencia: qué evidencias se observaron o recopilaron (registros, entrevistas, documentos específicos del caso).\n"
+        "- hallazgos: no conformidades, fortalezas o debilidades encontradas, citando las cláusulas ISO 9001 aplicables.\n"
+        "- recomendaciones: acciones específicas de mejora basadas solo en este caso.\n\n"
+        f"Caso de estudio:\n{caso}"
+    )
+
+
+def prompt_analisis(caso):
+    return (
+        "Eres un auditor experto en la norma ISO 9001.\n\n"
+        "Analiza el siguiente caso de estudio de forma estructurada. No respondas de forma general. Todo debe estar enfocado exclusivamente en el caso proporcionado.\n"
+        "Estructura la respuesta en las siguientes secciones claramente separadas:\n\n"
+        "<strong>🧭 Procedimiento Aplicado:</strong>\n"
+        "Describe los procedimientos reales auditados según el caso.\n\n"
+        "<strong>🔬 Evidencia Recolectada:</strong>\n"
+        "Describe qué evidencias se observaron o recopilaron (registros, entrevistas, documentos específicos del caso).\n\n"
+        "<strong>🧠 Hallazgos Identificados:</strong>\n"
+        "Indica no conformidades, fortalezas o debilidades encontradas, citando las cláusulas ISO 9001 aplicables.\n\n"
+        "<strong>🚀 Mejoras o Recomendaciones:</strong>\n"
+        "Redacta acciones específicas de mejora basadas solo en este caso.\n\n"
+        f"Caso de estudio:\n{caso}"
+    )
+
+
+# Límites y paralelismo de la ingesta de PDFs
+MAX_BYTES_PDF = int(os.getenv("MAX_MB_PDF", "50")) * 1024 * 1024
+MAX_PAGINAS_PDF = int(os.getenv("MAX_PAGINAS_PDF", "500"))
+PAGINAS_POR_TAREA = int(os.getenv("PAGINAS_POR_TAREA_PDF", "16"))
+UMBRAL_MAPREDUCE = int(os.getenv("UMBRAL_CARACTERES_MAPREDUCE", "60000"))
+TAMANO_PARTE_PDF = int(os.getenv("TAMANO_PARTE_PDF", "20000"))
+_EJECUTOR_PDF = None
+_EJECUTOR_PDF_LOCK = threading.Lock()
+# Los pools de procesos no heredan por fork los hilos, locks y conexiones de este proceso
+# (un lock tomado por otro hilo al momento del fork queda tomado para siempre en el hijo)
+CONTEXTO_PROCESOS = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+
+def ejecutor_pdf():
+    """Pool de procesos para extraer páginas, creado en el primer PDF que lo necesita"""
+    global _EJECUTOR_PDF
+    with _EJECUTOR_PDF_LOCK:
+        if _EJECUTOR_PDF is None:
+            _EJECUTOR_PDF = ProcessPoolExecutor(
+                max_workers=int(os.getenv("PROCESOS_PDF", str(os.cpu_count() or 2))), mp_context=CONTEXTO_PROCESOS
+            )
+        return _EJECUTOR_PDF
 
-    if image_data:
-        pass  # Aquí podrías manejar una imagen en base64
 
-    full_prompt = f"{user_input}\n{extracted_text}".strip()
+# Resultados de /analizar_pdf guardados por SHA-256 del archivo subido
+ALMACEN_PDF = AlmacenContenido(
+    os.path.join(DIRECTORIO_CACHE, "pdf"),
+    int(os.getenv("CACHE_PDF_MAX_MB", "200")) * 1024 * 1024
+)
+
+
+def es_verdadero(valor):
+    return str(valor).strip().lower() in ("1", "true", "si", "sí", "yes")
+
+
+def arrancar_al_importar(variable):
+    """Si se arrancan hilos de fondo al importar: lo pide la variable (por defecto sí) y este no es el
+    proceso padre del recargador de werkzeug (python app.py con debug), que solo vigila los archivos,
+    ni un proceso de los pools, que con python app.py vuelve a importar este archivo como __mp_main__"""
+    padre_recargador = __name__ == "__main__" and os.environ.get("WERKZEUG_RUN_MAIN") != "true"
+    return es_verdadero(os.getenv(variable, "1")) and not padre_recargador and __name__ != "__mp_main__"
 
+
+# Casos casi repetidos (mismo texto con retoques) reutilizan el análisis ya hecho.
+# Los índices guardan firmas MinHash; el HTML vive en su propio almacén por huella.
+SIMILITUD_ACTIVA = es_verdadero(os.getenv("SIMILITUD_ACTIVA", "1"))
+SIMILITUD_UMBRAL = float(os.getenv("SIMILITUD_UMBRAL", "0.85"))
+SIMILITUD_MIN_CARACTERES = int(os.getenv("SIMILITUD_MIN_CARACTERES", "200"))
+SIMILITUD_CAPACIDAD = int(os.getenv("SIMILITUD_CAPACIDAD", "100000"))
+ALMACEN_SIMILARES = AlmacenContenido(
+    os.path.join(DIRECTORIO_CACHE, "similares"),
+    int(os.getenv("CACHE_SIMILARES_MAX_MB", "200")) * 1024 * 1024
+)
+_INDICES_SIMILITUD = {}
+_INDICES_SIMILITUD_LOCK = threading.Lock()
+
+
+def indice_similitud(tipo):
+    """Índice "chat" o "pdf", creado (y leído de disco) la primera vez que se usa: NumPy no se carga al arrancar"""
+    with _INDICES_SIMILITUD_LOCK:
+        if tipo not in _INDICES_SIMILITUD:
+            from similitud import IndiceSimilitud
+
+            indice = IndiceSimilitud(
+                os.path.join(DIRECTORIO_CACHE, f"similitud_{tipo}.npz"),
+                capacidad=SIMILITUD_CAPACIDAD,
+                umbral=SIMILITUD_UMBRAL
+            )
+            atexit.register(indice.guardar)
+            _INDICES_SIMILITUD[tipo] = indice
+        return _INDICES_SIMILITUD[tipo]
+
+
+def buscar_analisis_similar(tipo, texto):
+    """(html, similitud) del análisis de un caso casi igual, o None"""
+    if not SIMILITUD_ACTIVA or len(texto) < SIMILITUD_MIN_CARACTERES:
+        return None
+    encontrado = indice_similitud(tipo).buscar(texto)
+    html = ALMACEN_SIMILARES.obtener(encontrado[0]) if encontrado else None
+    CONSULTAS_CACHE.inc(tipo=f"similar_{tipo}", resultado="acierto" if html is not None else "fallo")
+    if html is None:
+        return None
+    return html.decode("utf-8"), round(encontrado[1], 3)
+
+
+def recordar_analisis(tipo, texto, respuesta_html):
+    if not SIMILITUD_ACTIVA or len(texto) < SIMILITUD_MIN_CARACTERES:
+        return
+    huella = hashlib.sha256(texto.encode("utf-8")).hexdigest()
+    try:
+        ALMACEN_SIMILARES.guardar(huella, respuesta_html.encode("utf-8"))
+        indice_similitud(tipo).agregar(texto, huella)
+    except OSError as e:
+        print(f"❌ No se pudo guardar el análisis para casos similares: {str(e)}")
+
+
+def leer_pdf_guardado(ruta, huella, forzar=False):
+    """La entrada sale del almacén salvo que se fuerce un análisis nuevo; si no, se extrae el texto"""
+    if not forzar:
+        guardado = ALMACEN_PDF.obtener(huella)
+        if guardado is not None:
+            return json.loads(guardado)
+    with medir("extraccion_pdf"):
+        texto_pdf = extraer_texto(ruta, MAX_PAGINAS_PDF, ejecutor_pdf(), PAGINAS_POR_TAREA)
+    return {"texto_extraido": texto_pdf.strip(), "respuesta": None}
+
+
+def leer_pdf_subido(file, forzar=False):
+    """Devuelve (huella, entrada) para un archivo recién subido"""
+    ruta, huella = guardar_temporal(file, MAX_BYTES_PDF)
+    try:
+        return huella, leer_pdf_guardado(ruta, huella, forzar)
+    finally:
+        os.remove(ruta)
+
+
+def guardar_analisis_pdf(huella, texto_pdf, respuesta_html):
+    try:
+        contenido = json.dumps({"texto_extraido": texto_pdf, "respuesta": respuesta_html}, ensure_ascii=False)
+        ALMACEN_PDF.guardar(huella, contenido.encode("utf-8"))
+    except OSError as e:
+        print(f"❌ No se pudo guardar el análisis del PDF en cache: {str(e)}")
+
+
+def analisis_pdf_previo(huella, entrada, forzar=False):
+    """(html, similitud) de un análisis ya hecho para este archivo (similitud None) o para otro con casi
+    el mismo texto, como otra exportación o una fecha cambiada; None si hay que analizarlo"""
+    if entrada["respuesta"] is not None:
+        return entrada["respuesta"], None
+    if forzar:
+        return None
+    similar = buscar_analisis_similar("pdf", entrada["texto_extraido"])
+    if similar:
+        guardar_analisis_pdf(huella, entrada["texto_extraido"], similar[0])
+    return similar
+
+
+def guardar_analisis_pdf_nuevo(huella, texto_pdf, respuesta_html):
+    """Un análisis recién hecho queda para este archivo y para los casi iguales que lleguen después"""
+    guardar_analisis_pdf(huella, texto_pdf, respuesta_html)
+    recordar_analisis("pdf", texto_pdf, respuesta_html)
+
+
+def prompt_parte_pdf(parte, indice, total):
+    return (
+        "Eres un auditor experto en la norma ISO 9001.\n\n"
+        f"El siguiente texto es la parte {indice} de {total} de un documento extenso. "
+        "Extrae de forma concisa los hechos relevantes para una auditoría ISO 9001: procesos descritos, "
+        "evidencias y registros mencionados, incumplimientos, indicadores y datos numéricos. "
+        "No inventes información ni agregues recomendaciones.\n\n"
+        f"Texto:\n{parte}"
+    )
+
+
+# Las notas por parte de los PDF largos van a un pool propio: un manual de cientos
+# de páginas no llena EJECUTOR_ETAPAS ni deja sin hilos a las etapas de /compare.
+HILOS_PARTES_PDF = int(os.getenv("HILOS_PARTES_PDF", "4"))
+_EJECUTOR_PARTES_PDF = None
+_EJECUTOR_PARTES_PDF_LOCK = threading.Lock()
+
+
+def ejecutor_partes_pdf():
+    """Pool de hilos para resumir las partes de un PDF, creado con el primer documento largo"""
+    global _EJECUTOR_PARTES_PDF
+    with _EJECUTOR_PARTES_PDF_LOCK:
+        if _EJECUTOR_PARTES_PDF is None:
+            _EJECUTOR_PARTES_PDF = ThreadPoolExecutor(max_workers=HILOS_PARTES_PDF, thread_name_prefix="parte-pdf")
+        return _EJECUTOR_PARTES_PDF
+
+
+def preparar_caso_pdf(texto_pdf):
+    """Los documentos largos se resumen por partes en paralelo y el análisis final se hace sobre esas notas"""
+    if len(texto_pdf) <= UMBRAL_MAPREDUCE:
+        return texto_pdf
+
+    partes = dividir_texto(texto_pdf, TAMANO_PARTE_PDF)
+    futuros = {
+        indice: ejecutor_partes_pdf().submit(
+            con_contexto(generar_texto),
+            prompt_parte_pdf(parte, indice + 1, len(partes)),
+            {"temperature": 0, "max_output_tokens": 1024},
+            tipo="parte_pdf"
+        )
+        for indice, parte in enumerate(partes)
+    }
+    # Las partes que no caben en el pool esperan turno: el límite crece por tandas
+    tandas = -(-len(partes) // HILOS_PARTES_PDF)
+    limite = time.monotonic() + TIMEOUT_ETAPA * tandas
+    notas, errores = esperar_etapas(futuros, {indice: limite for indice in futuros})
+    if not notas:
+        raise RuntimeError(f"Ninguna parte del PDF pudo analizarse: {errores}")
+    if errores:
+        print(f"❌ Partes del PDF sin analizar: {errores}")
+
+    return "\n\n".join(
+        f"[Parte {indice + 1} de {len(partes)}]\n{notas[indice]}" for indice in sorted(notas)
+    )
+
+
+# Lotes: un pool acotado y compartido que atiende los lotes por turnos
+MAX_ITEMS_LOTE = int(os.getenv("MAX_ITEMS_LOTE", "100"))
+TIMEOUT_LOTE = float(os.getenv("TIMEOUT_LOTE_SEGUNDOS", "600"))
+PLANIFICADOR_LOTES = PlanificadorLotes(int(os.getenv("HILOS_LOTES", "4")))
+
+
+def ejecutar_lote(procesar, argumentos):
+    """Corre procesar(*args) para cada ítem en el planificador y arma la respuesta por ítem"""
+    tareas = [con_contexto(lambda args=args: procesar(*args)) for args in argumentos]
+    resultados = []
+    for indice, (estado, valor) in enumerate(PLANIFICADOR_LOTES.ejecutar(tareas, TIMEOUT_LOTE)):
+        if estado == "ok":
+            payload, codigo = valor
+            if codigo == 200:
+                resultados.append({"indice": indice, "ok": True, "resultado": payload})
+            else:
+                resultados.append({"indice": indice, "ok": False, "error": payload.get("error", "Error desconocido")})
+        else:
+            print(f"❌ Error en ítem {indice} del lote: {valor}")
+            resultados.append({"indice": indice, "ok": False, "error": "Error procesando el ítem."})
+
+    return {
+        "resultados": resultados,
+        "total": len(resultados),
+        "exitosos": sum(1 for r in resultados if r["ok"])
+    }
+
+
+def leer_casos_lote(data):
+    """Valida el arreglo "casos" de un lote; devuelve (casos, error)"""
+    casos = (data or {}).get("casos")
+    if not isinstance(casos, list) or not casos:
+        return None, "Se esperaba un arreglo no vacío en 'casos'."
+    if len(casos) > MAX_ITEMS_LOTE:
+        return None, f"El lote supera el máximo de {MAX_ITEMS_LOTE} casos."
+    return casos, None
+
+
+# Cola de trabajos: las rutas largas aceptan "async" y devuelven un id para consultar en /jobs/<id>
+DIRECTORIO_TRABAJOS = os.path.join(DIRECTORIO_CACHE, "trabajos")
+os.makedirs(DIRECTORIO_TRABAJOS, exist_ok=True)
+COLA_TRABAJOS = ColaTrabajos(
+    os.path.join(DIRECTORIO_CACHE, "trabajos.sqlite3"),
+    hilos=int(os.getenv("HILOS_TRABAJOS", "2")),
+    retencion=float(os.getenv("RETENCION_TRABAJOS_SEGUNDOS", str(7 * 24 * 3600))),
+    arrendamiento=float(os.getenv("ARRENDAMIENTO_TRABAJOS_SEGUNDOS", "3600")),
+    propietario=os.getenv("PROPIETARIO_TRABAJOS") or None,
+    latido=float(os.getenv("LATIDO_TRABAJOS_SEGUNDOS", "10"))
+)
+# Orígenes (esquema://host[:puerto]) a los que se puede avisar con callback_url; vacío = sin callbacks
+ORIGENES_CALLBACK = {
+    origen.strip().rstrip("/").lower() for origen in os.getenv("ORIGENES_CALLBACK", "").split(",") if origen.strip()
+}
+
+
+# Sesiones: el caso, las respuestas y el texto de los PDF quedan en el servidor
+# para las preguntas de seguimiento y para citarlos por id en /compare.
+SESIONES = AlmacenSesiones(
+    os.path.join(DIRECTORIO_CACHE, "sesiones") if es_verdadero(os.getenv("SESIONES_EN_DISCO", "1")) else None,
+    max_memoria=int(os.getenv("SESIONES_MAX_MEMORIA", "256")),
+    max_caracteres=int(os.getenv("SESIONES_MAX_CARACTERES", str(64 * 1024 * 1024))),
+    ttl=float(os.getenv("SESIONES_TTL_SEGUNDOS", str(24 * 3600))),
+    max_turnos=int(os.getenv("SESIONES_MAX_TURNOS", "6"))
+)
+CONFIG_SEGUIMIENTO = {"temperature": 0.5, "max_output_tokens": 1024}
+CONTEXTO_ACEPTADO = "Entendido. Tengo presente el caso y lo conversado hasta ahora."
+
+
+def leer_sesion(valores):
+    """(id, None) para la sesión pedida, (None, None) si no se pidió y (None, respuesta 404) si no existe.
+
+    Un session_id vacío o "nueva" abre una sesión nueva.
+    """
+    if "session_id" not in valores:
+        return None, None
+    id_sesion = str(valores.get("session_id") or "").strip()
+    if id_sesion in ("", "nueva"):
+        return SESIONES.crear(), None
+    if not SESIONES.existe(id_sesion):
+        return None, (jsonify({"error": "Sesión no encontrada o vencida."}), 404)
+    return id_sesion, None
+
+
+def registrar_analisis_en_sesion(id_sesion, caso, respuesta_html, texto_pdf=None):
+    """Guarda el análisis en la sesión y devuelve los ids para agregar a la respuesta"""
+    if not id_sesion:
+        return {}
+    return SESIONES.registrar_analisis(id_sesion, caso, respuesta_html, html_a_texto_plano(respuesta_html), texto_pdf)
+
+
+def historial_sesion(id_sesion):
+    """Historial para start_chat: un turno con el caso y el resumen de lo compactado, y los turnos recientes"""
+    conversacion = SESIONES.conversacion(id_sesion)
+    if conversacion is None:
+        return None
+    caso, resumen, turnos = conversacion
+    contexto = (
+        "Eres un auditor experto en la norma ISO 9001. Responde las preguntas de seguimiento sobre este caso "
+        "de forma concreta, citando cláusulas cuando corresponda.\n\n"
+        f"Caso de estudio:\n{caso or 'No proporcionado'}"
+    )
+    if resumen:
+        contexto += f"\n\nResumen de la conversación anterior:\n{resumen}"
+    return [
+        {"role": "user", "parts": [contexto]},
+        {"role": "model", "parts": [CONTEXTO_ACEPTADO]},
+    ] + turnos
+
+
+def prompt_compactacion(resumen, turnos):
+    conversacion = "\n\n".join(
+        f"{'Usuario' if turno['role'] == 'user' else 'Auditor'}: {turno['parts'][0]}" for turno in turnos
+    )
+    previo = f"Resumen anterior:\n{resumen}\n\n" if resumen else ""
+    return (
+        "Resume en no más de 250 palabras la siguiente conversación sobre un caso de auditoría ISO 9001. "
+        "Conserva los hallazgos, las cláusulas citadas, las cifras y las recomendaciones; omite saludos y repeticiones.\n\n"
+        f"{previo}Conversación:\n{conversacion}"
+    )
+
+
+def compactar_sesion(id_sesion):
+    """Reemplaza los turnos viejos por un resumen cuando la sesión pasa del máximo de turnos"""
+    pendiente = SESIONES.turnos_a_compactar(id_sesion)
+    if pendiente is None:
+        return
+    resumen_previo, turnos = pendiente
+    try:
+        resumen = generar_texto(
+            prompt_compactacion(resumen_previo, turnos),
+            {"temperature": 0, "max_output_tokens": 512},
+            tipo="compactacion"
+        )
+        SESIONES.aplicar_resumen(id_sesion, resumen, turnos)
+    except Exception as e:
+        print(f"❌ No se pudo compactar la sesión {id_sesion}: {str(e)}")
+
+
+def pide_asincrono(data=None):
+    valor = request.args.get("async") or request.form.get("async") or (data or {}).get("async", "")
+    return es_verdadero(valor)
+
+
+def callback_permitido(url):
+    """Solo URL http(s) hacia un origen de ORIGENES_CALLBACK: el servidor no hace POST a direcciones arbitrarias"""
+    try:
+        partes = urlsplit(url)
+        puerto = partes.port
+    except ValueError:
+        return False
+    if partes.scheme not in ("http", "https") or not partes.hostname or partes.username or partes.password:
+        return False
+    por_defecto = {"http": 80, "https": 443}[partes.scheme]
+    origen = f"{partes.scheme}://{partes.hostname}" + (f":{puerto}" if puerto and puerto != por_defecto else "")
+    return origen in ORIGENES_CALLBACK
+
+
+def encolar_trabajo(tipo, payload, data=None):
+    callback = request.form.get("callback_url") or (data or {}).get("callback_url")
+    if callback and not callback_permitido(str(callback)):
+        return jsonify({"error": "callback_url no está entre los destinos permitidos."}), 400
+
+    id_trabajo = COLA_TRABAJOS.encolar(tipo, payload, callback)
+    return jsonify({"job_id": id_trabajo, "estado": "pendiente", "url": f"/jobs/{id_trabajo}"}), 202
+
+
+def trabajo_analizar_pdf(payload):
+    try:
+        return procesar_pdf(payload["ruta"], payload["huella"], payload["forzar"], payload.get("session_id"))
+    finally:
+        if os.path.exists(payload["ruta"]):
+            os.remove(payload["ruta"])
+
+
+def evento_sse(evento, datos):
+    return f"event: {evento}\ndata: {json.dumps(datos, ensure_ascii=False)}\n\n"
+
+
+def transmitir_html(fragmentos, seccion, acumulado=None, prefijo=""):
+    """Convierte un stream del modelo en eventos SSE con HTML incremental.
+
+    Si se pasa una lista en acumulado, se le agrega cada trozo de texto del
+    modelo (sin el prefijo), para guardar la respuesta completa al terminar.
+    """
+    def textos():
+        for fragmento in fragmentos:
+            texto = texto_fragmento(fragmento)
+            if acumulado is not None:
+                acumulado.append(texto)
+            yield texto
+
+    convertidor = MarkdownIncremental()
+    for texto in itertools.chain([prefijo] if prefijo else [], textos(), [None]):
+        html = convertidor.cerrar() if texto is None else convertidor.alimentar(texto)
+        if html:
+            yield evento_sse("fragmento", {"seccion": seccion, "html": html})
+
+
+def respuesta_sse(generador):
+    return Response(
+        stream_with_context(generador),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.route("/")
+def index():
+    return jsonify({"message": "API para Chatbot ISO 9001 funcionando correctamente."})
+
+@app.route("/cache/estadisticas", methods=["GET"])
+def estadisticas_cache():
+    return jsonify(CACHE_MODELO.estadisticas())
+
+@app.route("/similitud/estadisticas", methods=["GET"])
+def estadisticas_similitud():
+    return jsonify({tipo: indice_similitud(tipo).estadisticas() for tipo in ("chat", "pdf")})
+
+@app.route("/modelo/estadisticas", methods=["GET"])
+def estadisticas_modelo():
+    return jsonify(CLIENTE_MODELO.estadisticas())
+
+TRABAJOS_PENDIENTES = REGISTRO.medidor("trabajos_pendientes", "Trabajos en la cola persistente por estado")
+LOTES_PENDIENTES = REGISTRO.medidor("lotes_items_pendientes", "Ítems de lotes esperando un hilo")
+CIRCUITO_ABIERTO = REGISTRO.medidor("modelo_circuito_abierto", "1 si el circuit breaker del modelo no está cerrado")
+
+
+@app.route("/metrics", methods=["GET"])
+def exponer_metricas():
+    """Exposición en formato de texto de Prometheus"""
+    # Los medidores de estado se leen en el momento del scrape
+    cola = COLA_TRABAJOS.estadisticas()
+    TRABAJOS_PENDIENTES.fijar(cola["profundidad"], estado="pendiente")
+    TRABAJOS_PENDIENTES.fijar(cola["en_proceso"], estado="en_proceso")
+    LOTES_PENDIENTES.fijar(PLANIFICADOR_LOTES.pendientes())
+    CIRCUITO_ABIERTO.fijar(0 if CLIENTE_MODELO.interruptor.estado == "cerrado" else 1)
+    return Response(REGISTRO.exponer(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+def analizar_encadenado(full_prompt):
+    """Modo original: análisis y procedimiento en dos turnos del mismo chat"""
+    chat = MODEL.start_chat(history=[])
+
+    # 🔹 Solicita la respuesta organizada en secciones separadas
+    analisis_response = chat.send_message(
+        prompt_analisis(full_prompt),
+        generation_config=CONFIG_ANALISIS,
+        cache=politica_cache("chat"),
+        tipo="analisis"
+    )
+
+    # 🔹 Procedimiento general basado en el mismo caso
+    procedimiento_response = chat.send_message(
+        PROCEDIMIENTO_PROMPT,
+        generation_config=CONFIG_ANALISIS,
+        cache=politica_cache("chat"),
+        tipo="procedimiento"
+    )
+
+    # 🔹 Combinar respuestas con secciones separadas
+    respuesta_completa = (
+        PROCEDIMIENTO_ENCABEZADO +
+        procedimiento_response.text.strip() +
+        "<br><br><hr><br>" +
+        analisis_response.text.strip()
+    )
+
+    uso = sumar_uso(analisis_response, procedimiento_response)
+    return markdown_to_html(respuesta_completa), uso
+
+
+def analizar_estructurado(full_prompt):
+    """Una sola llamada con salida JSON que trae las cinco secciones; se renderiza igual que el modo encadenado"""
+    response = MODEL.generate_content(
+        prompt_estructurado(full_prompt),
+        generation_config=CONFIG_ESTRUCTURADO,
+        cache=politica_cache("chat"),
+        tipo="estructurado"
+    )
+    secciones = json.loads(response.text)
+    faltantes = [clave for clave, _ in SECCIONES_ESTRUCTURADAS if not str(secciones.get(clave, "")).strip()]
+    if faltantes:
+        raise ValueError(f"Respuesta estructurada incompleta: faltan {faltantes}")
+
+    analisis = "\n\n".join(
+        f"{titulo}\n{str(secciones[clave]).strip()}" for clave, titulo in SECCIONES_ESTRUCTURADAS[1:]
+    )
+    respuesta_completa = (
+        PROCEDIMIENTO_ENCABEZADO +
+        str(secciones["procedimiento"]).strip() +
+        "<br><br><hr><br>" +
+        analisis
+    )
+    return markdown_to_html(respuesta_completa), sumar_uso(response)
+
+
+def procesar_chat(full_prompt, forzar=False):
+    """Lógica de /chat sin Flask: devuelve (payload, código HTTP); forzar evita reutilizar un caso similar"""
     if not full_prompt:
-        return jsonify({"error": "Por favor, ingrese un caso de estudio o suba una imagen válida."}), 400
+        return {"error": "Por favor, ingrese un caso de estudio o suba una imagen válida."}, 400
+
+    intencion = clasificar(full_prompt, MIN_PALABRAS_CASO, MAX_PALABRAS_PREGUNTA)
+    INTENCIONES_CHAT.inc(intencion=intencion)
+    respuesta = responder_intencion(intencion, full_prompt)
+    if respuesta is not None:
+        return respuesta
 
     # Si pide un caso real
-    if pide_caso_estudio_real(full_prompt):
-        caso_prompt = (
-            "Proporcióname un caso de estudio real y diferente de una empresa conocida que haya implementado la norma ISO 9001.\n"
-            "Cada vez que se te solicite, elige una empresa distinta que opere en un país y sector diferentes. Describe el nombre de la empresa, el sector en el que opera, los problemas que enfrentaba antes de certificarse, los cambios que aplicó para cumplir con la norma y los beneficios obtenidos luego de su certificación."
-        )
+    if intencion == "caso_real":
         try:
             response = MODEL.generate_content(
-                contents=[{"role": "user", "parts": [f"Eres un experto en certificaciones ISO 9001.\n\n{caso_prompt}"]}],
+                contents=CASO_REAL_CONTENIDO,
                 generation_config={
                     "temperature": 0.7,
                     "max_output_tokens": 800
-                }
+                },
+                cache=politica_cache("caso_real"),
+                tipo="caso_real"
             )
-            return jsonify({"respuesta": response.text.strip()})
+            return {"respuesta": response.text.strip(), "intencion": intencion}, 200
         except Exception as e:
             print(f"❌ Error generando caso de estudio: {str(e)}")
-            return jsonify({"error": "No se pudo generar el caso de estudio."}), 500
+            return {"error": "No se pudo generar el caso de estudio."}, 500
 
+    similar = None if forzar else buscar_analisis_similar("chat", full_prompt)
+    if similar:
+        respuesta_html, similitud = similar
+        return {"respuesta": respuesta_html, "analisis_reutilizado": {"similitud": similitud}}, 200
+
+    modo = elegir_modo_chat()
+    if modo == "estructurado":
+        inicio = time.monotonic()
+        try:
+            respuesta_html, uso = analizar_estructurado(full_prompt)
+            registrar_ab("estructurado", time.monotonic() - inicio, uso)
+            recordar_analisis("chat", full_prompt, respuesta_html)
+            return {"respuesta": respuesta_html}, 200
+        except Exception as e:
+            # Si el modelo no respeta el esquema se cae al modo de dos turnos
+            print(f"❌ Modo estructurado falló, se usa el encadenado: {str(e)}")
+            registrar_ab("estructurado", time.monotonic() - inicio, None, error=True)
+
+    inicio = time.monotonic()
     try:
-        chat = MODEL.start_chat(history=[])
-
-        # 🔹 Solicita la respuesta organizada en secciones separadas
-        analisis_prompt = (
-            "Eres un auditor experto en la norma ISO 9001.\n\n"
-            "Analiza el siguiente caso de estudio de forma estructurada. No respondas de forma general. Todo debe estar enfocado exclusivamente en el caso proporcionado.\n"
-            "Estructura la respuesta en las siguientes secciones claramente separadas:\n\n"
-            "<strong>🧭 Procedimiento Aplicado:</strong>\n"
-            "Describe los procedimientos reales auditados según el caso.\n\n"
-            "<strong>🔬 Evidencia Recolectada:</strong>\n"
-            "Describe qué evidencias se observaron o recopilaron (registros, entrevistas, documentos específicos del caso).\n\n"
-            "<strong>🧠 Hallazgos Identificados:</strong>\n"
-            "Indica no conformidades, fortalezas o debilidades encontradas, citando las cláusulas ISO 9001 aplicables.\n\n"
-            "<strong>🚀 Mejoras o Recomendaciones:</strong>\n"
-            "Redacta acciones específicas de mejora basadas solo en este caso.\n\n"
-            f"Caso de estudio:\n{full_prompt}"
-        )
+        respuesta_html, uso = analizar_encadenado(full_prompt)
+        registrar_ab("encadenado", time.monotonic() - inicio, uso)
+        recordar_analisis("chat", full_prompt, respuesta_html)
+        return {"respuesta": respuesta_html}, 200
 
-        analisis_response = chat.send_message(
-            analisis_prompt,
-            generation_config={
-                "temperature": 0.7,
-                "max_output_tokens": 2048
+    except Exception as e:
+        print(f"❌ Error al procesar la solicitud: {str(e)}")
+        registrar_ab("encadenado", time.monotonic() - inicio, None, error=True)
+        return {"error": "Error al comunicarse con el modelo."}, 500
+
+
+def procesar_chat_en_sesion(full_prompt, id_sesion=None, forzar=False):
+    """procesar_chat y, si hay sesión, deja el caso y el análisis guardados en ella"""
+    respuesta, estado = procesar_chat(full_prompt, forzar)
+    # Solo un análisis fija el caso de la sesión; saludos, preguntas y casos reales no
+    if id_sesion and estado == 200 and "intencion" not in respuesta:
+        respuesta.update(registrar_analisis_en_sesion(id_sesion, full_prompt, respuesta["respuesta"]))
+    return respuesta, estado
+
+
+@app.route("/chat/ab", methods=["GET"])
+def estadisticas_ab_chat():
+    """Latencia media y tokens por solicitud de cada modo de /chat"""
+    with _AB_LOCK:
+        resumen = {"modo_configurado": MODO_CHAT}
+        for modo, datos in ESTADISTICAS_AB.items():
+            exitosas = datos["solicitudes"] - datos["errores"]
+            resumen[modo] = {
+                **datos,
+                "latencia_media": round(datos["segundos"] / exitosas, 3) if exitosas else None,
+                "tokens_entrada_medios": round(datos["tokens_entrada"] / datos["con_uso"], 1) if datos["con_uso"] else None,
+                "tokens_salida_medios": round(datos["tokens_salida"] / datos["con_uso"], 1) if datos["con_uso"] else None,
             }
-        )
+    return jsonify(resumen)
 
-        # 🔹 Procedimiento general basado en el mismo caso
-        procedimiento_prompt = (
-            "En base al caso de estudio anterior, redacta los pasos detallados que un auditor ISO 9001 seguiría para realizar una auditoría específica a este caso. "
-            "Incluye las fases reales aplicables:\n"
-            "- Planificación\n- Revisión documental\n- Listas de verificación\n- Entrevistas y observaciones\n"
-            "- Revisión de registros\n- Elaboración del informe y acciones de seguimiento.\n"
-            "Evita explicaciones generales. Todo debe enfocarse en el contexto del caso."
-        )
 
-        procedimiento_response = chat.send_message(
-            procedimiento_prompt,
-            generation_config={
-                "temperature": 0.7,
-                "max_output_tokens": 2048
-            }
-        )
+@app.route("/chat", methods=["POST"])
+def chat():
+    data = request.get_json()
+    user_input = data.get("message", "").strip()
+    image_data = data.get("image_data")
+    extracted_text = ""
 
-        # 🔹 Combinar respuestas con secciones separadas
-        respuesta_completa = (
-            "<strong>🧭 Procedimiento General de Auditoría aplicado al caso:</strong><br><br>" +
-            procedimiento_response.text.strip() +
-            "<br><br><hr><br>" +
-            analisis_response.text.strip()
-        )
+    if image_data:
+        pass  # Aquí podrías manejar una imagen en base64
 
-        respuesta_html = markdown_to_html(respuesta_completa)
-        return jsonify({"respuesta": respuesta_html})
+    full_prompt = f"{user_input}\n{extracted_text}".strip()
+    forzar = es_verdadero(data.get("forzar", ""))
+    id_sesion, error = leer_sesion(data)
+    if error:
+        return error
+    if pide_asincrono(data) and full_prompt:
+        return encolar_trabajo("chat", {"full_prompt": full_prompt, "session_id": id_sesion, "forzar": forzar}, data)
+
+    respuesta, estado = procesar_chat_en_sesion(full_prompt, id_sesion, forzar)
+    return jsonify(respuesta), estado
 
+
+@app.route("/chat/seguimiento", methods=["POST"])
+def chat_seguimiento():
+    """Pregunta sobre el caso de una sesión: solo viaja la pregunta, el contexto sale del servidor"""
+    data = request.get_json()
+    id_sesion = data.get("session_id")
+    pregunta = str(data.get("message", "")).strip()
+    if not pregunta:
+        return jsonify({"error": "Por favor, ingrese una pregunta."}), 400
+
+    historial = historial_sesion(id_sesion)
+    if historial is None:
+        return jsonify({"error": "Sesión no encontrada o vencida."}), 404
+
+    try:
+        chat = MODEL.start_chat(history=historial)
+        response = chat.send_message(
+            pregunta,
+            generation_config=CONFIG_SEGUIMIENTO,
+            cache=politica_cache("seguimiento"),
+            tipo="seguimiento"
+        )
+        texto = response.text.strip()
+        respuesta_html = markdown_to_html(texto)
+        id_respuesta = SESIONES.agregar_turno(id_sesion, pregunta, respuesta_html, texto)
+        # El resumen de los turnos viejos se arma fuera de la solicitud
+        EJECUTOR_ETAPAS.submit(con_contexto(compactar_sesion), id_sesion)
+        return jsonify({"respuesta": respuesta_html, "session_id": id_sesion, "respuesta_id": id_respuesta})
     except Exception as e:
-        print(f"❌ Error al procesar la solicitud: {str(e)}")
+        print(f"❌ Error en pregunta de seguimiento: {str(e)}")
         return jsonify({"error": "Error al comunicarse con el modelo."}), 500
 
 
+@app.route("/chat/batch", methods=["POST"])
+def chat_batch():
+    """Analiza varios casos en una sola solicitud; acepta textos o objetos con "message" """
+    casos, error = leer_casos_lote(request.get_json())
+    if error:
+        return jsonify({"error": error}), 400
+
+    argumentos = []
+    for caso in casos:
+        texto = caso.get("message", "") if isinstance(caso, dict) else caso
+        argumentos.append((str(texto or "").strip(),))
+    return jsonify(ejecutar_lote(procesar_chat, argumentos))
+
+
+def procesar_pdf(ruta, huella, forzar=False, id_sesion=None):
+    """Lógica de /analizar_pdf sobre un PDF ya guardado en disco: devuelve (payload, código HTTP)"""
+    try:
+        entrada = leer_pdf_guardado(ruta, huella, forzar)
+        texto_pdf = entrada["texto_extraido"]
+
+        if not texto_pdf:
+            return {"error": "No se pudo extraer texto del PDF."}, 400
+
+        previo = analisis_pdf_previo(huella, entrada, forzar)
+        similitud = None
+        if previo:
+            respuesta_html, similitud = previo
+            # La sesión guarda el caso tal como lo vio el modelo; las notas por parte salen del cache
+            caso = preparar_caso_pdf(texto_pdf) if id_sesion else None
+        else:
+            caso = preparar_caso_pdf(texto_pdf)
+            chat = MODEL.start_chat(history=[])
+
+            analisis_response = chat.send_message(
+                prompt_analisis(caso),
+                generation_config=CONFIG_ANALISIS,
+                cache=politica_cache("analizar_pdf"),
+                tipo="analisis_pdf"
+            )
+
+            respuesta_html = markdown_to_html(analisis_response.text.strip())
+            guardar_analisis_pdf_nuevo(huella, texto_pdf, respuesta_html)
+
+        respuesta = {
+            "texto_extraido": texto_pdf,
+            "respuesta": respuesta_html
+        }
+        if similitud is not None:
+            respuesta["analisis_reutilizado"] = {"similitud": similitud}
+        respuesta.update(registrar_analisis_en_sesion(id_sesion, caso, respuesta_html, texto_pdf))
+        return respuesta, 200
+
+    except PDFRechazado as e:
+        return {"error": str(e)}, 413
+    except Exception as e:
+        print(f"❌ Error procesando PDF: {str(e)}")
+        return {"error": "Error procesando el PDF."}, 500
 
-    
 
 @app.route("/analizar_pdf", methods=["POST"])
 def analizar_pdf():
+    if 'pdf' not in request.files:
+        return jsonify({"error": "No se proporcionó un archivo PDF."}), 400
+
+    file = request.files['pdf']
+    if not file.filename.endswith('.pdf'):
+        return jsonify({"error": "El archivo debe ser un PDF."}), 400
+
+    forzar = es_verdadero(request.values.get("forzar", ""))
+    id_sesion, error = leer_sesion(request.values)
+    if error:
+        return error
+    asincrono = pide_asincrono()
     try:
-        if 'pdf' not in request.files:
-            return jsonify({"error": "No se proporcionó un archivo PDF."}), 400
-        
-        file = request.files['pdf']
-        if not file.filename.endswith('.pdf'):
-            return jsonify({"error": "El archivo debe ser un PDF."}), 400
-
-        doc = fitz.open(stream=file.read(), filetype="pdf")
-        texto_pdf = ""
-        for page in doc:
-            texto_pdf += page.get_text()
-
-        if not texto_pdf.strip():
-            return jsonify({"error": "No se pudo extraer texto del PDF."}), 400
-
-        chat = MODEL.start_chat(history=[])
-
-        analisis_prompt = (
-            "Eres un auditor experto en la norma ISO 9001.\n\n"
-            "Analiza el siguiente caso de estudio de forma estructurada. No respondas de forma general. Todo debe estar enfocado exclusivamente en el caso proporcionado.\n"
-            "Estructura la respuesta en las siguientes secciones claramente separadas:\n\n"
-            "<strong>🧭 Procedimiento Aplicado:</strong>\n"
-            "Describe los procedimientos reales auditados según el caso.\n\n"
-            "<strong>🔬 Evidencia Recolectada:</strong>\n"
-            "Describe qué evidencias se observaron o recopilaron (registros, entrevistas, documentos específicos del caso).\n\n"
-            "<strong>🧠 Hallazgos Identificados:</strong>\n"
-            "Indica no conformidades, fortalezas o debilidades encontradas, citando las cláusulas ISO 9001 aplicables.\n\n"
-            "<strong>🚀 Mejoras o Recomendaciones:</strong>\n"
-            "Redacta acciones específicas de mejora basadas solo en este caso.\n\n"
-            f"Caso de estudio:\n{texto_pdf.strip()}"
-        )
+        ruta, huella = guardar_temporal(file, MAX_BYTES_PDF, DIRECTORIO_TRABAJOS if asincrono else None)
+    except PDFRechazado as e:
+        return jsonify({"error": str(e)}), 413
+    except Exception as e:
+        print(f"❌ Error procesando PDF: {str(e)}")
+        return jsonify({"error": "Error procesando el PDF."}), 500
 
-        analisis_response = chat.send_message(
-            analisis_prompt,
-            generation_config={
-                "temperature": 0.7,
-                "max_output_tokens": 2048
-            }
+    if asincrono:
+        respuesta, estado = encolar_trabajo(
+            "analizar_pdf", {"ruta": ruta, "huella": huella, "forzar": forzar, "session_id": id_sesion}
         )
+        if estado != 202:
+            os.remove(ruta)
+        return respuesta, estado
 
-        respuesta_html = markdown_to_html(analisis_response.text.strip())
-        return jsonify({
-            "texto_extraido": texto_pdf.strip(),
-            "respuesta": respuesta_html
-        })
+    try:
+        respuesta, estado = procesar_pdf(ruta, huella, forzar, id_sesion)
+    finally:
+        os.remove(ruta)
+    return jsonify(respuesta), estado
+
+
+@app.route("/chat/stream", methods=["POST"])
+def chat_stream():
+    """Igual que /chat pero emite el HTML por SSE a medida que llegan los tokens.
+
+    El análisis se transmite antes que el procedimiento, al revés que en el
+    HTML de /chat, porque el procedimiento se pide en el mismo chat y se apoya
+    en el análisis; cada fragmento dice su sección para que el cliente los
+    ubique. Lo que queda guardado (sesión, casos similares) y un análisis
+    reutilizado, que llega en un solo fragmento "respuesta", sí siguen el
+    orden de /chat. El evento "fin" trae los mismos campos extra que /chat.
+    """
+    data = request.get_json()
+    full_prompt = data.get("message", "").strip()
+
+    if not full_prompt:
+        return jsonify({"error": "Por favor, ingrese un caso de estudio o suba una imagen válida."}), 400
+
+    forzar = es_verdadero(data.get("forzar", ""))
+    id_sesion, error = leer_sesion(data)
+    if error:
+        return error
+
+    intencion = clasificar(full_prompt, MIN_PALABRAS_CASO, MAX_PALABRAS_PREGUNTA)
+    INTENCIONES_CHAT.inc(intencion=intencion)
+
+    def generar():
+        try:
+            respuesta = responder_intencion(intencion, full_prompt)
+            if respuesta is not None:
+                payload, _ = respuesta
+                if "error" in payload:
+                    yield evento_sse("error", payload)
+                else:
+                    yield evento_sse("fragmento", {"seccion": "respuesta", "html": payload["respuesta"]})
+                    yield evento_sse("fin", {"intencion": intencion})
+                return
+
+            if intencion == "caso_real":
+                fragmentos = MODEL.generate_content(
+                    contents=CASO_REAL_CONTENIDO,
+                    generation_config={"temperature": 0.7, "max_output_tokens": 800},
+                    cache=politica_cache("caso_real"),
+                    tipo="caso_real",
+                    stream=True
+                )
+                for fragmento in fragmentos:
+                    yield evento_sse("fragmento", {"seccion": "respuesta", "texto": texto_fragmento(fragmento)})
+                yield evento_sse("fin", {})
+                return
+
+            similar = None if forzar else buscar_analisis_similar("chat", full_prompt)
+            if similar:
+                respuesta_html, similitud = similar
+                yield evento_sse("fragmento", {"seccion": "respuesta", "html": respuesta_html})
+                extra = {"analisis_reutilizado": {"similitud": similitud}}
+                extra.update(registrar_analisis_en_sesion(id_sesion, full_prompt, respuesta_html))
+                yield evento_sse("fin", extra)
+                return
+
+            chat = MODEL.start_chat(history=[])
+            analisis, procedimiento = [], []
+            yield from transmitir_html(
+                chat.send_message(prompt_analisis(full_prompt), generation_config=CONFIG_ANALISIS,
+                                  cache=politica_cache("chat"), tipo="analisis", stream=True),
+                "analisis",
+                analisis
+            )
+            yield from transmitir_html(
+                chat.send_message(PROCEDIMIENTO_PROMPT, generation_config=CONFIG_ANALISIS,
+                                  cache=politica_cache("chat"), tipo="procedimiento", stream=True),
+                "procedimiento",
+                procedimiento,
+                prefijo=PROCEDIMIENTO_ENCABEZADO
+            )
+            # Guardado igual que el HTML de /chat (analizar_encadenado)
+            respuesta_html = markdown_to_html(
+                PROCEDIMIENTO_ENCABEZADO + "".join(procedimiento).strip() + "<br><br><hr><br>" + "".join(analisis).strip()
+            )
+            recordar_analisis("chat", full_prompt, respuesta_html)
+            yield evento_sse("fin", registrar_analisis_en_sesion(id_sesion, full_prompt, respuesta_html))
+        except Exception as e:
+            print(f"❌ Error en streaming de chat: {str(e)}")
+            yield evento_sse("error", {"error": "Error al comunicarse con el modelo."})
 
+    return respuesta_sse(generar())
+
+
+@app.route("/analizar_pdf/stream", methods=["POST"])
+def analizar_pdf_stream():
+    """Igual que /analizar_pdf pero emite el análisis por SSE; el evento "fin" trae los campos extra de /analizar_pdf"""
+    if 'pdf' not in request.files:
+        return jsonify({"error": "No se proporcionó un archivo PDF."}), 400
+
+    file = request.files['pdf']
+    if not file.filename.endswith('.pdf'):
+        return jsonify({"error": "El archivo debe ser un PDF."}), 400
+
+    forzar = es_verdadero(request.values.get("forzar", ""))
+    id_sesion, error = leer_sesion(request.values)
+    if error:
+        return error
+    try:
+        huella, entrada = leer_pdf_subido(file, forzar)
+        texto_pdf = entrada["texto_extraido"]
+    except PDFRechazado as e:
+        return jsonify({"error": str(e)}), 413
     except Exception as e:
         print(f"❌ Error procesando PDF: {str(e)}")
         return jsonify({"error": "Error procesando el PDF."}), 500
 
+    if not texto_pdf:
+        return jsonify({"error": "No se pudo extraer texto del PDF."}), 400
 
+    def generar():
+        try:
+            yield evento_sse("texto_extraido", {"texto_extraido": texto_pdf})
+            previo = analisis_pdf_previo(huella, entrada, forzar)
+            extra = {}
+            if previo:
+                respuesta_html, similitud = previo
+                yield evento_sse("fragmento", {"seccion": "analisis", "html": respuesta_html})
+                if similitud is not None:
+                    extra["analisis_reutilizado"] = {"similitud": similitud}
+                caso = preparar_caso_pdf(texto_pdf) if id_sesion else None
+            else:
+                caso = preparar_caso_pdf(texto_pdf)
+                chat = MODEL.start_chat(history=[])
+                textos = []
+                yield from transmitir_html(
+                    chat.send_message(prompt_analisis(caso), generation_config=CONFIG_ANALISIS,
+                                      cache=politica_cache("analizar_pdf"), tipo="analisis_pdf", stream=True),
+                    "analisis",
+                    textos
+                )
+                respuesta_html = markdown_to_html("".join(textos).strip())
+                guardar_analisis_pdf_nuevo(huella, texto_pdf, respuesta_html)
+            extra.update(registrar_analisis_en_sesion(id_sesion, caso, respuesta_html, texto_pdf))
+            yield evento_sse("fin", extra)
+        except Exception as e:
+            print(f"❌ Error en streaming de PDF: {str(e)}")
+            yield evento_sse("error", {"error": "Error procesando el PDF."})
 
-@app.route("/compare", methods=["POST"])
-def compare():
-    data = request.get_json()
-    chatbot_response = data.get("chatbot_response", "")
-    user_analysis = data.get("user_analysis", "")
+    return respuesta_sse(generar())
 
+
+
+def procesar_comparacion(chatbot_response, user_analysis):
+    """Lógica de /compare sin Flask: devuelve (payload, código HTTP)"""
     prompt_comparacion = f"""
     Eres un auditor experto en la norma ISO 9001.
 
@@ -323,21 +1325,29 @@ def compare():
     {user_analysis}
     """
 
-    try:
-        comparacion = MODEL.generate_content(
+    def etapa_comparacion():
+        return generar_texto(
             f"Eres un auditor experto en ISO 9001.\n\n{prompt_comparacion}",
-            generation_config={"temperature": 0.5, "max_output_tokens": 1000}
-        ).text.strip()
+            {"temperature": 0.5, "max_output_tokens": 1000},
+            cache=politica_cache("compare"),
+            tipo="comparacion"
+        )
 
-        efectividad = MODEL.generate_content(
+    def etapa_efectividad():
+        return generar_texto(
             f"Eres un evaluador que responde solo con un número del 0 al 100.\n\n{prompt_porcentaje}",
-            generation_config={"temperature": 0, "max_output_tokens": 10}
-        ).text.strip()
+            {"temperature": 0, "max_output_tokens": 10},
+            cache=politica_cache("compare"),
+            tipo="efectividad"
+        )
 
-        riesgo_response = MODEL.generate_content(
+    def etapa_riesgo():
+        riesgo_response = generar_texto(
             "Eres un experto en evaluación de riesgos ISO 9001. Devuelve dos números enteros entre 1 y 5 separados por coma.\n\n" + prompt_riesgo,
-            generation_config={"temperature": 0, "max_output_tokens": 10}
-        ).text.strip()
+            {"temperature": 0, "max_output_tokens": 10},
+            cache=politica_cache("compare"),
+            tipo="riesgo"
+        )
 
         riesgo_valores = riesgo_response.split(',')
         if len(riesgo_valores) != 2:
@@ -345,90 +1355,239 @@ def compare():
 
         impacto = int(riesgo_valores[0].strip())
         probabilidad = int(riesgo_valores[1].strip())
-        riesgo = impacto * probabilidad
-        nivel = "Alto" if riesgo >= 12 else "Medio" if riesgo >= 6 else "Bajo"
+        import riesgo as matriz_riesgo
+
+        return matriz_riesgo.evaluar(impacto, probabilidad)
 
+    def etapa_explicacion_efectividad(efectividad):
         prompt_explicacion_efectividad = f"""
         Eres un auditor experto en ISO 9001. Acabas de calificar con {efectividad} la efectividad del análisis del usuario comparado con el del chatbot.
 
         Escribe una explicación clara y profesional del porqué se asignó ese porcentaje. No repitas literalmente la comparación. Enfócate en hacer que el usuario comprenda el valor del puntaje recibido.
         """
 
-        explicacion_efectividad = MODEL.generate_content(
+        return generar_texto(
             prompt_explicacion_efectividad,
-            generation_config={"temperature": 0.5, "max_output_tokens": 800}
-        ).text.strip()
+            {"temperature": 0.5, "max_output_tokens": 800},
+            cache=politica_cache("compare"),
+            tipo="explicacion_efectividad"
+        )
 
+    def etapa_explicacion_riesgo(evaluacion):
         prompt_explicacion_riesgo = f"""
         Eres un experto en gestión de riesgos según ISO 9001.
 
         Acabas de calcular un nivel de riesgo basado en:
-        - Impacto: {impacto}
-        - Probabilidad: {probabilidad}
-        - Riesgo total: {riesgo}
-        - Nivel: {nivel}
+        - Impacto: {evaluacion["impacto"]}
+        - Probabilidad: {evaluacion["probabilidad"]}
+        - Riesgo total: {evaluacion["riesgo"]}
+        - Nivel: {evaluacion["nivel"]}
 
         Genera una explicación en lenguaje claro y profesional sobre lo que significa ese nivel de riesgo en el contexto de auditoría.
         """
 
-        explicacion_riesgo = MODEL.generate_content(
+        return generar_texto(
             prompt_explicacion_riesgo,
-            generation_config={"temperature": 0.5, "max_output_tokens": 800}
-        ).text.strip()
-
-        return jsonify({
-            "comparacion_ia": markdown_to_html(comparacion),
-            "efectividad": efectividad,
-            "impacto": impacto,
-            "probabilidad": probabilidad,
-            "riesgo": riesgo,
-            "nivel": nivel,
-            "explicacion_efectividad": explicacion_efectividad,
-            "explicacion_riesgo": explicacion_riesgo
-        })
+            {"temperature": 0.5, "max_output_tokens": 800},
+            cache=politica_cache("compare"),
+            tipo="explicacion_riesgo"
+        )
 
+    # 🔹 Las tres evaluaciones independientes salen en paralelo; cada explicación
+    # arranca en cuanto su entrada está lista.
+    try:
+        futuros = {
+            "comparacion": EJECUTOR_ETAPAS.submit(con_contexto(etapa_comparacion)),
+            "efectividad": EJECUTOR_ETAPAS.submit(con_contexto(etapa_efectividad)),
+            "riesgo": EJECUTOR_ETAPAS.submit(con_contexto(etapa_riesgo)),
+        }
+        futuros["explicacion_efectividad"] = encadenar(futuros["efectividad"], etapa_explicacion_efectividad)
+        futuros["explicacion_riesgo"] = encadenar(futuros["riesgo"], etapa_explicacion_riesgo)
     except Exception as e:
         print(f"❌ Error en evaluación comparativa: {str(e)}")
-        return jsonify({"error": "Error en evaluación comparativa"}), 500
+        return {"error": "Error en evaluación comparativa"}, 500
+
+    inicio = time.monotonic()
+    limites = {
+        "comparacion": inicio + TIMEOUT_ETAPA,
+        "efectividad": inicio + TIMEOUT_ETAPA,
+        "riesgo": inicio + TIMEOUT_ETAPA,
+        "explicacion_efectividad": inicio + 2 * TIMEOUT_ETAPA,
+        "explicacion_riesgo": inicio + 2 * TIMEOUT_ETAPA,
+    }
+    resultados, errores = esperar_etapas(futuros, limites)
+
+    if not resultados:
+        print(f"❌ Error en evaluación comparativa: {errores}")
+        return {"error": "Error en evaluación comparativa"}, 500
+
+    if errores:
+        print(f"❌ Etapas fallidas en evaluación comparativa: {errores}")
+
+    evaluacion = resultados.get("riesgo") or {}
+    comparacion = resultados.get("comparacion")
+    respuesta = {
+        "comparacion_ia": markdown_to_html(comparacion) if comparacion is not None else None,
+        "efectividad": resultados.get("efectividad"),
+        "impacto": evaluacion.get("impacto"),
+        "probabilidad": evaluacion.get("probabilidad"),
+        "riesgo": evaluacion.get("riesgo"),
+        "nivel": evaluacion.get("nivel"),
+        "explicacion_efectividad": resultados.get("explicacion_efectividad"),
+        "explicacion_riesgo": resultados.get("explicacion_riesgo")
+    }
+    if errores:
+        respuesta["errores"] = errores
+    return respuesta, 200
+
+
+def respuesta_chatbot(data):
+    """chatbot_response explícito o, con session_id, el artefacto respuesta_id (por defecto la última respuesta)"""
+    if data.get("chatbot_response") or not data.get("session_id"):
+        return data.get("chatbot_response", "")
+    return SESIONES.artefacto(data["session_id"], data.get("respuesta_id"))
 
 
+@app.route("/compare", methods=["POST"])
+def compare():
+    data = request.get_json()
+    chatbot_response = respuesta_chatbot(data)
+    if chatbot_response is None:
+        return jsonify({"error": "Sesión o respuesta no encontrada."}), 404
+    user_analysis = data.get("user_analysis", "")
+    if pide_asincrono(data):
+        return encolar_trabajo("compare", {"chatbot_response": chatbot_response, "user_analysis": user_analysis}, data)
 
+    respuesta, estado = procesar_comparacion(chatbot_response, user_analysis)
+    return jsonify(respuesta), estado
 
-@app.route("/descargar_pdf", methods=["POST"])
-def descargar_pdf():
-    try:
-        data = request.get_json()
 
-        caso = html_a_texto_plano(data.get("caso_estudio", "No proporcionado"))
-        respuesta_ia = html_a_texto_plano(data.get("respuesta_ia", "No disponible"))
-        respuesta_usuario = html_a_texto_plano(data.get("respuesta_usuario", "No disponible"))
-        comparacion = html_a_texto_plano(data.get("comparacion", "No realizada"))
+@app.route("/compare/batch", methods=["POST"])
+def compare_batch():
+    """Compara varios pares {chatbot_response, user_analysis} en una sola solicitud"""
+    casos, error = leer_casos_lote(request.get_json())
+    if error:
+        return jsonify({"error": error}), 400
+    if not all(isinstance(caso, dict) for caso in casos):
+        return jsonify({"error": "Cada caso debe incluir 'chatbot_response' y 'user_analysis'."}), 400
 
+    argumentos = [(respuesta_chatbot(caso), caso.get("user_analysis", "")) for caso in casos]
+    faltantes = [indice for indice, (chatbot_response, _) in enumerate(argumentos) if chatbot_response is None]
+    if faltantes:
+        return jsonify({"error": f"Sesión o respuesta no encontrada en los casos {faltantes}."}), 404
+    return jsonify(ejecutar_lote(procesar_comparacion, argumentos))
 
-        # Eliminar emojis y caracteres especiales no soportados por latin-1
-        def limpiar_texto_pdf(texto):
-            texto = re.sub(r'[^\x00-\xFF]', '', texto)  # Solo latin-1
-            texto = unidecode(texto)  # Transforma acentos y otros
-            return texto.strip()
 
-        pdf = FPDF()
-        pdf.add_page()
-        pdf.set_font("Arial", 'B', size=14)
-        pdf.cell(0, 10, "Informe de Auditoría ISO 9001", ln=True, align="C")
-        pdf.ln(10)
 
-        pdf.set_font("Arial", size=12)
-        pdf.multi_cell(0, 10, f"Caso de estudio:\n{limpiar_texto_pdf(caso)}\n", align="L")
-        pdf.multi_cell(0, 10, f"Respuesta del Chatbot:\n{limpiar_texto_pdf(respuesta_ia)}\n", align="L")
-        pdf.multi_cell(0, 10, f"Análisis del Usuario:\n{limpiar_texto_pdf(respuesta_usuario)}\n", align="L")
-        pdf.multi_cell(0, 10, f"Comparación IA:\n{limpiar_texto_pdf(comparacion)}\n", align="L")
 
-        buffer = io.BytesIO()
-        pdf_bytes = pdf.output(dest='S').encode('latin-1')
-        buffer.write(pdf_bytes)
-        buffer.seek(0)
+@app.route("/jobs/<id_trabajo>", methods=["GET"])
+def consultar_trabajo(id_trabajo):
+    trabajo = COLA_TRABAJOS.obtener(id_trabajo)
+    if trabajo is None:
+        return jsonify({"error": "Trabajo no encontrado."}), 404
+    return jsonify(trabajo)
 
-        return send_file(buffer, as_attachment=True, download_name="informe_auditoria.pdf", mimetype='application/pdf')
+
+@app.route("/sesiones/estadisticas", methods=["GET"])
+def estadisticas_sesiones():
+    return jsonify(SESIONES.estadisticas())
+
+
+@app.route("/sesiones/<id_sesion>", methods=["GET"])
+def consultar_sesion(id_sesion):
+    sesion = SESIONES.describir(id_sesion)
+    if sesion is None:
+        return jsonify({"error": "Sesión no encontrada o vencida."}), 404
+    return jsonify(sesion)
+
+
+@app.route("/sesiones/<id_sesion>/artefactos/<id_artefacto>", methods=["GET"])
+def consultar_artefacto(id_sesion, id_artefacto):
+    texto = SESIONES.artefacto(id_sesion, id_artefacto)
+    if texto is None:
+        return jsonify({"error": "Artefacto no encontrado."}), 404
+    return jsonify({"id": id_artefacto, "texto": texto})
+
+
+@app.route("/jobs", methods=["GET"])
+def estadisticas_trabajos():
+    return jsonify(COLA_TRABAJOS.estadisticas())
+
+
+COLA_TRABAJOS.registrar("chat", lambda payload: procesar_chat_en_sesion(
+    payload["full_prompt"], payload.get("session_id"), payload.get("forzar", False)
+))
+COLA_TRABAJOS.registrar("compare", lambda payload: procesar_comparacion(payload["chatbot_response"], payload["user_analysis"]))
+COLA_TRABAJOS.registrar("analizar_pdf", trabajo_analizar_pdf)
+# Con los manejadores ya registrados: lo que quedó pendiente antes de un reinicio se retoma sin esperar otro encolar
+if arrancar_al_importar("COLA_TRABAJOS_AL_INICIAR"):
+    COLA_TRABAJOS.iniciar()
+
+
+# Informes de /descargar_pdf: se renderizan en un pool de procesos con una cola
+# acotada y se guardan por hash de las cuatro secciones de entrada.
+CAMPOS_INFORME = (
+    ("caso_estudio", "No proporcionado"),
+    ("respuesta_ia", "No disponible"),
+    ("respuesta_usuario", "No disponible"),
+    ("comparacion", "No realizada"),
+)
+PROCESOS_INFORMES = int(os.getenv("PROCESOS_INFORMES", "2"))
+CUPOS_INFORMES = threading.BoundedSemaphore(PROCESOS_INFORMES + int(os.getenv("MAX_INFORMES_EN_COLA", "8")))
+TIMEOUT_INFORME = float(os.getenv("TIMEOUT_INFORME_SEGUNDOS", "30"))
+ALMACEN_INFORMES = AlmacenContenido(
+    os.path.join(DIRECTORIO_CACHE, "informes"),
+    int(os.getenv("CACHE_INFORMES_MAX_MB", "100")) * 1024 * 1024
+)
+_EJECUTOR_INFORMES = None
+_EJECUTOR_INFORMES_LOCK = threading.Lock()
+
+
+def ejecutor_informes():
+    """Pool de procesos para renderizar informes, creado con el primer informe"""
+    global _EJECUTOR_INFORMES
+    with _EJECUTOR_INFORMES_LOCK:
+        if _EJECUTOR_INFORMES is None:
+            _EJECUTOR_INFORMES = ProcessPoolExecutor(max_workers=PROCESOS_INFORMES, mp_context=CONTEXTO_PROCESOS)
+        return _EJECUTOR_INFORMES
+
+
+def guardar_informe(huella, pdf_bytes):
+    try:
+        ALMACEN_INFORMES.guardar(huella, pdf_bytes)
+    except OSError as e:
+        print(f"❌ No se pudo guardar el informe en cache: {str(e)}")
+
+
+@app.route("/descargar_pdf", methods=["POST"])
+def descargar_pdf():
+    try:
+        data = request.get_json()
+        campos = [data.get(campo, defecto) for campo, defecto in CAMPOS_INFORME]
+
+        huella = hashlib.sha256(json.dumps(campos, ensure_ascii=False).encode("utf-8")).hexdigest()
+        pdf_bytes = ALMACEN_INFORMES.obtener(huella)
+        CONSULTAS_CACHE.inc(tipo="informe_pdf", resultado="acierto" if pdf_bytes is not None else "fallo")
+        if pdf_bytes is None:
+            if not CUPOS_INFORMES.acquire(timeout=TIMEOUT_INFORME):
+                return jsonify({"error": "Hay demasiados informes en proceso, intenta de nuevo en unos segundos."}), 503
+            try:
+                futuro = ejecutor_informes().submit(renderizar_informe, *campos)
+            except Exception:
+                CUPOS_INFORMES.release()
+                raise
+            # El cupo se libera cuando el proceso termina, aunque esta solicitud ya no espere
+            futuro.add_done_callback(lambda _: CUPOS_INFORMES.release())
+            with medir("render_pdf"):
+                pdf_bytes = futuro.result(timeout=TIMEOUT_INFORME)
+            guardar_informe(huella, pdf_bytes)
+
+        # Los bytes van directo al cuerpo, sin copiarlos a un BytesIO
+        return Response(
+            pdf_bytes,
+            mimetype="application/pdf",
+            headers={"Content-Disposition": "attachment; filename=informe_auditoria.pdf"}
+        )
 
     except Exception as e:
         print(f"❌ Error generando PDF: {e}")
@@ -438,25 +1597,51 @@ def descargar_pdf():
 
 @app.route("/evaluar_riesgo", methods=["POST"])
 def evaluar_riesgo():
+    import riesgo as matriz_riesgo
+
     try:
         data = request.get_json()
         impacto = int(data.get("impacto", 0))
         probabilidad = int(data.get("probabilidad", 0))
-        riesgo = impacto * probabilidad
-        nivel = "Alto" if riesgo >= 12 else "Medio" if riesgo >= 6 else "Bajo"
-        return jsonify({"impacto": impacto, "probabilidad": probabilidad, "riesgo": riesgo, "nivel": nivel})
+        return jsonify(matriz_riesgo.evaluar(impacto, probabilidad))
     except Exception as e:
         print(f"❌ Error en cálculo de riesgo: {str(e)}")
         return jsonify({"error": "Error en cálculo de riesgo"}), 500
-    
-@app.route("/generar_caso", methods=["POST"])
-def generar_caso():
-    data = request.get_json()
-    pais = data.get("pais", "Ecuador")
-    sector = data.get("sector", "tecnología")
-    tipo_empresa = data.get("tipo_empresa", "privada")
-    tamano_empresa = data.get("tamano_empresa", "mediana")
 
+
+MAX_FILAS_RIESGO = int(os.getenv("MAX_FILAS_RIESGO", "1000000"))
+
+
+@app.route("/evaluar_riesgo/lote", methods=["POST"])
+def evaluar_riesgo_lote():
+    """Registro de riesgos completo: JSON con listas, CSV en el cuerpo (text/csv) o subido en "archivo".
+
+    Devuelve el mapa de calor 5x5, la distribución por nivel y percentiles del
+    riesgo; con detalle=1 agrega la evaluación de cada fila.
+    """
+    import riesgo as matriz_riesgo
+
+    try:
+        with medir("riesgo_lote"):
+            if request.mimetype == "text/csv":
+                impactos, probabilidades = matriz_riesgo.leer_csv(request.stream, MAX_FILAS_RIESGO)
+            elif "archivo" in request.files:
+                impactos, probabilidades = matriz_riesgo.leer_csv(request.files["archivo"].stream, MAX_FILAS_RIESGO)
+            else:
+                impactos, probabilidades = matriz_riesgo.leer_json(request.get_json(silent=True), MAX_FILAS_RIESGO)
+            cuerpo = request.get_json(silent=True)
+            detalle = request.args.get("detalle") or request.form.get("detalle") or (
+                cuerpo.get("detalle", "") if isinstance(cuerpo, dict) else ""
+            )
+            detalle = es_verdadero(detalle)
+            return jsonify(matriz_riesgo.agregar(impactos, probabilidades, detalle))
+    except matriz_riesgo.RegistroRechazado as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"❌ Error en cálculo de riesgo por lote: {str(e)}")
+        return jsonify({"error": "Error en cálculo de riesgo"}), 500
+    
+def generar_caso_html(pais, sector, tipo_empresa, tamano_empresa, cache=None):
     prompt = f"""
     Eres un experto en auditorías ISO 9001 y en generación de casos de estudio realistas para capacitación empresarial.
 
@@ -480,18 +1665,104 @@ def generar_caso():
 
     No incluyas acciones implementadas ni resultados obtenidos después de la certificación. No pongas las secciones 5 ni 6. Redacta el caso como un informe profesional, con estilo formal, en párrafos separados y con enfoque técnico. No uses viñetas ni numeraciones. Asegúrate de que todo esté vinculado al contexto específico de la empresa según los filtros proporcionados.
     """
+    chat = MODEL.start_chat(history=[])
+    response = chat.send_message(
+        "Eres un experto en ISO 9001.\n" + prompt,
+        generation_config={"temperature": 0.7, "max_output_tokens": 2000},
+        cache=cache,
+        tipo="caso"
+    )
+    return markdown_to_html(response.text.strip())
+
+
+# Casos pregenerados para las combinaciones de filtros más pedidas; cada caso
+# se entrega una sola vez y la generación del pool nunca pasa por el cache.
+FILTROS_CASO_POR_DEFECTO = ("Ecuador", "tecnología", "privada", "mediana")
+POOL_CASOS = PoolCasos(
+    lambda filtros: generar_caso_html(*filtros, cache=False),
+    por_combinacion=int(os.getenv("POOL_CASOS_POR_COMBINACION", "3")),
+    max_combinaciones=int(os.getenv("POOL_CASOS_COMBINACIONES", "8")),
+    ttl=float(os.getenv("POOL_CASOS_TTL_SEGUNDOS", str(24 * 3600))),
+    semillas=[FILTROS_CASO_POR_DEFECTO],
+    min_demanda=float(os.getenv("POOL_CASOS_MIN_DEMANDA", "2.5")),
+    vida_media=float(os.getenv("POOL_CASOS_VIDA_MEDIA_SEGUNDOS", "3600")),
+    max_demanda=int(os.getenv("POOL_CASOS_MAX_DEMANDA", "1000"))
+)
+
+
+@app.route("/generar_caso", methods=["POST"])
+def generar_caso():
+    data = request.get_json()
+    filtros = tuple(
+        str(data.get(campo) or defecto).strip()
+        for campo, defecto in zip(("pais", "sector", "tipo_empresa", "tamano_empresa"), FILTROS_CASO_POR_DEFECTO)
+    )
+
     try:
-        chat = MODEL.start_chat(history=[])
-        response = chat.send_message(
-            "Eres un experto en ISO 9001.\n" + prompt,
-            generation_config={"temperature": 0.7, "max_output_tokens": 2000}
-        )
-        html_formatted = markdown_to_html(response.text.strip())
-        return jsonify({"caso_estudio": html_formatted})
+        caso = POOL_CASOS.tomar(filtros)
+        if caso is None:
+            caso = generar_caso_html(*filtros, cache=politica_cache("generar_caso"))
+        return jsonify({"caso_estudio": caso})
     except Exception as e:
         print(f"❌ Error generando caso filtrado: {str(e)}")
         return jsonify({"error": "No se pudo generar el caso de estudio."}), 500
 
 
+@app.route("/generar_caso/pool", methods=["GET"])
+def estadisticas_pool_casos():
+    return jsonify(POOL_CASOS.estadisticas())
+
+
+# PyMuPDF, fpdf, NumPy y el cliente de Gemini se cargan con la primera solicitud
+# que los usa; el calentamiento los adelanta en segundo plano para que esa
+# solicitud no pague la carga. "/" responde sin esperar a nada.
+def calentar_pdf():
+    # En este proceso se abre el PDF para contar páginas; en el pool se extrae el texto
+    precargar_pdf()
+    ejecutor_pdf().submit(precargar_pdf).result()
+
+
+def calentar_similitud():
+    for tipo in ("chat", "pdf"):
+        indice_similitud(tipo)
+
+
+def calentar_riesgo():
+    import riesgo  # noqa: F401
+
+
+def calentar_informes():
+    ejecutor_informes().submit(renderizar_informe, "", "", "", "").result()
+
+
+TAREAS_CALENTAMIENTO = {
+    "modelo": getattr(BACKEND, "calentar", lambda: None),
+    "pdf": calentar_pdf,
+    "similitud": calentar_similitud,
+    "riesgo": calentar_riesgo,
+    "informes": calentar_informes,
+}
+SUBSISTEMAS_CALENTAMIENTO = [
+    nombre.strip() for nombre in os.getenv("CALENTAR_SUBSISTEMAS", ",".join(TAREAS_CALENTAMIENTO)).split(",")
+    if nombre.strip() in TAREAS_CALENTAMIENTO
+]
+# Los opcionales se precargan (y reintentan) pero no retienen /listo en 503 si fallan
+CALENTAMIENTO = Calentamiento(
+    {nombre: TAREAS_CALENTAMIENTO[nombre] for nombre in SUBSISTEMAS_CALENTAMIENTO},
+    opcionales=[nombre.strip() for nombre in os.getenv("CALENTAR_OPCIONALES", "informes").split(",") if nombre.strip()],
+    espera_maxima=float(os.getenv("CALENTAR_ESPERA_MAXIMA_SEGUNDOS", "300"))
+)
+if arrancar_al_importar("CALENTAR_AL_INICIAR"):
+    CALENTAMIENTO.iniciar()
+
+
+@app.route("/listo", methods=["GET"])
+def listo():
+    """Readiness: 200 cuando los subsistemas requeridos están listos, 503 mientras tanto (y arranca la carga)"""
+    CALENTAMIENTO.iniciar()
+    estado = CALENTAMIENTO.estado()
+    return jsonify(estado), 200 if estado["listo"] else 503
+
+
 if __name__ == "__main__":
     app.run(debug=True, host="0.0.0.0")
@@ -0,0 +1,127 @@
+"""Verifica markdown_to_html contra el corpus dorado y mide su rendimiento.
+
+Uso:
+    python bench/bench_markdown.py [--repeticiones 200] [--kb 16]
+
+Primero compara la salida de markdown_to_html y de MarkdownIncremental con
+los .html de bench/corpus_markdown (generados con la implementación original);
+si algo difiere termina con código 1. Luego mide el throughput sobre
+respuestas de varios KB contra la implementación anterior de tres re.sub.
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(DIRECTORIO))
+
+from markdown_html import MarkdownIncremental, markdown_to_html  # noqa: E402
+
+CORPUS = os.path.join(DIRECTORIO, "corpus_markdown")
+
+
+def markdown_to_html_anterior(text):
+    # Implementación previa, solo como referencia de rendimiento
+    text = re.sub(r'<[^>]+>', '', text)
+    text = re.sub(r'^### (.*?)$', r'<h3>\1</h3>', text, flags=re.MULTILINE)
+    text = re.sub(r'\*\*(.*?)\*\*', r'<strong>\1</strong>', text)
+    lines = text.split('\n')
+    html_lines = []
+    in_list = False
+    for line in lines:
+        if line.strip().startswith('*'):
+            if not in_list:
+                html_lines.append('<ul>')
+                in_list = True
+            html_lines.append(f"<li>{line.strip()[1:].strip()}</li>")
+        else:
+            if in_list:
+                html_lines.append('</ul>')
+                in_list = False
+            if line.strip():
+                html_lines.append(f"<p>{line.strip()}</p>")
+            else:
+                html_lines.append("<br>")
+    if in_list:
+        html_lines.append('</ul>')
+    return '\n'.join(html_lines)
+
+
+def leer(ruta):
+    with open(ruta, encoding="utf-8", newline="") as archivo:
+        return archivo.read()
+
+
+def cargar_corpus():
+    casos = []
+    for nombre in sorted(os.listdir(CORPUS)):
+        if nombre.endswith(".md"):
+            base = os.path.join(CORPUS, nombre[:-3])
+            casos.append((nombre[:-3], leer(base + ".md"), leer(base + ".html")))
+    return casos
+
+
+def convertir_por_fragmentos(texto, semilla):
+    azar = random.Random(semilla)
+    convertidor = MarkdownIncremental()
+    salida = []
+    i = 0
+    while i < len(texto):
+        j = i + azar.randint(1, 24)
+        salida.append(convertidor.alimentar(texto[i:j]))
+        i = j
+    salida.append(convertidor.cerrar())
+    return "".join(salida)
+
+
+def verificar(casos):
+    fallos = 0
+    for nombre, texto, esperado in casos:
+        if markdown_to_html(texto) != esperado:
+            print(f"❌ {nombre}: markdown_to_html difiere del corpus")
+            fallos += 1
+        esperado_stream = markdown_to_html(texto.strip())
+        for semilla in range(50):
+            if convertir_por_fragmentos(texto, semilla) != esperado_stream:
+                print(f"❌ {nombre}: MarkdownIncremental difiere (semilla {semilla})")
+                fallos += 1
+                break
+    return fallos
+
+
+def medir(funcion, texto, repeticiones):
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        funcion(texto)
+    return time.perf_counter() - inicio
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticiones", type=int, default=200)
+    parser.add_argument("--kb", type=int, default=16, help="tamaño aproximado de cada respuesta de prueba")
+    args = parser.parse_args()
+
+    casos = cargar_corpus()
+    fallos = verificar(casos)
+    if fallos:
+        sys.exit(1)
+    print(f"✅ Corpus dorado: {len(casos)} casos idénticos (completo y por fragmentos)")
+
+    for nombre, texto, _ in casos:
+        grande = (texto + "\n") * max(1, args.kb * 1024 // (len(texto) + 1))
+        mb = len(grande.encode("utf-8")) * args.repeticiones / (1024 * 1024)
+        anterior = medir(markdown_to_html_anterior, grande, args.repeticiones)
+        actual = medir(markdown_to_html, grande, args.repeticiones)
+        print(
+            f"{nombre:22s} {len(grande) / 1024:6.1f} KB  "
+            f"anterior {mb / anterior:7.1f} MB/s  actual {mb / actual:7.1f} MB/s  "
+            f"x{anterior / actual:.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Mide el índice de casos casi repetidos: latencia de consulta, aciertos y falsos positivos.
+
+Uso:
+    python bench/bench_similitud.py [--casos 100000] [--consultas 2000] [--umbral 0.85]
+
+Llena el índice con casos sintéticos de ~1.5 KB y consulta versiones con
+pequeñas ediciones (deberían encontrarse) y casos nuevos (no deberían).
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(DIRECTORIO))
+
+from similitud import IndiceSimilitud  # noqa: E402
+
+PALABRAS = (
+    "empresa calidad auditoría proceso cliente quejas producción registros indicadores "
+    "capacitación personal proveedores inventario entregas retrasos errores facturación "
+    "mantenimiento equipos documentación procedimientos gerencia revisión objetivos riesgos "
+    "no conformidad acciones correctivas mejora continua satisfacción pérdidas mensuales "
+    "Ecuador Colombia Perú textil alimentos software logística hospital mediana pequeña"
+).split()
+SILABAS = "ta re mo si lu ca pe no dri ven gal tor mi sa que plo fer an es in".split()
+
+
+def vocabulario(azar, cantidad=4000):
+    """Las palabras de dominio más nombres y términos inventados, para que los casos no se parezcan todos"""
+    inventadas = {"".join(azar.choice(SILABAS) for _ in range(azar.randint(2, 4))) for _ in range(cantidad)}
+    return PALABRAS + sorted(inventadas)
+
+
+def caso(azar, palabras=220):
+    return " ".join(azar.choice(VOCABULARIO) for _ in range(palabras)) + f" {azar.randint(10, 9999)} quejas."
+
+
+def editar(azar, texto, cambios=6):
+    palabras = texto.split()
+    for _ in range(cambios):
+        palabras[azar.randrange(len(palabras))] = azar.choice(VOCABULARIO)
+    return " ".join(palabras)
+
+
+VOCABULARIO = vocabulario(random.Random(3))
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(p / 100 * len(ordenados)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--casos", type=int, default=100_000)
+    parser.add_argument("--consultas", type=int, default=2000)
+    parser.add_argument("--umbral", type=float, default=0.85)
+    args = parser.parse_args()
+
+    azar = random.Random(7)
+    indice = IndiceSimilitud(capacidad=args.casos, umbral=args.umbral)
+    textos = []
+    inicio = time.perf_counter()
+    for numero in range(args.casos):
+        texto = caso(azar)
+        if numero < args.consultas:
+            textos.append(texto)
+        indice.agregar(texto, f"{numero:064x}")
+    carga = time.perf_counter() - inicio
+    print(f"Alta de {args.casos} casos: {carga:.1f} s ({carga / args.casos * 1e6:.0f} µs por caso)")
+
+    for nombre, consultas, esperado in (
+        ("editados", [editar(azar, texto) for texto in textos], True),
+        ("nuevos", [caso(azar) for _ in range(args.consultas)], False),
+    ):
+        tiempos, encontrados = [], 0
+        for texto in consultas:
+            inicio = time.perf_counter()
+            resultado = indice.buscar(texto)
+            tiempos.append(time.perf_counter() - inicio)
+            encontrados += resultado is not None
+        tasa = encontrados / len(consultas)
+        print(
+            f"{nombre:9s} p50 {percentil(tiempos, 50) * 1000:.3f} ms  p99 {percentil(tiempos, 99) * 1000:.3f} ms  "
+            f"{'aciertos' if esperado else 'falsos positivos'} {tasa:.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+"""Prueba de carga de las rutas principales con el modelo falso (sin red ni API key).
+
+Uso:
+    python bench/carga.py [--concurrencia 8] [--solicitudes 40] [--latencia 0.05]
+                          [--tokens-por-segundo 0] [--paginas 1,10,50]
+                          [--rutas chat,analizar_pdf,compare,descargar_pdf,generar_caso]
+                          [--salida bench/resultados/carga.json] [--comparar anterior.json]
+
+Cada ruta corre en un proceso nuevo que levanta app.py con
+MODELO_BACKEND=falso y un directorio de cache temporal, y la dispara con
+app.test_client() desde --concurrencia hilos. Así el RSS pico (ru_maxrss, que
+es el máximo de todo el proceso) es el de esa ruta y no el acumulado de las
+anteriores. Antes de medir se corren las tareas de calentamiento de la app
+(el calentamiento en segundo plano y la cola quedan apagados), como una
+réplica que ya pasó /listo. Por ruta escribe solicitudes/s, latencias
+p50/p95/p99, errores, RSS tras el import, segundos de calentamiento y RSS
+pico en un JSON; con --comparar imprime la variación contra un reporte anterior.
+
+El cache de respuestas (incluida la reutilización de casos similares) y el
+pool de casos quedan desactivados salvo que se pida --con-cache / --con-pool,
+para medir el camino completo de cada ruta.
+"""
+import argparse
+import io
+import json
+import math
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(DIRECTORIO))
+
+RUTAS = ("chat", "analizar_pdf", "compare", "descargar_pdf", "generar_caso")
+
+CASO = (
+    "La empresa Textiles Andinos S.A. registra 37 quejas mensuales por defectos de costura. "
+    "No existen registros de control de parámetros en las máquinas y los operarios no reciben "
+    "capacitación desde hace dos años. La gerencia no revisa indicadores de calidad."
+)
+
+RESPUESTA_CHATBOT = (
+    "### 🧠 Hallazgos Identificados\n"
+    "* **No conformidad (8.5.1):** no hay control de parámetros de producción.\n"
+    "* **No conformidad (7.2):** la competencia del personal no está asegurada.\n\n"
+    "### ✅ Recomendaciones\n"
+    "* Implementar registros de control por turno.\n"
+    "* Definir un plan anual de capacitación.\n"
+)
+
+ANALISIS_USUARIO = "Falta control de procesos y capacitación; recomiendo registros e indicadores mensuales."
+
+
+def configurar_entorno(args, directorio_cache):
+    """Variables que app.py lee al importarse; deben fijarse antes del import"""
+    os.environ["MODELO_BACKEND"] = "falso"
+    os.environ["FALSO_LATENCIA"] = str(args.latencia)
+    os.environ["FALSO_TOKENS_POR_SEGUNDO"] = str(args.tokens_por_segundo)
+    os.environ["FALSO_TASA_ERROR"] = str(args.tasa_error)
+    os.environ["DIRECTORIO_CACHE"] = directorio_cache
+    # Ni el calentamiento en segundo plano ni los hilos de la cola compiten con lo que se mide:
+    # medir_escenario calienta la app antes de la primera solicitud
+    os.environ["CALENTAR_AL_INICIAR"] = "0"
+    os.environ["COLA_TRABAJOS_AL_INICIAR"] = "0"
+    os.environ.setdefault("MODELO_SOLICITUDES_POR_SEGUNDO", "1000")
+    os.environ.setdefault("MODELO_MAX_CONCURRENCIA", str(max(8, args.concurrencia * 2)))
+    if not args.con_cache:
+        os.environ["CACHE_RUTAS_EXCLUIDAS"] = "chat,caso_real,analizar_pdf,compare,generar_caso"
+        os.environ["SIMILITUD_ACTIVA"] = "0"
+    if not args.con_pool:
+        os.environ["POOL_CASOS_POR_COMBINACION"] = "0"
+
+
+def generar_pdf(paginas):
+    import fitz
+
+    documento = fitz.open()
+    for numero in range(paginas):
+        pagina = documento.new_page()
+        texto = f"Página {numero + 1}. {CASO}\n" * 12
+        pagina.insert_textbox(fitz.Rect(50, 50, 550, 800), texto, fontsize=9)
+    contenido = documento.tobytes()
+    documento.close()
+    return contenido
+
+
+def nombres_escenarios(args):
+    nombres = []
+    for ruta in args.rutas:
+        if ruta == "analizar_pdf":
+            nombres.extend(f"analizar_pdf[{paginas}p]" for paginas in args.paginas)
+        else:
+            nombres.append(ruta)
+    return nombres
+
+
+def escenario(args, nombre):
+    """Función(cliente, indice) que hace una solicitud del escenario y devuelve el código HTTP"""
+    forzar = "0" if args.con_cache else "1"
+
+    def chat(cliente, indice):
+        # El índice evita que dos solicitudes compartan prompt
+        return cliente.post("/chat", json={"message": f"{CASO} Caso {indice}."}).status_code
+
+    def compare(cliente, indice):
+        return cliente.post("/compare", json={
+            "chatbot_response": RESPUESTA_CHATBOT,
+            "user_analysis": f"{ANALISIS_USUARIO} ({indice})",
+        }).status_code
+
+    def descargar_pdf(cliente, indice):
+        return cliente.post("/descargar_pdf", json={
+            "caso_estudio": f"<p>{CASO}</p>" * 4,
+            "respuesta_ia": RESPUESTA_CHATBOT.replace("\n", "<br>") * 4,
+            "respuesta_usuario": f"<p>{ANALISIS_USUARIO} {indice}</p>",
+            "comparacion": "<h3>Diferencias</h3><ul><li>Omite evidencias</li></ul>" * 8,
+        }).status_code
+
+    def generar_caso(cliente, indice):
+        return cliente.post("/generar_caso", json={
+            "pais": "Ecuador", "sector": "tecnología", "tipo_empresa": "privada", "tamano_empresa": "mediana",
+        }).status_code
+
+    def analizar_pdf(contenido):
+        def solicitud(cliente, indice):
+            return cliente.post(
+                "/analizar_pdf",
+                data={"pdf": (io.BytesIO(contenido), f"informe_{indice}.pdf"), "forzar": forzar},
+                content_type="multipart/form-data",
+            ).status_code
+        return solicitud
+
+    if nombre.startswith("analizar_pdf["):
+        return analizar_pdf(generar_pdf(int(nombre[len("analizar_pdf["):-len("p]")])))
+    return {"chat": chat, "compare": compare, "descargar_pdf": descargar_pdf, "generar_caso": generar_caso}[nombre]
+
+
+def percentil(ordenados, p):
+    if not ordenados:
+        return None
+    # Rango más cercano: el menor valor con al menos p% de las muestras por debajo
+    return ordenados[max(0, math.ceil(p / 100 * len(ordenados)) - 1)]
+
+
+def rss_pico_mb():
+    # ru_maxrss está en KB en Linux y en bytes en macOS
+    escala = 1024 * 1024 if platform.system() == "Darwin" else 1024
+    propio = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / escala
+    hijos = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / escala
+    return round(propio, 1), round(hijos, 1)
+
+
+def correr(app, funcion, solicitudes, concurrencia):
+    local = threading.local()
+
+    def una(indice):
+        # Un cliente por hilo: el test_client guarda cookies y no es para uso concurrente
+        if not hasattr(local, "cliente"):
+            local.cliente = app.test_client()
+        inicio = time.perf_counter()
+        try:
+            codigo = funcion(local.cliente, indice)
+        except Exception as e:
+            print(f"❌ Solicitud {indice}: {str(e)}")
+            codigo = None
+        return time.perf_counter() - inicio, codigo
+
+    funcion(app.test_client(), -1)  # calentamiento: pools, imports perezosos
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrencia) as ejecutor:
+        medidas = list(ejecutor.map(una, range(solicitudes)))
+    total = time.perf_counter() - inicio
+
+    latencias = sorted(segundos for segundos, _ in medidas)
+    errores = sum(1 for _, codigo in medidas if codigo != 200)
+    propio, hijos = rss_pico_mb()
+    return {
+        "solicitudes": solicitudes,
+        "errores": errores,
+        "duracion_segundos": round(total, 3),
+        "solicitudes_por_segundo": round(solicitudes / total, 2) if total else None,
+        "latencia_ms": {
+            "p50": round(percentil(latencias, 50) * 1000, 2),
+            "p95": round(percentil(latencias, 95) * 1000, 2),
+            "p99": round(percentil(latencias, 99) * 1000, 2),
+            "max": round(latencias[-1] * 1000, 2),
+        },
+        "rss_pico_mb": propio,
+        "rss_pico_hijos_mb": hijos,
+    }
+
+
+def calentar():
+    """Corre las tareas de calentamiento de la app en este hilo, como antes de pasar /listo; devuelve los segundos"""
+    import app as modulo
+
+    inicio = time.perf_counter()
+    for nombre in modulo.SUBSISTEMAS_CALENTAMIENTO:
+        try:
+            modulo.TAREAS_CALENTAMIENTO[nombre]()
+        except Exception as e:
+            print(f"❌ No se pudo calentar {nombre}: {str(e)}")
+    return round(time.perf_counter() - inicio, 3)
+
+
+def medir_escenario(args, nombre):
+    """Corre en el proceso hijo: importa la app, mide un escenario y escribe el resultado en stdout"""
+    with tempfile.TemporaryDirectory(prefix="carga-") as directorio_cache:
+        configurar_entorno(args, directorio_cache)
+        inicio_import = time.perf_counter()
+        from app import app  # noqa: E402
+        segundos_import = time.perf_counter() - inicio_import
+
+        funcion = escenario(args, nombre)
+        rss_inicial, _ = rss_pico_mb()
+        segundos_calentamiento = calentar()
+        medida = correr(app, funcion, args.solicitudes, args.concurrencia)
+    medida["rss_inicial_mb"] = rss_inicial
+    medida["import_app_segundos"] = round(segundos_import, 3)
+    medida["calentamiento_segundos"] = segundos_calentamiento
+    # Prefijo "= ": la app y PyMuPDF también escriben en stdout
+    print("= " + json.dumps(medida), flush=True)
+
+
+def medir_en_proceso(nombre):
+    argumentos = sys.argv[1:]
+    salida = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), *argumentos, "--escenario", nombre],
+        stdout=subprocess.PIPE, text=True, check=True,
+    ).stdout
+    medida = None
+    for linea in salida.splitlines():
+        if linea.startswith("= "):
+            medida = json.loads(linea[2:])
+        elif linea.strip():
+            print(linea)
+    return medida
+
+
+def comparar(actual, ruta_anterior):
+    with open(ruta_anterior, encoding="utf-8") as archivo:
+        anterior = json.load(archivo)["rutas"]
+    print(f"\nVariación contra {ruta_anterior}:")
+    for nombre, medida in actual.items():
+        previa = anterior.get(nombre)
+        if previa is None:
+            continue
+        rps = medida["solicitudes_por_segundo"] / previa["solicitudes_por_segundo"] - 1
+        p95 = medida["latencia_ms"]["p95"] / previa["latencia_ms"]["p95"] - 1
+        print(f"{nombre:24s} rps {rps:+7.1%}  p95 {p95:+7.1%}  rss {medida['rss_pico_mb'] - previa['rss_pico_mb']:+.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrencia", type=int, default=8)
+    parser.add_argument("--solicitudes", type=int, default=40, help="solicitudes por ruta")
+    parser.add_argument("--latencia", type=float, default=0.05, help="segundos hasta el primer token del modelo falso")
+    parser.add_argument("--tokens-por-segundo", type=float, default=0, help="0 = sin tiempo de generación")
+    parser.add_argument("--tasa-error", type=float, default=0.0, help="fracción de llamadas con error transitorio")
+    parser.add_argument("--paginas", type=lambda v: [int(p) for p in v.split(",")], default=[1, 10, 50])
+    parser.add_argument("--rutas", type=lambda v: [r.strip() for r in v.split(",")], default=list(RUTAS))
+    parser.add_argument("--con-cache", action="store_true", help="no desactivar el cache de respuestas")
+    parser.add_argument("--con-pool", action="store_true", help="no desactivar el pool de casos pregenerados")
+    parser.add_argument("--salida", default=os.path.join(DIRECTORIO, "resultados", "carga.json"))
+    parser.add_argument("--comparar", help="reporte anterior contra el que imprimir la variación")
+    parser.add_argument("--escenario", help=argparse.SUPPRESS)  # uso interno: proceso hijo de un escenario
+    args = parser.parse_args()
+
+    desconocidas = set(args.rutas) - set(RUTAS)
+    if desconocidas:
+        parser.error(f"rutas desconocidas: {', '.join(sorted(desconocidas))}")
+    if args.escenario:
+        medir_escenario(args, args.escenario)
+        return
+
+    rutas = {}
+    for nombre in nombres_escenarios(args):
+        medida = rutas[nombre] = medir_en_proceso(nombre)
+        print(
+            f"{nombre:24s} {medida['solicitudes_por_segundo']:8.2f} req/s  "
+            f"p50 {medida['latencia_ms']['p50']:8.1f} ms  p95 {medida['latencia_ms']['p95']:8.1f} ms  "
+            f"p99 {medida['latencia_ms']['p99']:8.1f} ms  errores {medida['errores']}  "
+            f"rss {medida['rss_inicial_mb']:.0f} -> {medida['rss_pico_mb']:.0f} MB"
+        )
+    segundos_import = min(medida.pop("import_app_segundos") for medida in rutas.values()) if rutas else None
+
+    reporte = {
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "configuracion": {
+            "concurrencia": args.concurrencia,
+            "solicitudes": args.solicitudes,
+            "latencia": args.latencia,
+            "tokens_por_segundo": args.tokens_por_segundo,
+            "tasa_error": args.tasa_error,
+            "paginas": args.paginas,
+            "con_cache": args.con_cache,
+            "con_pool": args.con_pool,
+        },
+        "import_app_segundos": segundos_import,
+        "rutas": rutas,
+    }
+    directorio_salida = os.path.dirname(os.path.abspath(args.salida))
+    os.makedirs(directorio_salida, exist_ok=True)
+    with open(args.salida, "w", encoding="utf-8") as archivo:
+        json.dump(reporte, archivo, ensure_ascii=False, indent=2)
+    print(f"\nReporte: {args.salida}")
+
+    if args.comparar:
+        comparar(rutas, args.comparar)
+
+
+if __name__ == "__main__":
+    main()
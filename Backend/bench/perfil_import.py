@@ -0,0 +1,129 @@
+"""Perfil de arranque de app.py: tiempo de import, primera respuesta y calentamiento.
+
+Uso:
+    python bench/perfil_import.py [--top 15] [--max-import 1.5] [--sin-calentamiento]
+
+Importa app.py en un proceso nuevo con -X importtime (modelo falso y cache
+temporal) y muestra los módulos que más tardan. Termina con código 1 si
+alguno de los módulos pesados (PyMuPDF, fpdf, NumPy, google.generativeai,
+bs4) se carga al importar la app, o si el import supera --max-import
+segundos, así que sirve como chequeo en CI.
+
+Después mide, también en procesos nuevos, el tiempo hasta la primera
+respuesta de "/" y hasta que /listo devuelve 200.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+DIRECTORIO_APP = os.path.dirname(DIRECTORIO)
+
+PESADOS = ("fitz", "pymupdf", "fpdf", "numpy", "google.generativeai", "bs4")
+
+PRIMERA_RESPUESTA = """
+import time
+inicio = time.perf_counter()
+from app import app
+cliente = app.test_client()
+codigo = cliente.get("/").status_code
+print(f"= {time.perf_counter() - inicio:.4f} {codigo}")
+"""
+
+HASTA_LISTO = """
+import time
+inicio = time.perf_counter()
+from app import app
+cliente = app.test_client()
+while cliente.get("/listo").status_code != 200 and time.perf_counter() - inicio < 120:
+    time.sleep(0.05)
+estado = cliente.get("/listo").get_json()
+print(f"= {time.perf_counter() - inicio:.4f}")
+for nombre, tarea in estado["tareas"].items():
+    print(f"= {nombre} {tarea['estado']} {tarea.get('segundos')} {int(tarea['opcional'])}")
+"""
+
+
+def entorno(directorio_cache, calentar):
+    variables = dict(os.environ)
+    variables.update({
+        "MODELO_BACKEND": "falso",
+        "DIRECTORIO_CACHE": directorio_cache,
+        "CALENTAR_AL_INICIAR": "1" if calentar else "0",
+    })
+    return variables
+
+
+def correr(argumentos, variables):
+    return subprocess.run(
+        [sys.executable, *argumentos], cwd=DIRECTORIO_APP, env=variables, capture_output=True, text=True, check=True
+    )
+
+
+def resultados(salida):
+    # Las líneas de resultado empiezan con "= "; PyMuPDF y otros pueden escribir avisos en stdout
+    return [linea[2:].split() for linea in salida.splitlines() if linea.startswith("= ")]
+
+
+def perfil_import(variables):
+    """[(acumulado_us, propio_us, profundidad, módulo)] de -X importtime"""
+    salida = correr(["-X", "importtime", "-c", "import app"], variables).stderr
+    modulos = []
+    for linea in salida.splitlines():
+        if not linea.startswith("import time:") or "cumulative" in linea:
+            continue
+        propio, acumulado, nombre = linea[len("import time:"):].split("|")
+        profundidad = (len(nombre) - len(nombre.lstrip(" "))) // 2
+        modulos.append((int(acumulado), int(propio), profundidad, nombre.strip()))
+    return modulos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top", type=int, default=15, help="módulos a listar")
+    parser.add_argument("--max-import", type=float, default=None, help="falla si importar app tarda más (segundos)")
+    parser.add_argument("--sin-calentamiento", action="store_true", help="no medir el tiempo hasta /listo")
+    args = parser.parse_args()
+
+    fallas = []
+    with tempfile.TemporaryDirectory(prefix="perfil-") as directorio_cache:
+        variables = entorno(directorio_cache, calentar=False)
+        correr(["-c", "import app"], variables)  # genera los .pyc para no medir la compilación
+
+        modulos = perfil_import(variables)
+        total_app = next(acumulado for acumulado, _, _, nombre in modulos if nombre == "app") / 1e6
+        print(f"Import de app: {total_app:.3f} s")
+        print(f"\n{'acumulado':>10s} {'propio':>9s}  módulo")
+        for acumulado, propio, profundidad, nombre in sorted(modulos, reverse=True)[:args.top]:
+            print(f"{acumulado / 1000:8.1f}ms {propio / 1000:7.1f}ms  {'  ' * profundidad}{nombre}")
+
+        cargados = {nombre for _, _, _, nombre in modulos}
+        pesados = [modulo for modulo in PESADOS if modulo in cargados]
+        if pesados:
+            fallas.append(f"módulos pesados cargados al importar app: {', '.join(pesados)}")
+        if args.max_import is not None and total_app > args.max_import:
+            fallas.append(f"el import tardó {total_app:.3f} s (máximo {args.max_import} s)")
+
+        inicio = time.perf_counter()
+        (segundos, codigo), = resultados(correr(["-c", PRIMERA_RESPUESTA], variables).stdout)
+        proceso = time.perf_counter() - inicio
+        print(f"\nPrimera respuesta de / ({codigo}): {float(segundos):.3f} s desde el import, {proceso:.3f} s con el intérprete")
+
+        if not args.sin_calentamiento:
+            (total,), *tareas = resultados(correr(["-c", HASTA_LISTO], entorno(directorio_cache, calentar=True)).stdout)
+            print(f"/listo en 200: {float(total):.3f} s")
+            for nombre, estado, segundos, opcional in tareas:
+                print(f"  {nombre:10s} {estado:8s} {segundos} s{' (opcional)' if opcional == '1' else ''}")
+                if estado != "listo" and opcional != "1":
+                    fallas.append(f"el calentamiento de {nombre} terminó en {estado}")
+
+    for falla in fallas:
+        print(f"❌ {falla}")
+    sys.exit(1 if fallas else 0)
+
+
+if __name__ == "__main__":
+    main()
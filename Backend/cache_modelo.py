@@ -0,0 +1,235 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from metricas import REGISTRO
+
+
+CONSULTAS_CACHE = REGISTRO.contador("cache_consultas_total", "Consultas al cache de respuestas por tipo de prompt")
+
+
+def normalizar_prompt(texto):
+    """Colapsa espacios y saltos para que prompts equivalentes compartan clave"""
+    return re.sub(r'\s+', ' ', texto).strip()
+
+
+def _normalizar_contenido(contents):
+    if isinstance(contents, str):
+        return normalizar_prompt(contents)
+    if isinstance(contents, dict):
+        return {k: _normalizar_contenido(v) for k, v in contents.items()}
+    if isinstance(contents, (list, tuple)):
+        return [_normalizar_contenido(c) for c in contents]
+    return contents
+
+
+def clave_cache(contents, nombre_modelo, generation_config):
+    """Clave estable: prompt normalizado + modelo + configuración de generación"""
+    material = json.dumps(
+        {
+            "modelo": nombre_modelo,
+            "contenido": _normalizar_contenido(contents),
+            "config": generation_config or {},
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class CacheRespuestas:
+    """Cache de dos niveles: LRU en memoria delante de una tabla SQLite en disco"""
+
+    def __init__(self, ruta_db, max_memoria=512, max_disco=20000, ttl=7 * 24 * 3600):
+        self.max_memoria = max_memoria
+        self.max_disco = max_disco
+        self.ttl = ttl
+        self._memoria = OrderedDict()
+        self._lock = threading.Lock()
+        self.contadores = {
+            "aciertos_memoria": 0,
+            "aciertos_disco": 0,
+            "fallos": 0,
+            "escrituras": 0,
+            "expulsiones": 0,
+        }
+
+        directorio = os.path.dirname(ruta_db)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        self._db = sqlite3.connect(ruta_db, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS respuestas ("
+            "clave TEXT PRIMARY KEY, texto TEXT NOT NULL, creado REAL NOT NULL, accedido REAL NOT NULL)"
+        )
+        self._db.commit()
+        self._filas_disco = self._db.execute("SELECT COUNT(*) FROM respuestas").fetchone()[0]
+
+    def obtener(self, clave):
+        ahora = time.time()
+        with self._lock:
+            entrada = self._memoria.get(clave)
+            if entrada is not None:
+                texto, creado = entrada
+                if ahora - creado <= self.ttl:
+                    self._memoria.move_to_end(clave)
+                    self.contadores["aciertos_memoria"] += 1
+                    return texto
+                del self._memoria[clave]
+
+            fila = self._db.execute(
+                "SELECT texto, creado FROM respuestas WHERE clave = ?", (clave,)
+            ).fetchone()
+            if fila is not None and ahora - fila[1] <= self.ttl:
+                self._db.execute("UPDATE respuestas SET accedido = ? WHERE clave = ?", (ahora, clave))
+                self._db.commit()
+                self._recordar(clave, fila[0], fila[1])
+                self.contadores["aciertos_disco"] += 1
+                return fila[0]
+
+            self.contadores["fallos"] += 1
+            return None
+
+    def guardar(self, clave, texto):
+        ahora = time.time()
+        with self._lock:
+            self._recordar(clave, texto, ahora)
+            existia = self._db.execute("SELECT 1 FROM respuestas WHERE clave = ?", (clave,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO respuestas (clave, texto, creado, accedido) VALUES (?, ?, ?, ?)",
+                (clave, texto, ahora, ahora),
+            )
+            self._db.commit()
+            if existia is None:
+                self._filas_disco += 1
+            self.contadores["escrituras"] += 1
+            if self._filas_disco > self.max_disco:
+                self._expulsar_disco(ahora)
+
+    def estadisticas(self):
+        with self._lock:
+            consultas = self.contadores["aciertos_memoria"] + self.contadores["aciertos_disco"] + self.contadores["fallos"]
+            aciertos = consultas - self.contadores["fallos"]
+            return {
+                **self.contadores,
+                "entradas_memoria": len(self._memoria),
+                "entradas_disco": self._filas_disco,
+                "tasa_aciertos": round(aciertos / consultas, 4) if consultas else 0.0,
+            }
+
+    def _recordar(self, clave, texto, creado):
+        self._memoria[clave] = (texto, creado)
+        self._memoria.move_to_end(clave)
+        while len(self._memoria) > self.max_memoria:
+            self._memoria.popitem(last=False)
+
+    def _expulsar_disco(self, ahora):
+        # Primero lo vencido; si no alcanza, lo menos usado hasta dejar un 10% de margen
+        self._db.execute("DELETE FROM respuestas WHERE creado < ?", (ahora - self.ttl,))
+        restantes = self._db.execute("SELECT COUNT(*) FROM respuestas").fetchone()[0]
+        objetivo = int(self.max_disco * 0.9)
+        if restantes > objetivo:
+            self._db.execute(
+                "DELETE FROM respuestas WHERE clave IN "
+                "(SELECT clave FROM respuestas ORDER BY accedido ASC LIMIT ?)",
+                (restantes - objetivo,),
+            )
+        self._db.commit()
+        total = self._db.execute("SELECT COUNT(*) FROM respuestas").fetchone()[0]
+        self.contadores["expulsiones"] += self._filas_disco - total
+        self._filas_disco = total
+
+
+class RespuestaCacheada:
+    """Imita la respuesta de Gemini lo justo para que las rutas lean .text"""
+
+    def __init__(self, text):
+        self.text = text
+
+
+def texto_fragmento(fragmento):
+    """Texto de un fragmento de streaming; los fragmentos finales pueden venir sin partes"""
+    try:
+        return fragmento.text
+    except ValueError:
+        return ""
+
+
+def debe_cachear(generation_config, cache=None):
+    """Por defecto solo se cachean llamadas deterministas (temperature 0)"""
+    if cache is not None:
+        return cache
+    return (generation_config or {}).get("temperature") == 0
+
+
+class ModeloConCache:
+    """Envuelve el cliente del modelo y sirve desde cache los prompts repetidos"""
+
+    def __init__(self, modelo, cache, nombre_modelo):
+        self._modelo = modelo
+        self.cache = cache
+        self.nombre_modelo = nombre_modelo
+
+    def generate_content(self, contents, generation_config=None, cache=None, stream=False, tipo="otro", **kwargs):
+        if not debe_cachear(generation_config, cache):
+            return self._modelo.generate_content(
+                contents, generation_config=generation_config, stream=stream, tipo=tipo, **kwargs
+            )
+
+        clave = clave_cache(contents, self.nombre_modelo, generation_config)
+        texto = self.cache.obtener(clave)
+        CONSULTAS_CACHE.inc(tipo=tipo, resultado="acierto" if texto is not None else "fallo")
+        if texto is not None:
+            return iter([RespuestaCacheada(texto)]) if stream else RespuestaCacheada(texto)
+
+        respuesta = self._modelo.generate_content(
+            contents, generation_config=generation_config, stream=stream, tipo=tipo, **kwargs
+        )
+        if stream:
+            return self._guardar_al_terminar(clave, respuesta)
+        self.cache.guardar(clave, respuesta.text)
+        return respuesta
+
+    def _guardar_al_terminar(self, clave, fragmentos):
+        # Solo se guarda si el stream se consumió completo
+        partes = []
+        for fragmento in fragmentos:
+            partes.append(texto_fragmento(fragmento))
+            yield fragmento
+        self.cache.guardar(clave, "".join(partes))
+
+    def start_chat(self, history=None):
+        return SesionChat(self, history)
+
+
+class SesionChat:
+    """Sesión de chat que reenvía el historial vía generate_content para poder cachear cada turno"""
+
+    def __init__(self, modelo, history=None):
+        self._modelo = modelo
+        self.history = list(history or [])
+
+    def send_message(self, mensaje, generation_config=None, cache=None, stream=False, **kwargs):
+        turno = {"role": "user", "parts": [mensaje]}
+        respuesta = self._modelo.generate_content(
+            self.history + [turno], generation_config=generation_config, cache=cache, stream=stream, **kwargs
+        )
+        if stream:
+            return self._registrar_al_terminar(turno, respuesta)
+        self.history.append(turno)
+        self.history.append({"role": "model", "parts": [respuesta.text]})
+        return respuesta
+
+    def _registrar_al_terminar(self, turno, fragmentos):
+        partes = []
+        for fragmento in fragmentos:
+            partes.append(texto_fragmento(fragmento))
+            yield fragmento
+        self.history.append(turno)
+        self.history.append({"role": "model", "parts": ["".join(partes)]})
@@ -0,0 +1,70 @@
+import threading
+import time
+
+from metricas import REGISTRO
+
+
+DURACION_CALENTAMIENTO = REGISTRO.medidor("calentamiento_segundos", "Segundos que tardó en cargarse cada subsistema")
+
+
+class Calentamiento:
+    """Carga en segundo plano los subsistemas que la app importa de forma perezosa.
+
+    Las tareas corren en orden en un solo hilo, para no competir por el GIL con
+    las solicitudes que ya se están atendiendo. iniciar() se puede llamar
+    cualquier número de veces; solo la primera arranca el hilo.
+
+    Las que fallan se reintentan con espera exponencial (de `espera_base` a
+    `espera_maxima` segundos) hasta que cargan. Las `opcionales` se
+    precargan igual pero no cuentan para "listo": un subsistema que este
+    despliegue no usa no deja la réplica fuera del balanceador.
+    """
+
+    def __init__(self, tareas, opcionales=(), espera_base=1.0, espera_maxima=300.0):
+        self._tareas = dict(tareas)
+        self.opcionales = set(opcionales)
+        self.espera_base = espera_base
+        self.espera_maxima = espera_maxima
+        self._estado = {nombre: {"estado": "pendiente"} for nombre in self._tareas}
+        self._lock = threading.Lock()
+        self._hilo = None
+
+    def iniciar(self):
+        with self._lock:
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._correr, name="calentamiento", daemon=True)
+                self._hilo.start()
+
+    def estado(self):
+        """{"listo": bool, "tareas": {nombre: {"estado", "opcional", "intentos"?, "segundos"?, "error"?}}}"""
+        with self._lock:
+            tareas = {
+                nombre: {**estado, "opcional": nombre in self.opcionales} for nombre, estado in self._estado.items()
+            }
+        listo = all(t["estado"] == "listo" for nombre, t in tareas.items() if nombre not in self.opcionales)
+        return {"listo": listo, "tareas": tareas}
+
+    def _correr(self):
+        pendientes = list(self._tareas)
+        intentos = 0
+        while pendientes:
+            intentos += 1
+            pendientes = [nombre for nombre in pendientes if not self._cargar(nombre, intentos)]
+            if pendientes:
+                time.sleep(min(self.espera_maxima, self.espera_base * 2 ** (intentos - 1)))
+
+    def _cargar(self, nombre, intentos):
+        with self._lock:
+            self._estado[nombre] = {**self._estado[nombre], "estado": "cargando", "intentos": intentos}
+        inicio = time.monotonic()
+        try:
+            self._tareas[nombre]()
+            estado = {"estado": "listo", "intentos": intentos}
+        except Exception as e:
+            print(f"❌ No se pudo precargar {nombre} (intento {intentos}): {str(e)}")
+            estado = {"estado": "error", "intentos": intentos, "error": str(e)}
+        estado["segundos"] = round(time.monotonic() - inicio, 3)
+        DURACION_CALENTAMIENTO.fijar(estado["segundos"], tarea=nombre)
+        with self._lock:
+            self._estado[nombre] = estado
+        return estado["estado"] == "listo"
@@ -0,0 +1,402 @@
+import json
+import random
+import threading
+import time
+
+from metricas import REGISTRO, medir
+
+
+REINTENTOS_MODELO = REGISTRO.contador("modelo_reintentos_total", "Reintentos por errores transitorios del modelo")
+RECHAZOS_MODELO = REGISTRO.contador("modelo_rechazos_total", "Llamadas rechazadas sin llegar al modelo")
+TOKENS_MODELO = REGISTRO.contador("modelo_tokens_total", "Tokens de entrada y salida informados por el modelo")
+ERRORES_TRANSITORIOS = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable",
+    "InternalServerError", "DeadlineExceeded", "GatewayTimeout",
+}
+CODIGOS_TRANSITORIOS = {429, 500, 503, 504}
+
+
+class CircuitoAbierto(RuntimeError):
+    """El modelo falló demasiadas veces seguidas; se rechaza la llamada sin intentarla"""
+
+
+class LimiteExcedido(RuntimeError):
+    """No hubo cupo en el limitador o en el pool dentro del tiempo de espera"""
+
+
+class ErrorTransitorioFalso(RuntimeError):
+    code = 503
+
+
+def es_error_transitorio(error):
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    if type(error).__name__ in ERRORES_TRANSITORIOS:
+        return True
+    codigo = getattr(error, "code", None)
+    return getattr(codigo, "value", codigo) in CODIGOS_TRANSITORIOS
+
+
+def estimar_tokens(contents, generation_config):
+    """Aproximación de ~4 caracteres por token, más el máximo de salida pedido"""
+    texto = contents if isinstance(contents, str) else json.dumps(contents, ensure_ascii=False)
+    return len(texto) // 4 + int((generation_config or {}).get("max_output_tokens", 0))
+
+
+def registrar_tokens(respuesta, tipo):
+    uso = getattr(respuesta, "usage_metadata", None)
+    if uso is None:
+        return
+    TOKENS_MODELO.inc(getattr(uso, "prompt_token_count", 0) or 0, tipo=tipo, direccion="entrada")
+    TOKENS_MODELO.inc(getattr(uso, "candidates_token_count", 0) or 0, tipo=tipo, direccion="salida")
+
+
+class BackendGemini:
+    """Backend real: google.generativeai, importado y configurado en la primera llamada (o en calentar)"""
+
+    def __init__(self, nombre_modelo, api_key):
+        self.nombre_modelo = nombre_modelo
+        self._api_key = api_key
+        self._modelo = None
+        self._lock = threading.Lock()
+
+    def calentar(self):
+        with self._lock:
+            if self._modelo is None:
+                import google.generativeai as genai
+
+                genai.configure(api_key=self._api_key)
+                self._modelo = genai.GenerativeModel(self.nombre_modelo)
+        return self._modelo
+
+    def generate_content(self, contents, generation_config=None, stream=False, timeout=None):
+        request_options = {"timeout": timeout} if timeout else None
+        return (self._modelo or self.calentar()).generate_content(
+            contents, generation_config=generation_config, stream=stream, request_options=request_options
+        )
+
+
+class UsoFalso:
+    def __init__(self, entrada, salida):
+        self.prompt_token_count = entrada
+        self.candidates_token_count = salida
+        self.total_token_count = entrada + salida
+
+
+class RespuestaFalsa:
+    def __init__(self, text, usage_metadata=None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+def respuesta_falsa_por_defecto(prompt):
+    """Respuestas enlatadas con la forma que esperan las rutas"""
+    if "impacto,probabilidad" in prompt:
+        return "3,4"
+    if "porcentaje de efectividad" in prompt:
+        return "72%"
+    return (
+        "### 🧭 Procedimiento Aplicado\n"
+        "* **Planificación:** revisión del alcance y los objetivos de calidad (cláusula 6.2).\n"
+        "* Revisión documental del control de información documentada (cláusula 7.5).\n\n"
+        "### 🧠 Hallazgos Identificados\n"
+        "* **No conformidad (8.5.1):** falta de control de parámetros de producción.\n\n"
+        "Se recomienda implementar indicadores semanales y un plan de acciones correctivas."
+    )
+
+
+class BackendFalso:
+    """Modelo en proceso para pruebas y benchmarks, sin red ni API key.
+
+    latencia es el tiempo hasta el primer token; tokens_por_segundo (si se da)
+    agrega el tiempo de generación. tasa_error es la fracción de llamadas que
+    fallan con un error transitorio.
+    """
+
+    def __init__(self, latencia=0.05, tokens_por_segundo=None, tasa_error=0.0, responder=None):
+        self.latencia = latencia
+        self.tokens_por_segundo = tokens_por_segundo
+        self.tasa_error = tasa_error
+        self.responder = responder or respuesta_falsa_por_defecto
+
+    def generate_content(self, contents, generation_config=None, stream=False, timeout=None):
+        prompt = contents if isinstance(contents, str) else json.dumps(contents, ensure_ascii=False)
+        texto = self.responder(prompt)
+        esquema = (generation_config or {}).get("response_schema")
+        if esquema:
+            texto = json.dumps({clave: texto for clave in esquema.get("properties", {})}, ensure_ascii=False)
+        maximo = int((generation_config or {}).get("max_output_tokens", 0)) or None
+        if maximo is not None:
+            texto = texto[: maximo * 4]
+        uso = UsoFalso(len(prompt) // 4, max(1, len(texto) // 4))
+
+        if timeout is not None and self.latencia > timeout:
+            time.sleep(timeout)
+            raise TimeoutError("Tiempo de espera agotado en el modelo falso")
+        time.sleep(self.latencia)
+        if self.tasa_error and random.random() < self.tasa_error:
+            raise ErrorTransitorioFalso("Error transitorio simulado")
+
+        if stream:
+            return self._fragmentos(texto, uso)
+        if self.tokens_por_segundo:
+            time.sleep(uso.candidates_token_count / self.tokens_por_segundo)
+        return RespuestaFalsa(texto, uso)
+
+    def _fragmentos(self, texto, uso):
+        paso = 64
+        for inicio in range(0, len(texto), paso):
+            if self.tokens_por_segundo:
+                time.sleep(paso / 4 / self.tokens_por_segundo)
+            yield RespuestaFalsa(texto[inicio:inicio + paso], uso)
+
+
+class LimitadorTokens:
+    """Token bucket: capacidad máxima y reposición continua a `tasa` unidades por segundo"""
+
+    def __init__(self, tasa, capacidad):
+        self.tasa = tasa
+        self.capacidad = capacidad
+        self._disponible = capacidad
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def adquirir(self, cantidad, espera_maxima):
+        cantidad = min(cantidad, self.capacidad)
+        limite = time.monotonic() + espera_maxima
+        while True:
+            with self._lock:
+                ahora = time.monotonic()
+                self._disponible = min(self.capacidad, self._disponible + (ahora - self._ultimo) * self.tasa)
+                self._ultimo = ahora
+                if self._disponible >= cantidad:
+                    self._disponible -= cantidad
+                    return True
+                faltante = (cantidad - self._disponible) / self.tasa
+            if ahora + faltante > limite:
+                return False
+            time.sleep(min(faltante, 0.25))
+
+
+class Interruptor:
+    """Circuit breaker: se abre tras `umbral` fallos seguidos y deja pasar una prueba tras `enfriamiento`"""
+
+    def __init__(self, umbral, enfriamiento):
+        self.umbral = umbral
+        self.enfriamiento = enfriamiento
+        self._fallos = 0
+        self._abierto_desde = None
+        self._prueba_en_curso = False
+        self._lock = threading.Lock()
+
+    @property
+    def estado(self):
+        with self._lock:
+            if self._abierto_desde is None:
+                return "cerrado"
+            if time.monotonic() - self._abierto_desde >= self.enfriamiento:
+                return "semiabierto"
+            return "abierto"
+
+    def permitir(self):
+        """True con el circuito cerrado, "prueba" si deja pasar la llamada de prueba, False si la rechaza"""
+        with self._lock:
+            if self._abierto_desde is None:
+                return True
+            if time.monotonic() - self._abierto_desde < self.enfriamiento or self._prueba_en_curso:
+                return False
+            self._prueba_en_curso = True
+            return "prueba"
+
+    def liberar_prueba(self):
+        """La prueba terminó sin decidir el estado (p. ej. la rechazó el limitador): habilita otra"""
+        with self._lock:
+            self._prueba_en_curso = False
+
+    def exito(self):
+        with self._lock:
+            self._fallos = 0
+            self._abierto_desde = None
+            self._prueba_en_curso = False
+
+    def fallo(self):
+        with self._lock:
+            self._fallos += 1
+            self._prueba_en_curso = False
+            if self._fallos >= self.umbral or self._abierto_desde is not None:
+                self._abierto_desde = time.monotonic()
+
+
+class ClienteModelo:
+    """Cliente único del modelo: limita ritmo y concurrencia, reintenta errores transitorios
+    con backoff exponencial con jitter y corta con un circuit breaker.
+    """
+
+    def __init__(
+        self,
+        backend,
+        solicitudes_por_segundo=5.0,
+        tokens_por_minuto=1_000_000,
+        max_concurrencia=8,
+        reintentos=3,
+        espera_base=0.5,
+        espera_maxima=8.0,
+        timeout=45.0,
+        umbral_fallos=5,
+        enfriamiento=30.0,
+        plazo_total=None,
+        intento_minimo=1.0,
+    ):
+        self.backend = backend
+        self.timeout = timeout
+        # Tiempo total de una llamada con sus reintentos y esperas; por defecto, el timeout de un intento
+        self.plazo_total = plazo_total or timeout
+        self.intento_minimo = intento_minimo
+        self.reintentos = reintentos
+        self.espera_base = espera_base
+        self.espera_maxima = espera_maxima
+        self._solicitudes = LimitadorTokens(solicitudes_por_segundo, max(1.0, solicitudes_por_segundo))
+        self._tokens = LimitadorTokens(tokens_por_minuto / 60.0, tokens_por_minuto)
+        self._cupos = threading.BoundedSemaphore(max_concurrencia)
+        self.interruptor = Interruptor(umbral_fallos, enfriamiento)
+        self._lock = threading.Lock()
+        self.contadores = {"llamadas": 0, "reintentos": 0, "fallos": 0, "rechazos_circuito": 0, "rechazos_limite": 0}
+
+    def generate_content(self, contents, generation_config=None, stream=False, request_options=None, tipo="otro"):
+        """tipo etiqueta la llamada en las métricas (análisis, comparación, riesgo...).
+
+        request_options acepta "timeout" (por intento) y "plazo" (segundos para
+        toda la llamada, reintentos incluidos).
+        """
+        timeout = (request_options or {}).get("timeout") or self.timeout
+        plazo = time.monotonic() + ((request_options or {}).get("plazo") or max(self.plazo_total, timeout))
+        if stream:
+            return self._generar_stream(contents, generation_config, timeout, plazo, tipo)
+
+        with medir("modelo", tipo=tipo), self._cupo(contents, generation_config, timeout, plazo, tipo) as cupo:
+            respuesta = self._con_reintentos(lambda espera: self.backend.generate_content(
+                contents, generation_config=generation_config, timeout=espera
+            ), tipo, cupo, timeout, plazo)
+        registrar_tokens(respuesta, tipo)
+        return respuesta
+
+    def estadisticas(self):
+        with self._lock:
+            return {**self.contadores, "circuito": self.interruptor.estado}
+
+    def _generar_stream(self, contents, generation_config, timeout, plazo, tipo):
+        # Solo se reintenta hasta recibir el primer fragmento; después el error se propaga
+        with medir("modelo", tipo=tipo), self._cupo(contents, generation_config, timeout, plazo, tipo) as cupo:
+            def abrir(espera):
+                fragmentos = iter(self.backend.generate_content(
+                    contents, generation_config=generation_config, stream=True, timeout=espera
+                ))
+                return fragmentos, next(fragmentos, None)
+
+            fragmentos, ultimo = self._con_reintentos(abrir, tipo, cupo, timeout, plazo)
+            if ultimo is not None:
+                yield ultimo
+            for ultimo in fragmentos:
+                yield ultimo
+            # El uso acumulado llega en el último fragmento
+            registrar_tokens(ultimo, tipo)
+
+    def _cupo(self, contents, generation_config, timeout, plazo, tipo):
+        self._contar("llamadas")
+        timeout = min(timeout, max(0.0, plazo - time.monotonic()))
+        permiso = self.interruptor.permitir()
+        if not permiso:
+            self._contar("rechazos_circuito")
+            RECHAZOS_MODELO.inc(tipo=tipo, motivo="circuito")
+            raise CircuitoAbierto("El modelo no está disponible temporalmente.")
+        prueba = permiso == "prueba"
+
+        try:
+            if not (
+                self._solicitudes.adquirir(1, timeout)
+                and self._tokens.adquirir(estimar_tokens(contents, generation_config), timeout)
+            ):
+                self._contar("rechazos_limite")
+                RECHAZOS_MODELO.inc(tipo=tipo, motivo="limite")
+                raise LimiteExcedido("Límite de solicitudes al modelo alcanzado.")
+            if not self._cupos.acquire(timeout=timeout):
+                self._contar("rechazos_limite")
+                RECHAZOS_MODELO.inc(tipo=tipo, motivo="concurrencia")
+                raise LimiteExcedido("No hay capacidad disponible para llamar al modelo.")
+        except BaseException:
+            # Una prueba que no llegó al modelo no decide nada: se libera para la próxima llamada
+            if prueba:
+                self.interruptor.liberar_prueba()
+            raise
+        return _Liberar(self._cupos, self.interruptor if prueba else None)
+
+    def _con_reintentos(self, llamada, tipo, cupo, timeout, plazo):
+        """llamada(timeout del intento); cada intento se recorta a lo que queda del plazo y
+        no se reintenta si lo que queda tras la espera no alcanza para otro intento como el anterior"""
+        intento = 0
+        while True:
+            inicio = time.monotonic()
+            restante = plazo - inicio
+            if restante <= 0:
+                # Se agotó el plazo esperando cupo: no es un fallo del modelo, el circuito no se entera
+                self._contar("fallos")
+                raise TimeoutError("Plazo de la llamada al modelo agotado")
+            try:
+                resultado = llamada(min(timeout, restante))
+            except Exception as e:
+                if not es_error_transitorio(e):
+                    # El modelo respondió (400, respuesta inválida...): para el circuito cuenta como éxito
+                    self.interruptor.exito()
+                    raise
+                self.interruptor.fallo()
+                # Full jitter: espera aleatoria entre 0 y el tope exponencial
+                espera = random.uniform(0, min(self.espera_maxima, self.espera_base * 2 ** intento))
+                alcanza = plazo - time.monotonic() - espera >= max(time.monotonic() - inicio, self.intento_minimo)
+                if intento >= self.reintentos or not alcanza or not self.interruptor.permitir():
+                    self._contar("fallos")
+                    raise
+                # Durante la espera el cupo de concurrencia queda libre para otras llamadas
+                cupo.soltar()
+                time.sleep(espera)
+                if not cupo.retomar(max(0.0, plazo - time.monotonic())):
+                    self._contar("rechazos_limite")
+                    RECHAZOS_MODELO.inc(tipo=tipo, motivo="concurrencia")
+                    raise LimiteExcedido("No hay capacidad disponible para reintentar la llamada al modelo.") from e
+                intento += 1
+                self._contar("reintentos")
+                REINTENTOS_MODELO.inc(tipo=tipo)
+                continue
+            self.interruptor.exito()
+            return resultado
+
+    def _contar(self, nombre):
+        with self._lock:
+            self.contadores[nombre] += 1
+
+
+class _Liberar:
+    """Devuelve el cupo al salir y, si la llamada era la prueba del circuito, la da por terminada
+    aunque haya salido por una excepción que no pasó por exito() ni fallo()"""
+
+    def __init__(self, semaforo, interruptor=None):
+        self._semaforo = semaforo
+        self._interruptor = interruptor
+        self._tomado = True
+
+    def __enter__(self):
+        return self
+
+    def soltar(self):
+        if self._tomado:
+            self._semaforo.release()
+            self._tomado = False
+
+    def retomar(self, timeout):
+        self._tomado = self._semaforo.acquire(timeout=timeout)
+        return self._tomado
+
+    def __exit__(self, *exc):
+        self.soltar()
+        if self._interruptor is not None:
+            self._interruptor.liberar_prueba()
+        return False
@@ -0,0 +1,249 @@
+import json
+import socket
+import sqlite3
+import threading
+import time
+import urllib.request
+import uuid
+
+
+class ColaTrabajos:
+    """Cola persistente en SQLite con un pool de hilos que ejecuta los trabajos en segundo plano.
+
+    Cada tipo de trabajo se registra con una función payload -> (resultado, código HTTP).
+    Cada trabajo "en_proceso" queda a nombre del proceso que lo tomó, y cada
+    proceso anota un latido en la base cada `latido` segundos. Un trabajo
+    vuelve a "pendiente" cuando su propietario dejó de latir (el proceso cayó
+    o se reinició), cuando su arrendamiento venció (el hilo se colgó) o, al
+    iniciar, si es de este mismo propietario: así varios procesos pueden
+    compartir la base sin reencolar lo que otro está ejecutando. propietario
+    solo hace falta para retomar al instante tras un reinicio; debe ser
+    estable entre reinicios y distinto en cada proceso.
+    """
+
+    def __init__(
+        self, ruta_db, hilos=2, retencion=7 * 24 * 3600, timeout_callback=10, arrendamiento=3600, propietario=None,
+        latido=10.0,
+    ):
+        self.ruta_db = ruta_db
+        self.hilos = hilos
+        self.retencion = retencion
+        self.timeout_callback = timeout_callback
+        self.arrendamiento = arrendamiento
+        self.latido = latido
+        self.propietario_fijo = propietario is not None
+        self.propietario = propietario or f"{socket.gethostname()}:{uuid.uuid4().hex[:12]}"
+        self._manejadores = {}
+        self._lock = threading.Lock()
+        self._hay_trabajo = threading.Event()
+        self._iniciada = False
+
+        self._db = sqlite3.connect(ruta_db, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS trabajos ("
+            "id TEXT PRIMARY KEY, tipo TEXT NOT NULL, estado TEXT NOT NULL, payload TEXT NOT NULL, "
+            "resultado TEXT, codigo INTEGER, error TEXT, callback TEXT, "
+            "creado REAL NOT NULL, iniciado REAL, terminado REAL)"
+        )
+        columnas = {fila[1] for fila in self._db.execute("PRAGMA table_info(trabajos)")}
+        if "propietario" not in columnas:
+            self._db.execute("ALTER TABLE trabajos ADD COLUMN propietario TEXT")
+        self._db.execute("CREATE INDEX IF NOT EXISTS trabajos_estado ON trabajos (estado, creado)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS propietarios (id TEXT PRIMARY KEY, latido REAL NOT NULL)")
+
+    def registrar(self, tipo, funcion):
+        self._manejadores[tipo] = funcion
+
+    def iniciar(self):
+        with self._lock:
+            if self._iniciada:
+                return
+            self._iniciada = True
+        # Primero el latido: la recuperación no debe tomar por caídos los trabajos de este proceso
+        self._latir()
+        self._recuperar(propios=self.propietario_fijo)
+        threading.Thread(target=self._vigilar, name="trabajos-latido", daemon=True).start()
+        for numero in range(self.hilos):
+            threading.Thread(target=self._trabajar, name=f"trabajo-{numero}", daemon=True).start()
+        self._hay_trabajo.set()
+
+    def encolar(self, tipo, payload, callback=None):
+        if tipo not in self._manejadores:
+            raise ValueError(f"Tipo de trabajo desconocido: {tipo}")
+        self.iniciar()
+        id_trabajo = uuid.uuid4().hex
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO trabajos (id, tipo, estado, payload, callback, creado) VALUES (?, ?, 'pendiente', ?, ?, ?)",
+                (id_trabajo, tipo, json.dumps(payload, ensure_ascii=False), callback, time.time()),
+            )
+        self._hay_trabajo.set()
+        return id_trabajo
+
+    def obtener(self, id_trabajo):
+        with self._lock:
+            fila = self._db.execute(
+                "SELECT id, tipo, estado, resultado, codigo, error, creado, iniciado, terminado "
+                "FROM trabajos WHERE id = ?",
+                (id_trabajo,),
+            ).fetchone()
+        if fila is None:
+            return None
+
+        ahora = time.time()
+        trabajo = {
+            "id": fila[0],
+            "tipo": fila[1],
+            "estado": fila[2],
+            "creado": fila[6],
+            "antiguedad_segundos": round((fila[8] or ahora) - fila[6], 3),
+        }
+        if fila[7] is not None:
+            trabajo["espera_segundos"] = round(fila[7] - fila[6], 3)
+        if fila[3] is not None:
+            trabajo["resultado"] = json.loads(fila[3])
+            trabajo["codigo"] = fila[4]
+        if fila[5] is not None:
+            trabajo["error"] = fila[5]
+        if fila[2] == "pendiente":
+            trabajo["posicion"] = self._posicion(fila[6])
+        return trabajo
+
+    def estadisticas(self):
+        ahora = time.time()
+        with self._lock:
+            conteos = dict(self._db.execute("SELECT estado, COUNT(*) FROM trabajos GROUP BY estado").fetchall())
+            mas_viejo = self._db.execute("SELECT MIN(creado) FROM trabajos WHERE estado = 'pendiente'").fetchone()[0]
+        return {
+            "profundidad": conteos.get("pendiente", 0),
+            "en_proceso": conteos.get("en_proceso", 0),
+            "completados": conteos.get("completado", 0),
+            "fallidos": conteos.get("fallido", 0),
+            "antiguedad_pendiente_mas_viejo": round(ahora - mas_viejo, 3) if mas_viejo else 0.0,
+            "hilos": self.hilos,
+        }
+
+    def _latir(self):
+        ahora = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO propietarios (id, latido) VALUES (?, ?) ON CONFLICT(id) DO UPDATE SET latido = excluded.latido",
+                (self.propietario, ahora),
+            )
+            self._db.execute("DELETE FROM propietarios WHERE latido < ?", (ahora - self.retencion,))
+
+    def _vigilar(self):
+        while True:
+            time.sleep(self.latido)
+            try:
+                self._latir()
+                self._recuperar()
+            except sqlite3.Error as e:
+                print(f"❌ Error actualizando el latido de la cola de trabajos: {str(e)}")
+
+    def _recuperar(self, propios=False):
+        """Devuelve a "pendiente" los trabajos de propietarios sin latido o con el arrendamiento vencido
+        (y los propios, si se pide)"""
+        ahora = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE trabajos SET estado = 'pendiente', iniciado = NULL, propietario = NULL "
+                "WHERE estado = 'en_proceso' AND (iniciado < ? OR propietario IS NULL OR propietario = ? "
+                "OR propietario NOT IN (SELECT id FROM propietarios WHERE latido >= ?))",
+                (ahora - self.arrendamiento, self.propietario if propios else None, ahora - 3 * self.latido),
+            )
+        if cursor.rowcount:
+            print(f"⚠️ {cursor.rowcount} trabajo(s) en proceso sin terminar volvieron a la cola")
+            self._hay_trabajo.set()
+
+    def _posicion(self, creado):
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM trabajos WHERE estado = 'pendiente' AND creado < ?", (creado,)
+            ).fetchone()[0]
+
+    def _tomar(self):
+        # BEGIN IMMEDIATE: dos procesos con la misma base no toman el mismo trabajo
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                fila = self._db.execute(
+                    "SELECT id, tipo, payload, callback FROM trabajos WHERE estado = 'pendiente' ORDER BY creado LIMIT 1"
+                ).fetchone()
+                if fila is not None:
+                    self._db.execute(
+                        "UPDATE trabajos SET estado = 'en_proceso', iniciado = ?, propietario = ? WHERE id = ?",
+                        (time.time(), self.propietario, fila[0]),
+                    )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return fila
+
+    def _trabajar(self):
+        while True:
+            try:
+                fila = self._tomar()
+            except sqlite3.Error as e:
+                print(f"❌ Error leyendo la cola de trabajos: {str(e)}")
+                fila = None
+            if fila is None:
+                self._hay_trabajo.clear()
+                self._hay_trabajo.wait(timeout=1.0)
+                continue
+            self._ejecutar(*fila)
+
+    def _ejecutar(self, id_trabajo, tipo, payload, callback):
+        resultado, codigo, error = None, None, None
+        try:
+            resultado, codigo = self._manejadores[tipo](json.loads(payload))
+        except Exception as e:
+            print(f"❌ Error ejecutando trabajo {id_trabajo} ({tipo}): {str(e)}")
+            error = "Error ejecutando el trabajo."
+
+        estado = "completado" if error is None and codigo == 200 else "fallido"
+        with self._lock:
+            # Si el arrendamiento venció y otro proceso lo volvió a tomar, el resultado es suyo
+            actualizado = self._db.execute(
+                "UPDATE trabajos SET estado = ?, resultado = ?, codigo = ?, error = ?, terminado = ? "
+                "WHERE id = ? AND estado = 'en_proceso' AND propietario = ?",
+                (
+                    estado,
+                    json.dumps(resultado, ensure_ascii=False) if resultado is not None else None,
+                    codigo,
+                    error,
+                    time.time(),
+                    id_trabajo,
+                    self.propietario,
+                ),
+            ).rowcount
+            self._db.execute(
+                "DELETE FROM trabajos WHERE estado IN ('completado', 'fallido') AND terminado < ?",
+                (time.time() - self.retencion,),
+            )
+
+        if callback and actualizado:
+            self._notificar(callback, self.obtener(id_trabajo))
+
+    def _notificar(self, url, trabajo):
+        try:
+            solicitud = urllib.request.Request(
+                url,
+                data=json.dumps(trabajo, ensure_ascii=False).encode("utf-8"),
+                headers={"Content-Type": "application/json"},
+                method="POST",
+            )
+            # Sin seguir redirecciones: la URL ya se validó contra la lista de destinos permitidos
+            _ABRIDOR_SIN_REDIRECCIONES.open(solicitud, timeout=self.timeout_callback).close()
+        except Exception as e:
+            print(f"❌ No se pudo notificar el trabajo {trabajo['id']} a {url}: {str(e)}")
+
+
+class _SinRedirecciones(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+_ABRIDOR_SIN_REDIRECCIONES = urllib.request.build_opener(_SinRedirecciones)
@@ -0,0 +1,145 @@
+import re
+from html.parser import HTMLParser
+
+from unidecode import unidecode
+
+
+_RE_NO_LATIN1 = re.compile(r'[^\x00-\xFF]')
+
+
+class _ExtractorTexto(HTMLParser):
+    """Junta los nodos de texto en el orden del documento sin construir el árbol.
+
+    Reproduce get_text() de BeautifulSoup con html.parser: une los trozos de
+    texto contiguos, reduce los nodos de solo espacios a un salto o un espacio
+    (salvo dentro de pre/textarea), conserva CDATA e ignora comentarios y el
+    contenido de script, style y template.
+    """
+
+    _OMITIR = {"script", "style", "template"}
+    _PRESERVAR = {"pre", "textarea"}
+    _VACIAS = {
+        "area", "base", "br", "col", "embed", "hr", "img", "input", "keygen",
+        "link", "menuitem", "meta", "param", "source", "track", "wbr", "basefont", "bgsound",
+        "command", "frame", "image", "isindex", "nextid", "spacer",
+    }
+    _ESPACIOS = " \n\t\x0c\r"
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.partes = []
+        self._pendiente = []
+        # Pila de etiquetas abiertas: un cierre cierra también lo que quedó abierto adentro
+        self._abiertas = []
+        # Un </br> que sigue a un <br> se descarta sin cortar el texto
+        self._vacias_abiertas = []
+        self._omitidas = 0
+        self._preservadas = 0
+
+    def _cerrar_texto(self):
+        if not self._pendiente:
+            return
+        texto = "".join(self._pendiente)
+        self._pendiente = []
+        if self._omitidas:
+            return
+        if not self._preservadas and not texto.strip(self._ESPACIOS):
+            texto = "\n" if "\n" in texto else " "
+        self.partes.append(texto)
+
+    def handle_starttag(self, tag, attrs):
+        self._cerrar_texto()
+        if tag in self._VACIAS:
+            self._vacias_abiertas.append(tag)
+            return
+        self._abiertas.append(tag)
+        if tag in self._OMITIR:
+            self._omitidas += 1
+        elif tag in self._PRESERVAR:
+            self._preservadas += 1
+
+    def handle_startendtag(self, tag, attrs):
+        self._cerrar_texto()
+        # Como en BeautifulSoup, <br/> también consume un </br> pendiente
+        if tag in self._vacias_abiertas:
+            self._vacias_abiertas.remove(tag)
+
+    def handle_endtag(self, tag):
+        if tag in self._vacias_abiertas:
+            self._vacias_abiertas.remove(tag)
+            return
+        self._cerrar_texto()
+        if tag not in self._abiertas:
+            return
+        while True:
+            cerrada = self._abiertas.pop()
+            if cerrada in self._OMITIR:
+                self._omitidas -= 1
+            elif cerrada in self._PRESERVAR:
+                self._preservadas -= 1
+            if cerrada == tag:
+                break
+
+    def handle_data(self, data):
+        self._pendiente.append(data)
+
+    def handle_comment(self, data):
+        self._cerrar_texto()
+
+    def handle_decl(self, decl):
+        self._cerrar_texto()
+
+    def handle_pi(self, data):
+        self._cerrar_texto()
+
+    def unknown_decl(self, data):
+        self._cerrar_texto()
+        if data.startswith("CDATA[") and not self._omitidas:
+            self.partes.append(data[len("CDATA["):])
+
+    def close(self):
+        super().close()
+        self._cerrar_texto()
+
+
+def html_a_texto_plano(html):
+    """Convierte contenido HTML a texto plano legible para el PDF"""
+    extractor = _ExtractorTexto()
+    extractor.feed(html)
+    extractor.close()
+    return "\n".join(extractor.partes).strip()
+
+
+def limpiar_texto_pdf(texto):
+    # Eliminar emojis y caracteres especiales no soportados por latin-1
+    texto = _RE_NO_LATIN1.sub('', texto)  # Solo latin-1
+    texto = unidecode(texto)  # Transforma acentos y otros
+    return texto.strip()
+
+
+def renderizar_informe(caso_estudio, respuesta_ia, respuesta_usuario, comparacion):
+    """Arma el informe de /descargar_pdf a partir del HTML de cada sección y devuelve los bytes del PDF.
+
+    Corre en un proceso aparte: recibe y devuelve solo tipos simples. fpdf se
+    importa acá para que solo lo carguen los procesos que arman informes.
+    """
+    from fpdf import FPDF
+
+    caso = html_a_texto_plano(caso_estudio)
+    respuesta_ia = html_a_texto_plano(respuesta_ia)
+    respuesta_usuario = html_a_texto_plano(respuesta_usuario)
+    comparacion = html_a_texto_plano(comparacion)
+
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font("Arial", 'B', size=14)
+    pdf.cell(0, 10, "Informe de Auditoría ISO 9001", ln=True, align="C")
+    pdf.ln(10)
+
+    pdf.set_font("Arial", size=12)
+    pdf.multi_cell(0, 10, f"Caso de estudio:\n{limpiar_texto_pdf(caso)}\n", align="L")
+    pdf.multi_cell(0, 10, f"Respuesta del Chatbot:\n{limpiar_texto_pdf(respuesta_ia)}\n", align="L")
+    pdf.multi_cell(0, 10, f"Análisis del Usuario:\n{limpiar_texto_pdf(respuesta_usuario)}\n", align="L")
+    pdf.multi_cell(0, 10, f"Comparación IA:\n{limpiar_texto_pdf(comparacion)}\n", align="L")
+
+    return pdf.output(dest='S').encode('latin-1')
@@ -0,0 +1,92 @@
+import hashlib
+import os
+import tempfile
+
+
+TAMANO_BLOQUE = 1024 * 1024
+
+
+class PDFRechazado(ValueError):
+    """El PDF excede los límites configurados o no se puede abrir"""
+
+
+def guardar_temporal(file, max_bytes, directorio=None):
+    """Vuelca la subida a un archivo temporal por bloques, sin cargarla entera en memoria.
+
+    Devuelve (ruta, huella) con la huella SHA-256 del contenido calculada al vuelo.
+    """
+    destino = tempfile.NamedTemporaryFile(prefix="subida_", suffix=".pdf", dir=directorio, delete=False)
+    huella = hashlib.sha256()
+    total = 0
+    try:
+        with destino:
+            while True:
+                bloque = file.stream.read(TAMANO_BLOQUE)
+                if not bloque:
+                    break
+                total += len(bloque)
+                if total > max_bytes:
+                    raise PDFRechazado(f"El PDF supera el tamaño máximo de {max_bytes // (1024 * 1024)} MB.")
+                huella.update(bloque)
+                destino.write(bloque)
+    except Exception:
+        os.remove(destino.name)
+        raise
+    return destino.name, huella.hexdigest()
+
+
+def cargar_fitz():
+    # PyMuPDF tarda en importarse: se carga con el primer PDF, no al arrancar la app
+    import fitz
+
+    return fitz
+
+
+def precargar():
+    """Importa PyMuPDF sin devolver el módulo, para poder mandarlo a los workers del pool"""
+    cargar_fitz()
+
+
+def _extraer_rango(ruta, inicio, fin):
+    # Corre en un proceso aparte: cada worker abre su propio documento
+    with cargar_fitz().open(ruta) as doc:
+        return "".join(doc[i].get_text() for i in range(inicio, fin))
+
+
+def extraer_texto(ruta, max_paginas, ejecutor=None, paginas_por_tarea=16):
+    """Extrae el texto por rangos de páginas; los documentos largos se reparten en el pool de procesos"""
+    try:
+        with cargar_fitz().open(ruta) as doc:
+            total = doc.page_count
+    except Exception as e:
+        raise PDFRechazado("El archivo no es un PDF válido.") from e
+
+    if total > max_paginas:
+        raise PDFRechazado(f"El PDF tiene {total} páginas; el máximo permitido es {max_paginas}.")
+
+    rangos = [(i, min(i + paginas_por_tarea, total)) for i in range(0, total, paginas_por_tarea)]
+    if ejecutor is None or len(rangos) <= 1:
+        return "".join(_extraer_rango(ruta, inicio, fin) for inicio, fin in rangos)
+
+    futuros = [ejecutor.submit(_extraer_rango, ruta, inicio, fin) for inicio, fin in rangos]
+    return "".join(futuro.result() for futuro in futuros)
+
+
+def dividir_texto(texto, tamano_parte, solape=500):
+    """Parte el texto en trozos de ~tamano_parte caracteres, cortando en saltos de párrafo cuando se puede"""
+    partes = []
+    inicio = 0
+    while inicio < len(texto):
+        fin = min(inicio + tamano_parte, len(texto))
+        if fin < len(texto):
+            corte = texto.rfind("\n\n", inicio + tamano_parte // 2, fin)
+            if corte == -1:
+                corte = texto.rfind("\n", inicio + tamano_parte // 2, fin)
+            if corte != -1:
+                fin = corte
+        partes.append(texto[inicio:fin].strip())
+        if fin >= len(texto):
+            break
+        inicio = max(fin - solape, inicio + 1)
+    return [p for p in partes if p]
+
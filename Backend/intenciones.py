@@ -0,0 +1,91 @@
+import re
+
+from unidecode import unidecode
+
+
+# Frases en minúsculas y sin tildes: el texto se pliega igual antes de buscar
+FRASES_CASO_REAL = [
+    r"dame un caso( de estudio)?", r"caso de (una )?empresa real", r"quiero un caso( de estudio)? real",
+    r"proporcioname un caso( de estudio)?", r"necesito un caso( de estudio)? real",
+    r"(genera|generame|muestrame|dame) un ejemplo real", r"caso real de (una )?empresa",
+]
+FRASES_ISO = [
+    r"auditoria", r"auditor", r"iso ?9001", r"calidad", r"requisitos?", r"sistema de gestion",
+    r"mejora continua", r"documentacion", r"procesos?", r"indicadores?", r"no conformidad(es)?",
+    r"clausula", r"certificacion", r"accion(es)? correctivas?", r"riesgos?", r"partes interesadas",
+    r"revision por la direccion", r"informacion documentada", r"sgc", r"norma",
+]
+# Palabras que aparecen en casos de estudio aunque no nombren la norma
+FRASES_DOMINIO = [
+    r"empresa", r"organizacion", r"clientes?", r"proveedor(es)?", r"produccion", r"producto",
+    r"servicio", r"personal", r"empleados", r"operarios", r"gerencia", r"quejas", r"reclamos",
+    r"registros?", r"procedimientos?", r"inventario", r"entregas?", r"defectos?", r"capacitacion",
+]
+# Pedidos claramente ajenos a la auditoría; sin una de estas frases un mensaje nunca es fuera de tema
+FRASES_FUERA_DE_TEMA = [
+    r"(cuentame|dime|escribe|escribeme|hazme) un (chiste|poema|cuento|cancion)", r"un chiste", r"receta de",
+    r"horoscopo", r"pronostico del tiempo", r"(el )?clima (de|en|para) (hoy|manana)", r"quien gano",
+    r"resultado del partido", r"traduce(me)?", r"quien eres", r"como te llamas",
+    r"codigo (en|de) (python|java|javascript)",
+]
+SALUDOS = [
+    r"hola", r"buen(os|as)? (dias|tardes|noches)", r"buenas", r"saludos", r"hey", r"que tal",
+    r"(muchas )?gracias", r"ok", r"vale", r"perfecto", r"adios", r"chao", r"hasta luego",
+]
+INTERROGATIVOS = [
+    r"que", r"como", r"cual(es)?", r"cuando", r"por ?que", r"para que", r"quien(es)?", r"donde",
+    r"cuantos?", r"explica(me)?", r"define", r"diferencia",
+]
+
+# Una sola expresión: cada grupo con nombre marca una señal y finditer las junta en una pasada
+_RE_SENALES = re.compile(
+    rf"(?P<saludo>^[?!\s]*(?:(?:{'|'.join(SALUDOS)})[\s!.,?]*)+$)"
+    rf"|(?P<caso_real>\b(?:{'|'.join(FRASES_CASO_REAL)})\b)"
+    rf"|(?P<iso>\b(?:{'|'.join(FRASES_ISO)})\b)"
+    rf"|(?P<dominio>\b(?:{'|'.join(FRASES_DOMINIO)})\b)"
+    rf"|(?P<fuera_de_tema>\b(?:{'|'.join(FRASES_FUERA_DE_TEMA)})\b)"
+    # Lookahead: la palabra interrogativa queda libre para las otras señales ("quien gano")
+    rf"|(?P<pregunta>^(?=[?!\s]*(?:{'|'.join(INTERROGATIVOS)})\b)|\?)"
+)
+_RE_ESPACIOS = re.compile(r"\s+")
+
+INTENCIONES = ("caso_real", "saludo", "muy_corto", "pregunta_iso", "fuera_de_tema", "caso")
+
+
+def plegar(texto):
+    """Minúsculas, sin tildes y con un solo espacio entre palabras ("¿" y "¡" quedan como "?" y "!")"""
+    return _RE_ESPACIOS.sub(" ", unidecode(texto or "").lower()).strip()
+
+
+def senales(texto):
+    """Nombres de los grupos de _RE_SENALES que aparecen en el texto ya plegado"""
+    return {coincidencia.lastgroup for coincidencia in _RE_SENALES.finditer(texto)}
+
+
+def clasificar(texto, min_palabras=4, max_palabras_pregunta=40):
+    """Intención de un mensaje de /chat; "caso" es un caso de estudio para el análisis completo.
+
+    Las preguntas y los mensajes fuera de tema solo se reconocen si son cortos:
+    un texto largo se trata siempre como caso. Ante la duda también es "caso":
+    fuera de tema exige una frase de FRASES_FUERA_DE_TEMA sin nada de la norma
+    ni de una empresa, y una pregunta que además describe una empresa
+    ("La empresa no tiene registros. ¿Qué no conformidades hay?") es un caso.
+    """
+    plegado = plegar(texto)
+    encontradas = senales(plegado)
+    palabras = len(plegado.split())
+
+    if "caso_real" in encontradas:
+        return "caso_real"
+    if "saludo" in encontradas:
+        return "saludo"
+    if palabras < min_palabras:
+        # "ISO 9001?" o "no conformidad" se responden como pregunta; lo demás no alcanza para analizar
+        return "pregunta_iso" if "iso" in encontradas else "muy_corto"
+    if palabras <= max_palabras_pregunta:
+        tema = encontradas & {"iso", "dominio"}
+        if "pregunta" in encontradas and tema == {"iso"}:
+            return "pregunta_iso"
+        if "fuera_de_tema" in encontradas and not tema:
+            return "fuera_de_tema"
+    return "caso"
@@ -0,0 +1,81 @@
+import threading
+from collections import deque
+
+
+class _Lote:
+    def __init__(self, funciones):
+        self.pendientes = deque(enumerate(funciones))
+        self.resultados = [None] * len(funciones)
+        self.faltan = len(funciones)
+        self.terminado = threading.Event()
+        if not funciones:
+            self.terminado.set()
+
+    def completar(self, indice, resultado):
+        self.resultados[indice] = resultado
+        self.faltan -= 1
+        if self.faltan == 0:
+            self.terminado.set()
+
+
+class PlanificadorLotes:
+    """Pool acotado de hilos que reparte el trabajo de varios lotes por turnos.
+
+    Cada hilo toma un ítem del lote que está al frente y lo manda al final de
+    la fila, así un lote de 200 casos no deja esperando a uno de 3 que llegó
+    después. Los hilos se crean con el primer lote.
+    """
+
+    def __init__(self, hilos):
+        self.hilos = hilos
+        self._fila = deque()
+        self._condicion = threading.Condition()
+        self._iniciado = False
+
+    def ejecutar(self, funciones, timeout=None):
+        """Corre cada función sin argumentos y devuelve, en orden, ("ok", valor) o ("error", mensaje)"""
+        lote = _Lote(list(funciones))
+        with self._condicion:
+            self._iniciar()
+            if lote.pendientes:
+                self._fila.append(lote)
+                self._condicion.notify_all()
+
+        if not lote.terminado.wait(timeout):
+            with self._condicion:
+                if lote in self._fila:
+                    self._fila.remove(lote)
+                while lote.pendientes:
+                    indice, _ = lote.pendientes.popleft()
+                    lote.completar(indice, ("error", "Tiempo de espera agotado"))
+            # Los ítems que ya estaban corriendo terminan solos; no se espera por ellos
+            return [r if r is not None else ("error", "Tiempo de espera agotado") for r in lote.resultados]
+        return lote.resultados
+
+    def pendientes(self):
+        with self._condicion:
+            return sum(len(lote.pendientes) for lote in self._fila)
+
+    def _iniciar(self):
+        if self._iniciado:
+            return
+        for numero in range(self.hilos):
+            threading.Thread(target=self._trabajar, name=f"lote-{numero}", daemon=True).start()
+        self._iniciado = True
+
+    def _trabajar(self):
+        while True:
+            with self._condicion:
+                while not self._fila:
+                    self._condicion.wait()
+                lote = self._fila.popleft()
+                indice, funcion = lote.pendientes.popleft()
+                if lote.pendientes:
+                    self._fila.append(lote)
+
+            try:
+                resultado = ("ok", funcion())
+            except Exception as e:
+                resultado = ("error", str(e))
+            with self._condicion:
+                lote.completar(indice, resultado)
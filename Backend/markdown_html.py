@@ -0,0 +1,114 @@
+import re
+
+from metricas import medir
+
+
+# Patrones compilados una sola vez al importar el módulo
+_RE_ETIQUETA = re.compile(r'<[^>]+>')
+# \1 absorbe el asterisco extra de ***texto*** para no dejarlo suelto dentro del <strong>
+_RE_NEGRITA = re.compile(r'\*\*(\**)(.*?)\1\*\*')
+
+
+def _convertir_lineas(texto, en_lista, html_lines):
+    """Clasifica cada línea (encabezado, viñeta, párrafo o vacía) en una sola pasada.
+
+    Recibe texto ya sin etiquetas, agrega el HTML a html_lines y devuelve si
+    la última línea quedó dentro de una lista.
+    """
+    # Las negritas nunca cruzan saltos de línea: basta una sustitución sobre todo el bloque
+    if '**' in texto:
+        texto = _RE_NEGRITA.sub(r'<strong>\2</strong>', texto)
+
+    agregar = html_lines.append
+    for line in texto.split('\n'):
+        if line[:4] == '### ':
+            line = f"<h3>{line[4:]}</h3>"
+        else:
+            line = line.strip()
+
+        if line[:1] == '*':
+            if not en_lista:
+                agregar('<ul>')
+                en_lista = True
+            agregar(f"<li>{line[1:].strip()}</li>")
+        else:
+            if en_lista:
+                agregar('</ul>')
+                en_lista = False
+            agregar(f"<p>{line}</p>" if line else "<br>")
+    return en_lista
+
+
+def markdown_to_html(text):
+    with medir("markdown_to_html"):
+        # ❗ Eliminar cualquier etiqueta HTML residual que se haya colado del modelo
+        if '<' in text:
+            text = _RE_ETIQUETA.sub('', text)
+
+        html_lines = []
+        if _convertir_lineas(text, False, html_lines):
+            html_lines.append('</ul>')
+        return '\n'.join(html_lines)
+
+
+class MarkdownIncremental:
+    """Versión por fragmentos de markdown_to_html para respuestas en streaming.
+
+    Solo convierte líneas completas; retiene la línea en curso, las etiquetas
+    sin cerrar y el espacio final, así que la concatenación de lo emitido es
+    igual a markdown_to_html(texto.strip()).
+    """
+
+    def __init__(self):
+        self._pendiente = ""
+        self._iniciado = False
+        self._en_lista = False
+        self._hay_salida = False
+
+    def alimentar(self, fragmento):
+        if not self._iniciado:
+            fragmento = fragmento.lstrip()
+            if not fragmento:
+                return ""
+            self._iniciado = True
+
+        self._pendiente += fragmento
+        nucleo = self._pendiente.rstrip()
+
+        # Una etiqueta abierta puede cerrarse en un fragmento posterior, y un
+        # salto de línea dentro de una etiqueta no es un corte válido
+        abierta = nucleo.find('<', nucleo.rfind('>') + 1)
+        limite = abierta if abierta != -1 else len(nucleo)
+        corte = nucleo.rfind('\n', 0, limite)
+        if corte != -1 and '<' in nucleo:
+            etiquetas = [m.span() for m in _RE_ETIQUETA.finditer(nucleo, 0, limite)]
+            while corte != -1 and any(inicio < corte < fin for inicio, fin in etiquetas):
+                corte = nucleo.rfind('\n', 0, corte)
+        if corte == -1:
+            return ""
+
+        self._pendiente = self._pendiente[corte + 1:]
+        return self._convertir(_RE_ETIQUETA.sub('', nucleo[:corte]))
+
+    def cerrar(self):
+        nucleo = _RE_ETIQUETA.sub('', self._pendiente.rstrip())
+        self._pendiente = ""
+        html = self._convertir(nucleo)
+        if self._en_lista:
+            self._en_lista = False
+            html += self._unir(['</ul>'])
+        return html
+
+    def _convertir(self, texto):
+        html_lines = []
+        self._en_lista = _convertir_lineas(texto, self._en_lista, html_lines)
+        return self._unir(html_lines)
+
+    def _unir(self, html_lines):
+        if not html_lines:
+            return ""
+        html = '\n'.join(html_lines)
+        if self._hay_salida:
+            html = '\n' + html
+        self._hay_salida = True
+        return html
@@ -0,0 +1,204 @@
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _etiquetas_texto(etiquetas):
+    if not etiquetas:
+        return ""
+    partes = []
+    for clave, valor in etiquetas:
+        valor = str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        partes.append(f'{clave}="{valor}"')
+    return "{" + ",".join(partes) + "}"
+
+
+def _clave(etiquetas):
+    return tuple(sorted((k, str(v)) for k, v in etiquetas.items()))
+
+
+class Contador:
+    tipo = "counter"
+
+    def __init__(self, nombre, ayuda):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def inc(self, cantidad=1, **etiquetas):
+        clave = _clave(etiquetas)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + cantidad
+
+    def exponer(self):
+        with self._lock:
+            return [f"{self.nombre}{_etiquetas_texto(c)} {v}" for c, v in sorted(self._valores.items())]
+
+
+class Medidor(Contador):
+    tipo = "gauge"
+
+    def dec(self, cantidad=1, **etiquetas):
+        self.inc(-cantidad, **etiquetas)
+
+    def fijar(self, valor, **etiquetas):
+        clave = _clave(etiquetas)
+        with self._lock:
+            self._valores[clave] = valor
+
+
+class Histograma:
+    tipo = "histogram"
+
+    def __init__(self, nombre, ayuda, buckets=BUCKETS_SEGUNDOS):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observar(self, valor, **etiquetas):
+        clave = _clave(etiquetas)
+        with self._lock:
+            serie = self._series.get(clave)
+            if serie is None:
+                serie = self._series[clave] = [[0] * len(self.buckets), 0.0, 0]
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    serie[0][i] += 1
+                    break
+            serie[1] += valor
+            serie[2] += 1
+
+    def exponer(self):
+        lineas = []
+        with self._lock:
+            for clave, (conteos, suma, total) in sorted(self._series.items()):
+                acumulado = 0
+                for limite, conteo in zip(self.buckets, conteos):
+                    acumulado += conteo
+                    lineas.append(f"{self.nombre}_bucket{_etiquetas_texto(clave + (('le', str(limite)),))} {acumulado}")
+                lineas.append(f"{self.nombre}_bucket{_etiquetas_texto(clave + (('le', '+Inf'),))} {total}")
+                lineas.append(f"{self.nombre}_sum{_etiquetas_texto(clave)} {suma}")
+                lineas.append(f"{self.nombre}_count{_etiquetas_texto(clave)} {total}")
+        return lineas
+
+
+class Registro:
+    def __init__(self):
+        self._metricas = {}
+        self._lock = threading.Lock()
+
+    def _obtener(self, clase, nombre, ayuda, **kwargs):
+        with self._lock:
+            metrica = self._metricas.get(nombre)
+            if metrica is None:
+                metrica = self._metricas[nombre] = clase(nombre, ayuda, **kwargs)
+            return metrica
+
+    def contador(self, nombre, ayuda=""):
+        return self._obtener(Contador, nombre, ayuda)
+
+    def medidor(self, nombre, ayuda=""):
+        return self._obtener(Medidor, nombre, ayuda)
+
+    def histograma(self, nombre, ayuda="", buckets=BUCKETS_SEGUNDOS):
+        return self._obtener(Histograma, nombre, ayuda, buckets=buckets)
+
+    def exponer(self):
+        """Formato de texto de Prometheus (0.0.4)"""
+        with self._lock:
+            metricas = sorted(self._metricas.values(), key=lambda m: m.nombre)
+        lineas = []
+        for metrica in metricas:
+            lineas.append(f"# HELP {metrica.nombre} {metrica.ayuda}")
+            lineas.append(f"# TYPE {metrica.nombre} {metrica.tipo}")
+            lineas.extend(metrica.exponer())
+        return "\n".join(lineas) + "\n"
+
+
+REGISTRO = Registro()
+DURACION_ETAPA = REGISTRO.histograma("etapa_duracion_segundos", "Duración de cada etapa instrumentada")
+ETAPAS_EN_CURSO = REGISTRO.medidor("etapas_en_curso", "Etapas ejecutándose en este momento")
+ERRORES_ETAPA = REGISTRO.contador("etapa_errores_total", "Etapas que terminaron con excepción")
+
+
+class ExportadorTrazas:
+    """Escribe cada span como una línea JSON en un archivo local"""
+
+    def __init__(self, ruta):
+        directorio = os.path.dirname(ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        self._archivo = open(ruta, "a", encoding="utf-8", buffering=1)
+        self._lock = threading.Lock()
+
+    def exportar(self, span):
+        linea = json.dumps(span, ensure_ascii=False)
+        with self._lock:
+            self._archivo.write(linea + "\n")
+
+
+_EXPORTADOR = ExportadorTrazas(os.environ["TRAZAS_ARCHIVO"]) if os.getenv("TRAZAS_ARCHIVO") else None
+_SPAN_ACTUAL = contextvars.ContextVar("span_actual", default=None)
+
+
+@contextmanager
+def span(nombre, **etiquetas):
+    """Span de traza: hereda la traza del span actual y se exporta al cerrar si hay exportador"""
+    padre = _SPAN_ACTUAL.get()
+    actual = {
+        "traza": padre["traza"] if padre else uuid.uuid4().hex,
+        "id": uuid.uuid4().hex[:16],
+        "padre": padre["id"] if padre else None,
+        "nombre": nombre,
+        "inicio": time.time(),
+        "etiquetas": etiquetas,
+        "error": None,
+    }
+    token = _SPAN_ACTUAL.set(actual)
+    inicio = time.perf_counter()
+    try:
+        yield actual
+    except BaseException as e:
+        actual["error"] = type(e).__name__
+        raise
+    finally:
+        actual["duracion"] = time.perf_counter() - inicio
+        try:
+            _SPAN_ACTUAL.reset(token)
+        except ValueError:
+            # Un generador de streaming cerrado desde otro contexto
+            _SPAN_ACTUAL.set(None)
+        if _EXPORTADOR is not None:
+            _EXPORTADOR.exportar({**actual, "duracion": round(actual["duracion"], 6)})
+
+
+@contextmanager
+def medir(etapa, **etiquetas):
+    """Mide una etapa: histograma de duración, gauge de en curso y span de traza"""
+    ETAPAS_EN_CURSO.inc(etapa=etapa)
+    actual = None
+    try:
+        with span(etapa, **etiquetas) as actual:
+            yield actual
+    finally:
+        ETAPAS_EN_CURSO.dec(etapa=etapa)
+        if actual is not None:
+            DURACION_ETAPA.observar(actual["duracion"], etapa=etapa, **etiquetas)
+            if actual["error"] is not None:
+                ERRORES_ETAPA.inc(etapa=etapa, error=actual["error"], **etiquetas)
+
+
+def con_contexto(funcion):
+    """Envuelve funcion para que corra en otro hilo con el span actual como padre"""
+    contexto = contextvars.copy_context()
+    return lambda *args, **kwargs: contexto.run(funcion, *args, **kwargs)
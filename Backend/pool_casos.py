@@ -0,0 +1,139 @@
+import threading
+import time
+from collections import deque
+
+
+class PoolCasos:
+    """Reserva de casos pregenerados por combinación de filtros.
+
+    Mantiene hasta `por_combinacion` casos sin usar para las combinaciones más
+    pedidas (y las semillas), los repone en segundo plano a medida que se
+    consumen y entrega cada caso una sola vez. Los casos más viejos que `ttl`
+    se descartan.
+
+    La demanda de cada combinación es un conteo que decae a la mitad cada
+    `vida_media` segundos; una combinación es popular recién cuando llega a
+    `min_demanda` (con 2.5, unos tres pedidos dentro de la vida media), así
+    los pedidos sueltos no disparan pregeneración. Se recuerdan a lo sumo
+    `max_demanda` combinaciones: al pasarse se olvidan las de menor demanda.
+    """
+
+    def __init__(
+        self, generar, por_combinacion=3, max_combinaciones=8, ttl=24 * 3600, semillas=(), hilos=1,
+        min_demanda=2.5, vida_media=3600, max_demanda=1000,
+    ):
+        self.generar = generar
+        self.por_combinacion = por_combinacion
+        self.max_combinaciones = max_combinaciones
+        self.ttl = ttl
+        self.hilos = hilos
+        self.min_demanda = min_demanda
+        self.vida_media = vida_media
+        self.max_demanda = max_demanda
+        self._semillas = [tuple(s) for s in semillas]
+        self._casos = {}
+        self._demanda = {}  # clave -> (demanda decaída, momento de la última actualización)
+        self._candidatas = set()  # claves que alcanzaron min_demanda; _populares solo mira estas
+        self._reponer = deque()
+        self._en_cola = set()
+        self._condicion = threading.Condition()
+        self._iniciado = False
+        self.contadores = {"aciertos": 0, "fallos": 0, "generados": 0, "descartados": 0, "errores": 0}
+
+    def tomar(self, clave):
+        """Devuelve un caso listo para la combinación o None si hay que generarlo en vivo"""
+        clave = tuple(clave)
+        with self._condicion:
+            self._iniciar()
+            self._sumar_demanda(clave)
+            casos = self._casos.get(clave)
+            caso = None
+            while casos:
+                creado, candidato = casos.popleft()
+                if time.time() - creado <= self.ttl:
+                    caso = candidato
+                    break
+                self.contadores["descartados"] += 1
+            self.contadores["aciertos" if caso is not None else "fallos"] += 1
+            self._programar(clave)
+            return caso
+
+    def estadisticas(self):
+        with self._condicion:
+            return {
+                **self.contadores,
+                "combinaciones": {
+                    " / ".join(clave): len(casos) for clave, casos in self._casos.items()
+                },
+                "populares": [" / ".join(clave) for clave in self._populares()],
+                "pendientes_reposicion": len(self._reponer),
+            }
+
+    def _demanda_actual(self, clave, ahora):
+        valor, momento = self._demanda.get(clave, (0.0, ahora))
+        return valor * 0.5 ** ((ahora - momento) / self.vida_media)
+
+    def _sumar_demanda(self, clave):
+        ahora = time.monotonic()
+        valor = self._demanda_actual(clave, ahora) + 1
+        self._demanda[clave] = (valor, ahora)
+        if valor >= self.min_demanda:
+            self._candidatas.add(clave)
+        if len(self._demanda) > self.max_demanda:
+            # Se olvida la mitad menos pedida de una vez, para no ordenar en cada pedido
+            conservar = sorted(self._demanda, key=lambda c: self._demanda_actual(c, ahora), reverse=True)
+            self._demanda = {c: self._demanda[c] for c in conservar[: self.max_demanda // 2]}
+            self._candidatas &= self._demanda.keys()
+
+    def _populares(self):
+        ahora = time.monotonic()
+        demanda = {clave: self._demanda_actual(clave, ahora) for clave in self._candidatas}
+        self._candidatas = {clave for clave, valor in demanda.items() if valor >= self.min_demanda}
+        populares = sorted(self._candidatas, key=demanda.get, reverse=True)[: self.max_combinaciones]
+        for semilla in self._semillas:
+            if semilla not in populares:
+                populares.append(semilla)
+        return populares
+
+    def _programar(self, clave):
+        if self.por_combinacion <= 0 or clave in self._en_cola or clave not in self._populares():
+            return
+        if len(self._casos.get(clave, ())) >= self.por_combinacion:
+            return
+        self._en_cola.add(clave)
+        self._reponer.append(clave)
+        self._condicion.notify()
+
+    def _iniciar(self):
+        if self._iniciado or self.por_combinacion <= 0:
+            return
+        self._iniciado = True
+        for semilla in self._semillas:
+            self._programar(semilla)
+        for numero in range(self.hilos):
+            threading.Thread(target=self._trabajar, name=f"pool-casos-{numero}", daemon=True).start()
+
+    def _trabajar(self):
+        while True:
+            with self._condicion:
+                while not self._reponer:
+                    self._condicion.wait()
+                clave = self._reponer.popleft()
+                self._en_cola.discard(clave)
+                # Una combinación que dejó de ser popular no se repone
+                if clave not in self._populares() or len(self._casos.get(clave, ())) >= self.por_combinacion:
+                    continue
+
+            try:
+                caso = self.generar(clave)
+            except Exception as e:
+                print(f"❌ Error pregenerando caso {clave}: {str(e)}")
+                with self._condicion:
+                    self.contadores["errores"] += 1
+                time.sleep(5)
+                continue
+
+            with self._condicion:
+                self._casos.setdefault(clave, deque()).append((time.time(), caso))
+                self.contadores["generados"] += 1
+                self._programar(clave)
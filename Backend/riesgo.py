@@ -0,0 +1,193 @@
+import csv
+import io
+import itertools
+from array import array
+
+import numpy as np
+from unidecode import unidecode
+
+
+UMBRAL_ALTO = 12
+UMBRAL_MEDIO = 6
+NIVELES = ("Bajo", "Medio", "Alto")
+ESCALA = 5
+PERCENTILES = (50, 75, 90, 95, 99)
+MAX_EJEMPLOS_INVALIDOS = 10
+
+
+class RegistroRechazado(ValueError):
+    """El registro de riesgos no se puede leer o supera los límites configurados"""
+
+
+def clasificar(impacto, probabilidad):
+    """Riesgo (impacto x probabilidad) e índice en NIVELES; acepta escalares o arreglos"""
+    riesgo = np.multiply(impacto, probabilidad)
+    return riesgo, (riesgo >= UMBRAL_MEDIO).astype(np.int8) + (riesgo >= UMBRAL_ALTO)
+
+
+def evaluar(impacto, probabilidad):
+    """Evaluación de un solo par, con la forma que devuelve /evaluar_riesgo"""
+    riesgo, nivel = clasificar(impacto, probabilidad)
+    return {"impacto": impacto, "probabilidad": probabilidad, "riesgo": int(riesgo), "nivel": NIVELES[int(nivel)]}
+
+
+def a_enteros(valores):
+    """Arreglo int16 con los valores enteros entre 1 y ESCALA; lo que no lo es queda en 0 (inválido)"""
+    numeros = None
+    # NumPy convierte true/false de JSON en 1/0 (también sin dtype, junto a enteros): con algún
+    # bool se va directo al camino ítem por ítem, que los deja inválidos
+    if set(map(type, valores)).isdisjoint((bool, np.bool_)):
+        try:
+            numeros = np.asarray(valores, dtype=np.float64)
+        except (TypeError, ValueError):
+            pass
+    if numeros is None:
+        # Mezcla de números y textos: se convierte ítem por ítem
+        numeros = np.array([_a_numero(valor) for valor in valores], dtype=np.float64)
+    if numeros.ndim != 1:
+        raise RegistroRechazado("Se esperaba una lista de valores.")
+    validos = (numeros >= 1) & (numeros <= ESCALA) & (numeros == np.floor(numeros))
+    return np.where(validos, numeros, 0).astype(np.int16)
+
+
+def _a_numero(valor):
+    if isinstance(valor, (bool, np.bool_)):
+        return np.nan
+    try:
+        return float(str(valor).strip().replace(",", "."))
+    except ValueError:
+        return np.nan
+
+
+def leer_json(data, max_filas):
+    """(impactos, probabilidades) de {"impacto": [...], "probabilidad": [...]} o {"riesgos": [{...}, ...]}"""
+    data = data or {}
+    if not isinstance(data, dict):
+        raise RegistroRechazado("Se esperaba un objeto JSON con 'impacto' y 'probabilidad' o con 'riesgos'.")
+    if "riesgos" in data:
+        riesgos = data["riesgos"]
+        if not isinstance(riesgos, list):
+            raise RegistroRechazado("'riesgos' debe ser una lista de objetos con impacto y probabilidad.")
+        impactos = [item.get("impacto") if isinstance(item, dict) else None for item in riesgos]
+        probabilidades = [item.get("probabilidad") if isinstance(item, dict) else None for item in riesgos]
+    else:
+        impactos, probabilidades = data.get("impacto"), data.get("probabilidad")
+        if not isinstance(impactos, list) or not isinstance(probabilidades, list):
+            raise RegistroRechazado("Se esperaban las listas 'impacto' y 'probabilidad' o la lista 'riesgos'.")
+        if len(impactos) != len(probabilidades):
+            raise RegistroRechazado("'impacto' y 'probabilidad' deben tener el mismo largo.")
+    if len(impactos) > max_filas:
+        raise RegistroRechazado(f"El registro supera el máximo de {max_filas} riesgos.")
+    return a_enteros(impactos), a_enteros(probabilidades)
+
+
+def leer_csv(flujo, max_filas):
+    """(impactos, probabilidades) de un CSV leído fila a fila desde un flujo binario.
+
+    Acepta coma o punto y coma como separador. Si la primera fila tiene las
+    columnas "impacto" y "probabilidad" se usan esas; si no, las dos primeras.
+    Las filas se acumulan en arreglos compactos, sin listas de filas en memoria.
+    """
+    texto = io.TextIOWrapper(io.BufferedReader(_FlujoBinario(flujo)), encoding="utf-8-sig", errors="replace", newline="")
+    primera = texto.readline()
+    if not primera.strip():
+        raise RegistroRechazado("El CSV está vacío.")
+    separador = ";" if primera.count(";") > primera.count(",") else ","
+    encabezado = next(csv.reader([primera], delimiter=separador))
+    nombres = [unidecode(celda).strip().lower() for celda in encabezado]
+
+    filas = csv.reader(texto, delimiter=separador)
+    if "impacto" in nombres and "probabilidad" in nombres:
+        columnas = nombres.index("impacto"), nombres.index("probabilidad")
+    else:
+        # Sin encabezado: la primera fila ya es un riesgo
+        columnas = 0, 1
+        filas = itertools.chain([encabezado], filas)
+
+    impactos, probabilidades = array("h"), array("h")
+    necesarias = max(columnas) + 1
+    for fila in filas:
+        if not fila or not any(celda.strip() for celda in fila):
+            continue
+        if len(impactos) >= max_filas:
+            raise RegistroRechazado(f"El registro supera el máximo de {max_filas} riesgos.")
+        if len(fila) < necesarias:
+            impactos.append(0)
+            probabilidades.append(0)
+            continue
+        impactos.append(_celda_entera(fila[columnas[0]]))
+        probabilidades.append(_celda_entera(fila[columnas[1]]))
+    return np.frombuffer(impactos, dtype=np.int16), np.frombuffer(probabilidades, dtype=np.int16)
+
+
+class _FlujoBinario(io.RawIOBase):
+    """Adapta cualquier objeto con read() a lo que pide TextIOWrapper.
+
+    En Python < 3.11 el SpooledTemporaryFile de los archivos subidos no tiene
+    readable(). Además, cerrar el adaptador no cierra el flujo original.
+    """
+
+    def __init__(self, flujo):
+        self._flujo = flujo
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        datos = self._flujo.read(len(buffer))
+        buffer[:len(datos)] = datos
+        return len(datos)
+
+
+def _celda_entera(celda):
+    try:
+        valor = float(celda.strip().replace(",", "."))
+    except ValueError:
+        return 0
+    return int(valor) if 1 <= valor <= ESCALA and valor == int(valor) else 0
+
+
+def agregar(impactos, probabilidades, detalle=False):
+    """Puntúa el registro completo en una pasada y arma el mapa de calor, la distribución y los percentiles.
+
+    Las filas con impacto o probabilidad fuera de 1..ESCALA se cuentan como
+    inválidas y no entran en los agregados; con detalle, su entrada es None.
+    """
+    validos = (impactos > 0) & (probabilidades > 0)
+    riesgo, niveles = clasificar(impactos.astype(np.int32), probabilidades.astype(np.int32))
+    riesgo_validos = riesgo[validos]
+    total_validos = int(validos.sum())
+
+    # Mapa de calor: filas = impacto 1..5, columnas = probabilidad 1..5
+    celdas = (impactos[validos].astype(np.intp) - 1) * ESCALA + (probabilidades[validos] - 1)
+    mapa = np.bincount(celdas, minlength=ESCALA * ESCALA).reshape(ESCALA, ESCALA)
+    conteo_niveles = np.bincount(niveles[validos], minlength=len(NIVELES))
+
+    resultado = {
+        "total": int(len(impactos)),
+        "validos": total_validos,
+        "invalidos": int(len(impactos) - total_validos),
+        "indices_invalidos": np.flatnonzero(~validos)[:MAX_EJEMPLOS_INVALIDOS].tolist(),
+        "distribucion": {nivel: int(cantidad) for nivel, cantidad in zip(NIVELES, conteo_niveles)},
+        "porcentajes": {
+            nivel: round(100 * int(cantidad) / total_validos, 2) if total_validos else None
+            for nivel, cantidad in zip(NIVELES, conteo_niveles)
+        },
+        "mapa_calor": {
+            "filas": "impacto 1..5",
+            "columnas": "probabilidad 1..5",
+            "conteos": mapa.tolist(),
+        },
+        "riesgo_medio": round(float(riesgo_validos.mean()), 2) if total_validos else None,
+        "percentiles": {
+            f"p{p}": int(valor) for p, valor in zip(
+                PERCENTILES, np.percentile(riesgo_validos, PERCENTILES, method="lower")
+            )
+        } if total_validos else {f"p{p}": None for p in PERCENTILES},
+    }
+    if detalle:
+        resultado["detalle"] = [
+            {"riesgo": valor, "nivel": NIVELES[nivel]} if valido else None
+            for valor, nivel, valido in zip(riesgo.tolist(), niveles.tolist(), validos.tolist())
+        ]
+    return resultado
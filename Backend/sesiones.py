@@ -0,0 +1,300 @@
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+_RE_ID = re.compile(r'[0-9a-f]{32}')
+
+
+class AlmacenSesiones:
+    """Sesiones de conversación: LRU acotado en memoria y, si hay directorio, volcado a disco.
+
+    Cada sesión guarda el caso analizado, los artefactos que se pueden citar
+    por id (caso, texto del PDF, respuestas) y los últimos turnos. Los turnos
+    más viejos se reemplazan por un resumen (ver turnos_a_compactar) para que
+    el historial que se reenvía al modelo no crezca sin límite.
+
+    La memoria se acota por cantidad de sesiones (max_memoria) y por el total
+    de caracteres guardados (max_caracteres), porque una sola sesión puede
+    llevar el texto completo de un PDF. Las sesiones expulsadas se escriben a
+    disco después de soltar el lock; quien pida una mientras se escribe espera
+    a que termine y la lee del archivo.
+    """
+
+    def __init__(
+        self, directorio=None, max_memoria=256, ttl=24 * 3600, max_turnos=6, turnos_a_conservar=2,
+        max_caracteres=64 * 1024 * 1024,
+    ):
+        self.directorio = directorio
+        self.max_memoria = max_memoria
+        self.max_caracteres = max_caracteres
+        self.ttl = ttl
+        self.max_turnos = max_turnos
+        self.turnos_a_conservar = turnos_a_conservar
+        self._memoria = OrderedDict()
+        self._caracteres = {}
+        self._lock = threading.Lock()
+        self._volcado_listo = threading.Condition(self._lock)
+        self._por_volcar = []
+        self._volcando = set()
+        self._ultima_limpieza = 0.0
+        self.contadores = {"creadas": 0, "volcadas": 0, "recuperadas": 0, "vencidas": 0, "compactaciones": 0}
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+
+    def crear(self):
+        ahora = time.time()
+        sesion = {
+            "id": uuid.uuid4().hex,
+            "creado": ahora,
+            "actualizado": ahora,
+            "caso": None,
+            "resumen": None,
+            "turnos": [],
+            "artefactos": {},
+            "ultima_respuesta": None,
+            "siguiente_artefacto": 1,
+        }
+        with self._bloqueado():
+            self._guardar_en_memoria(sesion)
+            self.contadores["creadas"] += 1
+            # Como mucho una vez por hora, al crear sesiones
+            limpiar = bool(self.directorio) and ahora - self._ultima_limpieza >= 3600
+            if limpiar:
+                self._ultima_limpieza = ahora
+        if limpiar:
+            self._limpiar_disco(ahora)
+        return sesion["id"]
+
+    def existe(self, id_sesion):
+        with self._bloqueado():
+            return self._sesion(id_sesion) is not None
+
+    def describir(self, id_sesion):
+        """Metadatos de la sesión sin los textos completos"""
+        with self._bloqueado():
+            sesion = self._sesion(id_sesion)
+            if sesion is None:
+                return None
+            return {
+                "session_id": sesion["id"],
+                "creado": sesion["creado"],
+                "actualizado": sesion["actualizado"],
+                "turnos": len(sesion["turnos"]) // 2,
+                "compactada": sesion["resumen"] is not None,
+                "ultima_respuesta": sesion["ultima_respuesta"],
+                "artefactos": {
+                    id_artefacto: {"tipo": artefacto["tipo"], "caracteres": len(artefacto["texto"])}
+                    for id_artefacto, artefacto in sesion["artefactos"].items()
+                },
+            }
+
+    def artefacto(self, id_sesion, id_artefacto=None):
+        """Texto de un artefacto; sin id, la última respuesta de la sesión"""
+        with self._bloqueado():
+            sesion = self._sesion(id_sesion)
+            if sesion is None:
+                return None
+            artefacto = sesion["artefactos"].get(id_artefacto or sesion["ultima_respuesta"])
+            return artefacto["texto"] if artefacto else None
+
+    def registrar_analisis(self, id_sesion, caso, respuesta_html, respuesta_texto, texto_pdf=None):
+        """Fija el caso de la sesión y guarda el análisis como primer intercambio"""
+        with self._bloqueado():
+            sesion = self._sesion(id_sesion)
+            if sesion is None:
+                return {}
+            ids = {"session_id": id_sesion}
+            if texto_pdf is not None:
+                ids["texto_pdf_id"] = self._agregar_artefacto(sesion, "texto_pdf", texto_pdf)
+            sesion["caso"] = caso
+            ids["caso_id"] = self._agregar_artefacto(sesion, "caso", caso)
+            ids["respuesta_id"] = self._agregar_artefacto(sesion, "respuesta", respuesta_html)
+            sesion["ultima_respuesta"] = ids["respuesta_id"]
+            sesion["turnos"].extend([
+                {"role": "user", "parts": ["Analiza el caso según la norma ISO 9001."]},
+                {"role": "model", "parts": [respuesta_texto]},
+            ])
+            sesion["actualizado"] = time.time()
+            self._medir(sesion)
+            return ids
+
+    def conversacion(self, id_sesion):
+        """(caso, resumen de lo compactado, turnos recientes) o None si la sesión no existe"""
+        with self._bloqueado():
+            sesion = self._sesion(id_sesion)
+            if sesion is None:
+                return None
+            return sesion["caso"], sesion["resumen"], list(sesion["turnos"])
+
+    def agregar_turno(self, id_sesion, pregunta, respuesta_html, respuesta_texto):
+        with self._bloqueado():
+            sesion = self._sesion(id_sesion)
+            if sesion is None:
+                return None
+            sesion["turnos"].extend([
+                {"role": "user", "parts": [pregunta]},
+                {"role": "model", "parts": [respuesta_texto]},
+            ])
+            id_respuesta = self._agregar_artefacto(sesion, "respuesta", respuesta_html)
+            sesion["ultima_respuesta"] = id_respuesta
+            sesion["actualizado"] = time.time()
+            self._medir(sesion)
+            return id_respuesta
+
+    def turnos_a_compactar(self, id_sesion):
+        """(resumen previo, turnos viejos) si la sesión pasó de max_turnos; si no, None"""
+        with self._bloqueado():
+            sesion = self._sesion(id_sesion)
+            if sesion is None or len(sesion["turnos"]) <= self.max_turnos * 2:
+                return None
+            viejos = sesion["turnos"][:-self.turnos_a_conservar * 2]
+            return sesion["resumen"], list(viejos)
+
+    def aplicar_resumen(self, id_sesion, resumen, turnos_resumidos):
+        with self._bloqueado():
+            sesion = self._sesion(id_sesion)
+            cantidad = len(turnos_resumidos)
+            # Otra compactación pudo adelantarse: solo se reemplazan si siguen al frente
+            if sesion is None or sesion["turnos"][:cantidad] != turnos_resumidos:
+                return False
+            sesion["resumen"] = resumen
+            del sesion["turnos"][:cantidad]
+            self.contadores["compactaciones"] += 1
+            self._medir(sesion)
+            return True
+
+    def estadisticas(self):
+        en_disco = len(self._archivos()) if self.directorio else 0
+        with self._lock:
+            return {
+                **self.contadores,
+                "en_memoria": len(self._memoria),
+                "caracteres_en_memoria": sum(self._caracteres.values()),
+                "en_disco": en_disco,
+            }
+
+    @contextmanager
+    def _bloqueado(self):
+        """Toma el lock; al soltarlo escribe a disco las sesiones que se expulsaron mientras tanto"""
+        try:
+            with self._lock:
+                yield
+        finally:
+            if self._por_volcar:
+                self._volcar_expulsadas()
+
+    def _agregar_artefacto(self, sesion, tipo, texto):
+        id_artefacto = f"{tipo}-{sesion['siguiente_artefacto']}"
+        sesion["siguiente_artefacto"] += 1
+        sesion["artefactos"][id_artefacto] = {"tipo": tipo, "texto": texto}
+        return id_artefacto
+
+    def _sesion(self, id_sesion):
+        if not isinstance(id_sesion, str) or not _RE_ID.fullmatch(id_sesion):
+            return None
+        ahora = time.time()
+        # Expulsada y todavía escribiéndose: wait suelta el lock hasta que el archivo esté completo
+        while id_sesion in self._volcando:
+            self._volcado_listo.wait()
+        sesion = self._memoria.get(id_sesion)
+        if sesion is None:
+            sesion = self._leer_disco(id_sesion)
+            if sesion is None:
+                return None
+        if ahora - sesion["actualizado"] > self.ttl:
+            self._memoria.pop(id_sesion, None)
+            self._caracteres.pop(id_sesion, None)
+            self.contadores["vencidas"] += 1
+            return None
+        self._guardar_en_memoria(sesion)
+        return sesion
+
+    def _guardar_en_memoria(self, sesion):
+        nueva = sesion["id"] not in self._memoria
+        self._memoria[sesion["id"]] = sesion
+        self._memoria.move_to_end(sesion["id"])
+        if nueva:
+            self._medir(sesion)
+
+    def _medir(self, sesion):
+        """Anota los caracteres de la sesión y expulsa las menos usadas si se pasó de algún tope.
+
+        La sesión medida es la más reciente, así que nunca se expulsa a sí misma
+        aunque sola pase de max_caracteres.
+        """
+        caracteres = len(sesion["caso"] or "") + len(sesion["resumen"] or "")
+        caracteres += sum(len(artefacto["texto"]) for artefacto in sesion["artefactos"].values())
+        caracteres += sum(len(parte) for turno in sesion["turnos"] for parte in turno["parts"])
+        self._caracteres[sesion["id"]] = caracteres
+        total = sum(self._caracteres.values())
+        while len(self._memoria) > 1 and (len(self._memoria) > self.max_memoria or total > self.max_caracteres):
+            id_expulsada, expulsada = self._memoria.popitem(last=False)
+            total -= self._caracteres.pop(id_expulsada)
+            if self.directorio:
+                self._volcando.add(id_expulsada)
+                self._por_volcar.append(expulsada)
+
+    def _volcar_expulsadas(self):
+        with self._lock:
+            expulsadas, self._por_volcar = self._por_volcar, []
+        for sesion in expulsadas:
+            volcada = self._volcar(sesion)
+            with self._lock:
+                self._volcando.discard(sesion["id"])
+                self.contadores["volcadas"] += volcada
+                self._volcado_listo.notify_all()
+
+    def _ruta(self, id_sesion):
+        return os.path.join(self.directorio, f"{id_sesion}.json")
+
+    def _volcar(self, sesion):
+        # Sin el lock: la sesión ya salió de memoria y nadie más la toca hasta que esté en disco
+        descriptor, temporal = tempfile.mkstemp(dir=self.directorio, suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "w", encoding="utf-8") as archivo:
+                json.dump(sesion, archivo, ensure_ascii=False)
+            os.replace(temporal, self._ruta(sesion["id"]))
+            return True
+        except OSError as e:
+            print(f"❌ No se pudo volcar la sesión {sesion['id']} a disco: {str(e)}")
+            if os.path.exists(temporal):
+                os.remove(temporal)
+            return False
+
+    def _leer_disco(self, id_sesion):
+        # La sesión vuelve a memoria y el archivo se borra: la copia en memoria manda
+        if not self.directorio:
+            return None
+        ruta = self._ruta(id_sesion)
+        try:
+            with open(ruta, encoding="utf-8") as archivo:
+                sesion = json.load(archivo)
+            os.remove(ruta)
+        except (OSError, ValueError):
+            return None
+        self.contadores["recuperadas"] += 1
+        return sesion
+
+    def _archivos(self):
+        return [nombre for nombre in os.listdir(self.directorio) if nombre.endswith(".json")]
+
+    def _limpiar_disco(self, ahora):
+        # Sin el lock: recorre todo el directorio
+        vencidas = 0
+        for nombre in self._archivos():
+            ruta = os.path.join(self.directorio, nombre)
+            try:
+                if ahora - os.path.getmtime(ruta) > self.ttl:
+                    os.remove(ruta)
+                    vencidas += 1
+            except OSError:
+                pass
+        with self._lock:
+            self.contadores["vencidas"] += vencidas
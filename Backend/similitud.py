@@ -0,0 +1,244 @@
+import os
+import re
+import threading
+import time
+
+import numpy as np
+from unidecode import unidecode
+
+
+_RE_NO_ALFANUMERICO = re.compile(r'[^a-z0-9]+')
+_RE_NO_ASCII = re.compile(r'[^\x00-\x7F]+')
+_MASCARA_64 = (1 << 64) - 1
+_VACIA = 0xFFFFFFFF
+# Cambia cuando cambia cómo se calcula la firma: un índice guardado con otra versión no sirve
+VERSION_FIRMA = 2
+# Ventanas que se hashean por vez; acota la memoria temporal con textos de PDF largos
+VENTANAS_POR_BLOQUE = 1 << 16
+
+
+def normalizar_caso(texto):
+    """Texto transliterado con unidecode (como el resto de la app), en minúsculas y con un solo espacio entre palabras"""
+    texto = texto or ""
+    if not texto.isascii():
+        # unidecode es carácter a carácter: basta con pasarle los tramos no ASCII
+        texto = _RE_NO_ASCII.sub(lambda tramo: unidecode(tramo.group()), texto)
+    return _RE_NO_ALFANUMERICO.sub(' ', texto.lower()).strip()
+
+
+def _mezclar(valores):
+    """Finalizador de splitmix64: reparte bien los bits de hashes polinomiales parecidos"""
+    valores = valores ^ (valores >> np.uint64(30))
+    valores *= np.uint64(0xBF58476D1CE4E5B9)
+    valores ^= valores >> np.uint64(27)
+    valores *= np.uint64(0x94D049BB133111EB)
+    return valores ^ (valores >> np.uint64(31))
+
+
+class IndiceSimilitud:
+    """Índice de casos casi repetidos con firmas MinHash sobre n-gramas de caracteres.
+
+    Las firmas viven en una matriz NumPy (capacidad x componentes) que se usa
+    como buffer circular: al llenarse, cada alta reemplaza a la más vieja. Las
+    bandas LSH dan los candidatos en O(bandas) búsquedas en diccionarios y la
+    similitud (Jaccard estimado) se calcula solo sobre ellos, así que consultar
+    no depende del tamaño del índice. Se persiste en un .npz desde un hilo
+    aparte, cada `guardar_cada` altas y como mucho una vez cada
+    `intervalo_guardado` segundos.
+    """
+
+    def __init__(self, ruta=None, capacidad=100_000, componentes=96, bandas=12, umbral=0.85,
+                 tamano_ngrama=5, semilla=9001, guardar_cada=64, intervalo_guardado=10.0):
+        if componentes % bandas:
+            raise ValueError("componentes debe ser múltiplo de bandas")
+        self.ruta = ruta
+        self.capacidad = capacidad
+        self.componentes = componentes
+        self.bandas = bandas
+        self.umbral = umbral
+        self.tamano_ngrama = tamano_ngrama
+        self.semilla = semilla
+        self.guardar_cada = guardar_cada
+        self.intervalo_guardado = intervalo_guardado
+
+        base = 1099511628211
+        self._pesos = np.array(
+            [pow(base, i, 1 << 64) for i in range(tamano_ngrama)], dtype=np.uint64
+        )
+        self._semilla = np.uint64(semilla * 0x9E3779B97F4A7C15 & _MASCARA_64)
+
+        self._firmas = np.zeros((capacidad, componentes), dtype=np.uint32)
+        self._huellas = [None] * capacidad
+        self._cubetas = [{} for _ in range(bandas)]
+        self._siguiente = 0
+        self._total = 0
+        self._sin_guardar = 0
+        self._lock = threading.Lock()
+        self._lock_escritura = threading.Lock()
+        self._hay_cambios = threading.Event()
+        self._hilo_guardado = None
+        self.contadores = {"consultas": 0, "aciertos": 0, "altas": 0}
+
+        if ruta and os.path.exists(ruta):
+            self._cargar()
+
+    def firma(self, texto):
+        """MinHash de una permutación: cada n-grama se hashea una vez y cae en una de las componentes.
+
+        Los n-gramas se procesan en bloques de VENTANAS_POR_BLOQUE y cada bloque
+        se junta con el mínimo acumulado, así un PDF de millones de caracteres
+        no arma todas las ventanas y hashes a la vez.
+        """
+        datos = np.frombuffer(normalizar_caso(texto).encode("ascii"), dtype=np.uint8)
+        if len(datos) < self.tamano_ngrama:
+            datos = np.pad(datos, (0, self.tamano_ngrama - len(datos)))
+        firma = np.full(self.componentes, _VACIA, dtype=np.uint32)
+        total = len(datos) - self.tamano_ngrama + 1
+        for inicio in range(0, total, VENTANAS_POR_BLOQUE):
+            bloque = datos[inicio:min(inicio + VENTANAS_POR_BLOQUE, total) + self.tamano_ngrama - 1]
+            ventanas = np.lib.stride_tricks.sliding_window_view(bloque, self.tamano_ngrama).astype(np.uint64)
+            hashes = _mezclar(ventanas @ self._pesos ^ self._semilla)
+            componentes = ((hashes >> np.uint64(32)) % np.uint64(self.componentes)).astype(np.intp)
+            np.minimum.at(firma, componentes, (hashes & np.uint64(_VACIA)).astype(np.uint32))
+
+        vacias = firma == _VACIA
+        if vacias.any():
+            # Textos cortos: cada componente vacía copia la siguiente con valor (densificación por rotación)
+            llenas = np.flatnonzero(~vacias)
+            posiciones = np.flatnonzero(vacias)
+            siguiente = llenas[np.searchsorted(llenas, posiciones) % len(llenas)]
+            distancia = (siguiente - posiciones) % self.componentes
+            firma[posiciones] = firma[siguiente] + (distancia * 0x9E3779B1).astype(np.uint32)
+        return firma
+
+    def buscar(self, texto):
+        """(huella, similitud) del caso más parecido por encima del umbral, o None"""
+        firma = self.firma(texto)
+        claves = self._claves_bandas(firma)
+        with self._lock:
+            self.contadores["consultas"] += 1
+            candidatos = set()
+            for banda, clave in enumerate(claves):
+                candidatos.update(self._cubetas[banda].get(clave, ()))
+            if not candidatos:
+                return None
+            filas = np.fromiter(candidatos, dtype=np.int64, count=len(candidatos))
+            similitudes = (self._firmas[filas] == firma).mean(axis=1)
+            mejor = int(similitudes.argmax())
+            if similitudes[mejor] < self.umbral:
+                return None
+            self.contadores["aciertos"] += 1
+            return self._huellas[filas[mejor]], float(similitudes[mejor])
+
+    def agregar(self, texto, huella):
+        firma = self.firma(texto)
+        claves = self._claves_bandas(firma)
+        with self._lock:
+            self._insertar(firma, claves, huella)
+            self.contadores["altas"] += 1
+            self._sin_guardar += 1
+            pendiente = self.ruta and self._sin_guardar >= self.guardar_cada
+            if pendiente and self._hilo_guardado is None:
+                self._hilo_guardado = threading.Thread(
+                    target=self._guardar_en_segundo_plano, name="similitud-guardado", daemon=True
+                )
+                self._hilo_guardado.start()
+        if pendiente:
+            # La copia y la escritura (decenas de MB con el índice lleno) no corren en la solicitud
+            self._hay_cambios.set()
+
+    def guardar(self):
+        if not self.ruta:
+            return
+        with self._lock_escritura:
+            with self._lock:
+                self._sin_guardar = 0
+            self._escribir(self._exportar())
+
+    def _guardar_en_segundo_plano(self):
+        while True:
+            self._hay_cambios.wait()
+            self._hay_cambios.clear()
+            try:
+                self.guardar()
+            except Exception as e:
+                print(f"❌ No se pudo guardar el índice de similitud: {str(e)}")
+            time.sleep(self.intervalo_guardado)
+
+    def estadisticas(self):
+        with self._lock:
+            return {**self.contadores, "casos": self._total, "capacidad": self.capacidad, "umbral": self.umbral}
+
+    def _parametros(self):
+        return [self.componentes, self.bandas, self.tamano_ngrama, self.semilla, VERSION_FIRMA]
+
+    def _claves_bandas(self, firma):
+        filas = self.componentes // self.bandas
+        return [firma[i * filas:(i + 1) * filas].tobytes() for i in range(self.bandas)]
+
+    def _insertar(self, firma, claves, huella):
+        fila = self._siguiente
+        if self._huellas[fila] is not None:
+            # Buffer lleno: se saca de las cubetas la firma que se pisa
+            for banda, clave in enumerate(self._claves_bandas(self._firmas[fila])):
+                cubeta = self._cubetas[banda].get(clave)
+                if cubeta is not None:
+                    cubeta.discard(fila)
+                    if not cubeta:
+                        del self._cubetas[banda][clave]
+        else:
+            self._total += 1
+        self._firmas[fila] = firma
+        self._huellas[fila] = huella
+        for banda, clave in enumerate(claves):
+            self._cubetas[banda].setdefault(clave, set()).add(fila)
+        self._siguiente = (fila + 1) % self.capacidad
+
+    def _exportar(self, bloque=4096):
+        """Copia en orden cronológico (del más viejo al más nuevo) tomando el lock de a bloques,
+        para que las consultas no esperen la copia entera. Una alta que llega mientras se copia
+        puede quedar o no en esta copia; la siguiente la incluye.
+        """
+        with self._lock:
+            total = self._total
+            inicio = self._siguiente if total >= self.capacidad else 0
+        firmas = np.empty((total, self.componentes), dtype=np.uint32)
+        huellas = []
+        for desde in range(0, total, bloque):
+            filas = (np.arange(desde, min(desde + bloque, total)) + inicio) % self.capacidad
+            with self._lock:
+                firmas[desde:desde + len(filas)] = self._firmas[filas]
+                huellas.extend([self._huellas[i] for i in filas.tolist()])
+        return {
+            "firmas": firmas,
+            "huellas": np.array(huellas, dtype="U64"),
+            "parametros": np.array(self._parametros()),
+        }
+
+    def _escribir(self, copia):
+        temporal = f"{self.ruta}.{os.getpid()}.{time.monotonic_ns()}.tmp.npz"
+        try:
+            directorio = os.path.dirname(self.ruta)
+            if directorio:
+                os.makedirs(directorio, exist_ok=True)
+            np.savez(temporal, **copia)
+            os.replace(temporal, self.ruta)
+        except OSError as e:
+            print(f"❌ No se pudo guardar el índice de similitud: {str(e)}")
+            if os.path.exists(temporal):
+                os.remove(temporal)
+
+    def _cargar(self):
+        try:
+            with np.load(self.ruta) as datos:
+                parametros = datos["parametros"].tolist()
+                firmas = datos["firmas"]
+                huellas = datos["huellas"].tolist()
+        except (OSError, ValueError, KeyError) as e:
+            print(f"❌ No se pudo leer el índice de similitud, se empieza vacío: {str(e)}")
+            return
+        if parametros != self._parametros():
+            print("❌ El índice de similitud en disco usa otros parámetros, se empieza vacío.")
+            return
+        for firma, huella in zip(firmas[-self.capacidad:], huellas[-self.capacidad:]):
+            self._insertar(firma, self._claves_bandas(firma), huella)
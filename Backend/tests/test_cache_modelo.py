@@ -0,0 +1,162 @@
+"""Pruebas del cache de respuestas del modelo: clave, política, aciertos y fallos en memoria y en disco.
+
+Uso (desde Backend/):
+    python -m pytest -q tests
+"""
+import os
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache_modelo import CacheRespuestas, ModeloConCache, clave_cache, debe_cachear  # noqa: E402
+
+DETERMINISTA = {"temperature": 0, "max_output_tokens": 100}
+
+
+class Respuesta:
+    def __init__(self, text):
+        self.text = text
+
+
+class ModeloContador:
+    """Responde con el número de llamada, para distinguir una respuesta nueva de una cacheada"""
+
+    def __init__(self):
+        self.llamadas = 0
+
+    def generate_content(self, contents, generation_config=None, stream=False, tipo="otro", **kwargs):
+        self.llamadas += 1
+        texto = f"respuesta {self.llamadas}"
+        if stream:
+            return iter([Respuesta(texto[:5]), Respuesta(texto[5:])])
+        return Respuesta(texto)
+
+
+class PruebaClave(unittest.TestCase):
+    def test_los_espacios_no_cambian_la_clave(self):
+        self.assertEqual(
+            clave_cache("Analiza  el\ncaso ", "modelo", DETERMINISTA),
+            clave_cache("Analiza el caso", "modelo", dict(reversed(DETERMINISTA.items()))),
+        )
+        historial = [{"role": "user", "parts": ["hola\n\nmundo"]}]
+        self.assertEqual(
+            clave_cache(historial, "modelo", None),
+            clave_cache([{"role": "user", "parts": ["hola mundo"]}], "modelo", {}),
+        )
+
+    def test_modelo_configuracion_y_texto_cambian_la_clave(self):
+        base = clave_cache("caso", "modelo", DETERMINISTA)
+        self.assertNotEqual(base, clave_cache("caso", "otro-modelo", DETERMINISTA))
+        self.assertNotEqual(base, clave_cache("caso", "modelo", {**DETERMINISTA, "max_output_tokens": 200}))
+        self.assertNotEqual(base, clave_cache("Caso", "modelo", DETERMINISTA))
+
+
+class PruebaPolitica(unittest.TestCase):
+    def test_por_defecto_solo_temperatura_cero(self):
+        self.assertTrue(debe_cachear({"temperature": 0}))
+        self.assertFalse(debe_cachear({"temperature": 0.7}))
+        self.assertFalse(debe_cachear(None))
+
+    def test_la_ruta_puede_forzar_o_excluir(self):
+        self.assertTrue(debe_cachear({"temperature": 0.7}, cache=True))
+        self.assertFalse(debe_cachear({"temperature": 0}, cache=False))
+
+
+class PruebaCacheRespuestas(unittest.TestCase):
+    def setUp(self):
+        self.directorio = tempfile.TemporaryDirectory(prefix="cache-")
+        self.ruta = os.path.join(self.directorio.name, "respuestas.sqlite3")
+
+    def tearDown(self):
+        self.directorio.cleanup()
+
+    def test_fallo_y_acierto_en_memoria(self):
+        cache = CacheRespuestas(self.ruta)
+        self.assertIsNone(cache.obtener("a"))
+        cache.guardar("a", "texto")
+        self.assertEqual(cache.obtener("a"), "texto")
+        estadisticas = cache.estadisticas()
+        self.assertEqual((estadisticas["fallos"], estadisticas["aciertos_memoria"]), (1, 1))
+        self.assertEqual(estadisticas["tasa_aciertos"], 0.5)
+
+    def test_acierto_en_disco_tras_salir_de_memoria_y_entre_procesos(self):
+        cache = CacheRespuestas(self.ruta, max_memoria=1)
+        cache.guardar("a", "uno")
+        cache.guardar("b", "dos")
+        self.assertEqual(cache.obtener("a"), "uno")
+        self.assertEqual(cache.estadisticas()["aciertos_disco"], 1)
+
+        otra = CacheRespuestas(self.ruta)
+        self.assertEqual(otra.obtener("b"), "dos")
+        self.assertEqual(otra.estadisticas()["entradas_disco"], 2)
+
+    def test_lo_vencido_es_un_fallo(self):
+        cache = CacheRespuestas(self.ruta, ttl=60)
+        with mock.patch("cache_modelo.time.time", return_value=1000.0):
+            cache.guardar("a", "texto")
+        with mock.patch("cache_modelo.time.time", return_value=1061.0):
+            self.assertIsNone(cache.obtener("a"))
+
+    def test_el_disco_expulsa_lo_menos_usado(self):
+        cache = CacheRespuestas(self.ruta, max_memoria=1, max_disco=10)
+        inicio = time.time() - 100
+        for numero in range(11):
+            with mock.patch("cache_modelo.time.time", return_value=inicio + numero):
+                cache.guardar(f"clave-{numero}", "texto")
+        estadisticas = cache.estadisticas()
+        self.assertEqual(estadisticas["entradas_disco"], 9)
+        self.assertEqual(estadisticas["expulsiones"], 2)
+        self.assertIsNone(cache.obtener("clave-0"))
+        self.assertEqual(cache.obtener("clave-10"), "texto")
+
+
+class PruebaModeloConCache(unittest.TestCase):
+    def setUp(self):
+        self.directorio = tempfile.TemporaryDirectory(prefix="cache-")
+        self.interno = ModeloContador()
+        self.modelo = ModeloConCache(
+            self.interno, CacheRespuestas(os.path.join(self.directorio.name, "respuestas.sqlite3")), "modelo"
+        )
+
+    def tearDown(self):
+        self.directorio.cleanup()
+
+    def test_el_prompt_repetido_no_llega_al_modelo(self):
+        primera = self.modelo.generate_content("Analiza el caso", generation_config=DETERMINISTA)
+        segunda = self.modelo.generate_content("Analiza  el caso\n", generation_config=DETERMINISTA)
+        self.assertEqual((primera.text, segunda.text), ("respuesta 1", "respuesta 1"))
+        self.assertEqual(self.interno.llamadas, 1)
+
+    def test_lo_creativo_no_se_cachea_salvo_que_se_fuerce(self):
+        creativo = {"temperature": 0.7}
+        self.modelo.generate_content("caso", generation_config=creativo)
+        self.assertEqual(self.modelo.generate_content("caso", generation_config=creativo).text, "respuesta 2")
+        self.modelo.generate_content("caso", generation_config=creativo, cache=True)
+        self.assertEqual(self.modelo.generate_content("caso", generation_config=creativo, cache=True).text, "respuesta 3")
+
+    def test_el_stream_se_guarda_solo_si_se_consume_completo(self):
+        fragmentos = self.modelo.generate_content("caso", generation_config=DETERMINISTA, stream=True)
+        next(fragmentos)
+        fragmentos.close()
+        completo = "".join(f.text for f in self.modelo.generate_content("caso", generation_config=DETERMINISTA, stream=True))
+        self.assertEqual(completo, "respuesta 2")
+        cacheado = list(self.modelo.generate_content("caso", generation_config=DETERMINISTA, stream=True))
+        self.assertEqual([f.text for f in cacheado], ["respuesta 2"])
+        self.assertEqual(self.interno.llamadas, 2)
+
+    def test_cada_turno_del_chat_se_cachea_con_su_historial(self):
+        for _ in range(2):
+            chat = self.modelo.start_chat()
+            analisis = chat.send_message("caso", generation_config=DETERMINISTA)
+            procedimiento = chat.send_message("procedimiento", generation_config=DETERMINISTA)
+        self.assertEqual((analisis.text, procedimiento.text), ("respuesta 1", "respuesta 2"))
+        self.assertEqual(self.interno.llamadas, 2)
+        self.assertEqual(len(chat.history), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
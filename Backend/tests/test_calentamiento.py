@@ -0,0 +1,90 @@
+"""Pruebas del calentamiento en segundo plano y del import liviano de app.py.
+
+Uso (desde Backend/):
+    python -m pytest -q tests
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+DIRECTORIO_APP = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, DIRECTORIO_APP)
+
+from calentamiento import Calentamiento  # noqa: E402
+
+# Los mismos que vigila bench/perfil_import.py
+PESADOS = ("fitz", "pymupdf", "fpdf", "numpy", "google.generativeai", "bs4")
+
+
+class FallaVeces:
+    """Tarea que falla las primeras `veces` llamadas"""
+
+    def __init__(self, veces):
+        self.veces = veces
+        self.llamadas = 0
+
+    def __call__(self):
+        self.llamadas += 1
+        if self.llamadas <= self.veces:
+            raise RuntimeError("todavía no")
+
+
+def esperar(calentamiento, condicion, limite=5.0):
+    fin = time.monotonic() + limite
+    while time.monotonic() < fin:
+        estado = calentamiento.estado()
+        if condicion(estado):
+            return estado
+        time.sleep(0.01)
+    raise AssertionError(f"no se cumplió la condición: {calentamiento.estado()}")
+
+
+class PruebaCalentamiento(unittest.TestCase):
+    def test_reintenta_las_tareas_que_fallan(self):
+        tarea = FallaVeces(2)
+        calentamiento = Calentamiento({"bien": lambda: None, "inestable": tarea}, espera_base=0.01)
+        self.assertFalse(calentamiento.estado()["listo"])
+        calentamiento.iniciar()
+        estado = esperar(calentamiento, lambda e: e["listo"])
+        self.assertEqual(tarea.llamadas, 3)
+        self.assertEqual(estado["tareas"]["inestable"]["intentos"], 3)
+
+    def test_opcional_que_falla_no_retiene_listo(self):
+        calentamiento = Calentamiento(
+            {"riesgo": lambda: None, "informes": FallaVeces(10 ** 6)}, opcionales=["informes"], espera_base=0.01
+        )
+        calentamiento.iniciar()
+        estado = esperar(calentamiento, lambda e: e["tareas"]["informes"].get("intentos", 0) >= 2)
+        self.assertTrue(estado["listo"])
+        self.assertEqual(estado["tareas"]["informes"]["estado"], "error")
+        self.assertTrue(estado["tareas"]["informes"]["opcional"])
+
+    def test_requerida_que_falla_retiene_listo(self):
+        calentamiento = Calentamiento({"pdf": FallaVeces(10 ** 6)}, espera_base=0.01)
+        calentamiento.iniciar()
+        estado = esperar(calentamiento, lambda e: e["tareas"]["pdf"].get("intentos", 0) >= 2)
+        self.assertFalse(estado["listo"])
+
+
+class PruebaImportLiviano(unittest.TestCase):
+    def test_importar_app_no_carga_modulos_pesados(self):
+        with tempfile.TemporaryDirectory(prefix="import-") as directorio_cache:
+            variables = {
+                **os.environ,
+                "MODELO_BACKEND": "falso",
+                "DIRECTORIO_CACHE": directorio_cache,
+                "CALENTAR_AL_INICIAR": "0",
+            }
+            salida = subprocess.run(
+                [sys.executable, "-c", f"import sys, app; print('= ' + ' '.join(m for m in {PESADOS!r} if m in sys.modules))"],
+                cwd=DIRECTORIO_APP, env=variables, capture_output=True, text=True, check=True,
+            ).stdout
+        cargados = [linea[2:].split() for linea in salida.splitlines() if linea.startswith("= ")][0]
+        self.assertEqual(cargados, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
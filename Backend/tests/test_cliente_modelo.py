@@ -0,0 +1,153 @@
+"""Pruebas sin red del circuit breaker y los reintentos de ClienteModelo, con BackendFalso.
+
+Uso (desde Backend/):
+    python -m pytest -q tests
+"""
+import os
+import sys
+import threading
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cliente_modelo  # noqa: E402
+from cliente_modelo import (  # noqa: E402
+    BackendFalso, CircuitoAbierto, ClienteModelo, ErrorTransitorioFalso, LimiteExcedido,
+)
+
+ENFRIAMIENTO = 0.05
+
+
+class Guion:
+    """responder de BackendFalso que sigue una lista de acciones y después contesta "ok" """
+
+    def __init__(self, *acciones):
+        self.acciones = list(acciones)
+
+    def __call__(self, prompt):
+        accion = self.acciones.pop(0) if self.acciones else "ok"
+        if isinstance(accion, Exception):
+            raise accion
+        if callable(accion):
+            return accion()
+        return accion
+
+
+def cliente(responder, **opciones):
+    return ClienteModelo(
+        BackendFalso(latencia=0, responder=responder),
+        solicitudes_por_segundo=1000.0,
+        reintentos=0,
+        umbral_fallos=1,
+        enfriamiento=ENFRIAMIENTO,
+        **opciones,
+    )
+
+
+class PruebaInterruptor(unittest.TestCase):
+    def abrir_circuito(self, modelo):
+        with self.assertRaises(ErrorTransitorioFalso):
+            modelo.generate_content("falla")
+        self.assertEqual(modelo.interruptor.estado, "abierto")
+        time.sleep(ENFRIAMIENTO * 1.5)
+        self.assertEqual(modelo.interruptor.estado, "semiabierto")
+
+    def test_error_no_transitorio_en_la_prueba_cierra_el_circuito(self):
+        modelo = cliente(Guion(ErrorTransitorioFalso("503"), ValueError("respuesta inválida")))
+        self.abrir_circuito(modelo)
+
+        with self.assertRaises(ValueError):
+            modelo.generate_content("prueba")
+        for _ in range(3):
+            self.assertEqual(modelo.generate_content("sano").text, "ok")
+        self.assertEqual(modelo.interruptor.estado, "cerrado")
+
+    def test_prueba_rechazada_por_concurrencia_se_libera(self):
+        liberar = threading.Event()
+        modelo = cliente(Guion(ErrorTransitorioFalso("503"), lambda: liberar.wait(5) and "lento"), max_concurrencia=1)
+        self.abrir_circuito(modelo)
+
+        # La prueba ocupa el único cupo; la siguiente llamada espera el cupo y no puede ser otra prueba
+        lenta = threading.Thread(target=modelo.generate_content, args=("lento",))
+        lenta.start()
+        time.sleep(0.05)
+        with self.assertRaises(CircuitoAbierto):
+            modelo.generate_content("otra", request_options={"timeout": 0.01})
+        liberar.set()
+        lenta.join()
+        self.assertEqual(modelo.interruptor.estado, "cerrado")
+
+        # Circuito semiabierto y cupo ocupado por fuera: la prueba se rechaza sin llegar al modelo
+        modelo.interruptor.fallo()
+        time.sleep(ENFRIAMIENTO * 1.5)
+        self.assertTrue(modelo._cupos.acquire(timeout=1))
+        try:
+            with self.assertRaises(LimiteExcedido):
+                modelo.generate_content("sin cupo", request_options={"timeout": 0.01})
+        finally:
+            modelo._cupos.release()
+        self.assertEqual(modelo.generate_content("sano").text, "ok")
+        self.assertEqual(modelo.interruptor.estado, "cerrado")
+
+    def test_prueba_con_error_transitorio_vuelve_a_abrir(self):
+        modelo = cliente(Guion(ErrorTransitorioFalso("503"), ErrorTransitorioFalso("503")))
+        self.abrir_circuito(modelo)
+
+        with self.assertRaises(ErrorTransitorioFalso):
+            modelo.generate_content("prueba")
+        self.assertEqual(modelo.interruptor.estado, "abierto")
+        time.sleep(ENFRIAMIENTO * 1.5)
+        self.assertEqual(modelo.generate_content("sano").text, "ok")
+        self.assertEqual(modelo.interruptor.estado, "cerrado")
+
+
+class PruebaReintentos(unittest.TestCase):
+    def test_plazo_total_corta_los_reintentos(self):
+        # Cada intento agota su timeout: con plazo 0.5 s no caben los 5 reintentos de 0.2 s
+        modelo = ClienteModelo(
+            BackendFalso(latencia=1.0), solicitudes_por_segundo=1000.0, reintentos=5, espera_base=0.01,
+            timeout=0.2, plazo_total=0.5, umbral_fallos=100, intento_minimo=0.01,
+        )
+        inicio = time.monotonic()
+        with self.assertRaises(TimeoutError):
+            modelo.generate_content("lento")
+        self.assertLess(time.monotonic() - inicio, 0.6)
+        self.assertLessEqual(modelo.estadisticas()["reintentos"], 1)
+
+    def test_plazo_por_llamada(self):
+        modelo = ClienteModelo(
+            BackendFalso(latencia=1.0), solicitudes_por_segundo=1000.0, reintentos=5, espera_base=0.01,
+            timeout=5.0, umbral_fallos=100,
+        )
+        inicio = time.monotonic()
+        with self.assertRaises(TimeoutError):
+            modelo.generate_content("lento", request_options={"plazo": 0.3})
+        self.assertLess(time.monotonic() - inicio, 0.5)
+
+    def test_la_espera_entre_reintentos_libera_el_cupo(self):
+        modelo = ClienteModelo(
+            BackendFalso(latencia=0, responder=Guion(ErrorTransitorioFalso("503"))),
+            solicitudes_por_segundo=1000.0, max_concurrencia=1, reintentos=1, espera_base=0.3, umbral_fallos=100,
+        )
+        resultados = {}
+
+        def llamar(nombre):
+            resultados[nombre] = modelo.generate_content(nombre).text
+
+        # Espera del reintento fija en 0.3 s: la segunda llamada entra con el cupo que la primera soltó
+        with mock.patch.object(cliente_modelo.random, "uniform", lambda inferior, superior: superior):
+            primera = threading.Thread(target=llamar, args=("primera",))
+            primera.start()
+            time.sleep(0.1)
+            inicio = time.monotonic()
+            segunda = modelo.generate_content("segunda", request_options={"timeout": 0.1}).text
+            self.assertLess(time.monotonic() - inicio, 0.1)
+            primera.join()
+        self.assertEqual((segunda, resultados["primera"]), ("ok", "ok"))
+        self.assertEqual(modelo.estadisticas()["reintentos"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
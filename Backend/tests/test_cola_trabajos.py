@@ -0,0 +1,107 @@
+"""Pruebas de la cola de trabajos en SQLite: ejecución, latidos y recuperación de trabajos colgados.
+
+Uso (desde Backend/):
+    python -m pytest -q tests
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cola_trabajos import ColaTrabajos  # noqa: E402
+
+LATIDO = 0.05
+
+
+def esperar_estado(cola, id_trabajo, estado, limite=5.0):
+    fin = time.monotonic() + limite
+    while time.monotonic() < fin:
+        trabajo = cola.obtener(id_trabajo)
+        if trabajo["estado"] == estado:
+            return trabajo
+        time.sleep(0.01)
+    raise AssertionError(f"el trabajo quedó en {cola.obtener(id_trabajo)['estado']}, se esperaba {estado}")
+
+
+class PruebaColaTrabajos(unittest.TestCase):
+    def setUp(self):
+        self.directorio = tempfile.TemporaryDirectory(prefix="cola-")
+        self.ruta = os.path.join(self.directorio.name, "trabajos.sqlite3")
+
+    def tearDown(self):
+        self.directorio.cleanup()
+
+    def cola(self, manejador=lambda payload: ({"eco": payload}, 200), **opciones):
+        cola = ColaTrabajos(self.ruta, hilos=1, latido=LATIDO, **opciones)
+        cola.registrar("eco", manejador)
+        return cola
+
+    def insertar_en_proceso(self, cola, propietario, iniciado=None):
+        with cola._lock:
+            cola._db.execute(
+                "INSERT INTO trabajos (id, tipo, estado, payload, creado, iniciado, propietario) "
+                "VALUES ('colgado', 'eco', 'en_proceso', ?, ?, ?, ?)",
+                ('{"n": 1}', time.time(), iniciado or time.time(), propietario),
+            )
+
+    def test_ejecuta_y_guarda_el_resultado(self):
+        cola = self.cola()
+        id_trabajo = cola.encolar("eco", {"n": 1})
+        trabajo = esperar_estado(cola, id_trabajo, "completado")
+        self.assertEqual((trabajo["resultado"], trabajo["codigo"]), ({"eco": {"n": 1}}, 200))
+
+    def test_tipo_desconocido(self):
+        with self.assertRaises(ValueError):
+            self.cola().encolar("otro", {})
+
+    def test_no_reencola_lo_que_ejecuta_otro_proceso_vivo(self):
+        liberar = threading.Event()
+        primera = self.cola(lambda payload: (liberar.wait(5) and {"de": "primera"}, 200))
+        id_trabajo = primera.encolar("eco", {})
+        esperar_estado(primera, id_trabajo, "en_proceso")
+
+        segunda = self.cola(lambda payload: ({"de": "segunda"}, 200))
+        segunda.iniciar()
+        time.sleep(LATIDO * 6)
+        self.assertEqual(segunda.obtener(id_trabajo)["estado"], "en_proceso")
+        liberar.set()
+        self.assertEqual(esperar_estado(primera, id_trabajo, "completado")["resultado"], {"de": "primera"})
+
+    def test_recupera_trabajos_de_un_propietario_sin_latido(self):
+        cola = self.cola()
+        with cola._lock:
+            cola._db.execute("INSERT INTO propietarios (id, latido) VALUES ('caido', ?)", (time.time() - 60,))
+        self.insertar_en_proceso(cola, "caido")
+        cola.iniciar()
+        self.assertEqual(esperar_estado(cola, "colgado", "completado")["resultado"], {"eco": {"n": 1}})
+
+    def test_recupera_trabajos_con_arrendamiento_vencido(self):
+        cola = self.cola(arrendamiento=0.2)
+        cola.iniciar()
+        # El propietario sigue latiendo pero el trabajo lleva más que el arrendamiento
+        self.insertar_en_proceso(cola, "otro-vivo", iniciado=time.time() - 1)
+        with cola._lock:
+            cola._db.execute("INSERT INTO propietarios (id, latido) VALUES ('otro-vivo', ?)", (time.time() + 60,))
+        esperar_estado(cola, "colgado", "completado")
+
+    def test_propietario_fijo_retoma_al_reiniciar(self):
+        anterior = self.cola(propietario="replica-1")
+        anterior._latir()
+        self.insertar_en_proceso(anterior, "replica-1")
+        reiniciada = self.cola(propietario="replica-1")
+        reiniciada.iniciar()
+        esperar_estado(reiniciada, "colgado", "completado")
+
+    def test_resultado_de_un_trabajo_retomado_por_otro_no_se_pisa(self):
+        cola = self.cola()
+        self.insertar_en_proceso(cola, "otro")
+        cola._ejecutar("colgado", "eco", '{"n": 1}', None)
+        self.assertEqual(cola.obtener("colgado")["estado"], "en_proceso")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+"""Pruebas de html_a_texto_plano contra la salida grabada de BeautifulSoup.
+
+Cada esperado es lo que devolvía BeautifulSoup(html, "html.parser").get_text(separator="\\n").strip()
+(bs4 4.12.3), la conversión que se usaba antes para los informes de /descargar_pdf.
+
+Uso (desde Backend/):
+    python -m pytest -q tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from informe_pdf import html_a_texto_plano  # noqa: E402
+
+GRABADOS = {
+    # Lo que produce markdown_to_html para una respuesta típica del modelo
+    "respuesta_modelo": (
+        "<p>## Hallazgos</p>\n<br>\n<p>1. <strong>No conformidad</strong> en la cláusula 7.5</p>\n"
+        "<p>2. Falta *evidencia* de `registros`</p>\n<br>\n<p>- Acción: revisar</p>\n"
+        "<p>- Responsable: calidad</p>\n<br>\n<p>> Nota final & cierre</p>",
+        "## Hallazgos\n\n\n\n\n1. \nNo conformidad\n en la cláusula 7.5\n\n\n2. Falta *evidencia* de `registros`"
+        "\n\n\n\n\n- Acción: revisar\n\n\n- Responsable: calidad\n\n\n\n\n> Nota final & cierre",
+    ),
+    "parrafos_y_saltos": (
+        "<p>Línea uno<br>línea dos<br/>línea tres</br></p>\n\n<p>  </p><div>fin</div>",
+        "Línea uno\nlínea dos\nlínea tres\n\n\n \nfin",
+    ),
+    "tabla": (
+        "<table><tr><th>Cláusula</th><th>Estado</th></tr>\n<tr><td>4.1</td><td>Cumple</td></tr></table>",
+        "Cláusula\nEstado\n\n\n4.1\nCumple",
+    ),
+    "sin_cerrar": (
+        "<ul><li>uno<li>dos</ul><p>párrafo <b>abierto",
+        "uno\ndos\npárrafo \nabierto",
+    ),
+    "preformateado": (
+        "<pre>  a\n\n  b  </pre><textarea>\n \n</textarea>",
+        "a\n\n  b",
+    ),
+    "omitido": (
+        "<style>p{color:red}</style><script>alert(1)</script><template>x</template>visible<!-- nota -->",
+        "visible",
+    ),
+    "entidades_y_cdata": (
+        "&lt;ISO&gt; 9001 &amp; &aacute;rea &#8212; <![CDATA[dato crudo]]> &nbsp;fin",
+        "<ISO> 9001 & área — \ndato crudo\n \xa0fin",
+    ),
+    "texto_plano": (
+        "Respuesta escrita a mano\nsin etiquetas",
+        "Respuesta escrita a mano\nsin etiquetas",
+    ),
+}
+
+
+class PruebaHtmlATexto(unittest.TestCase):
+    def test_coincide_con_la_salida_grabada(self):
+        for nombre, (html, esperado) in GRABADOS.items():
+            with self.subTest(nombre):
+                self.assertEqual(html_a_texto_plano(html), esperado)
+
+    def test_coincide_con_beautifulsoup_si_esta_instalado(self):
+        try:
+            from bs4 import BeautifulSoup
+        except ImportError:
+            self.skipTest("bs4 no está instalado")
+        for nombre, (html, _) in GRABADOS.items():
+            with self.subTest(nombre):
+                esperado = BeautifulSoup(html, "html.parser").get_text(separator="\n").strip()
+                self.assertEqual(html_a_texto_plano(html), esperado)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+"""Pruebas de la clasificación de intenciones de /chat.
+
+Uso (desde Backend/):
+    python -m pytest -q tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from intenciones import INTENCIONES, clasificar, plegar, senales  # noqa: E402
+
+ESPERADAS = {
+    "¡Hola!": "saludo",
+    "Buenas tardes, gracias": "saludo",
+    "Dame un caso de estudio": "caso_real",
+    "Quiero un caso real de una empresa textil": "caso_real",
+    "ISO 9001?": "pregunta_iso",
+    "no conformidad": "pregunta_iso",
+    "abc": "muy_corto",
+    "¿Qué es una no conformidad mayor?": "pregunta_iso",
+    "Cuéntame un chiste sobre gatos por favor": "fuera_de_tema",
+    "¿Quién ganó el partido de ayer?": "fuera_de_tema",
+    "traduce esto al inglés por favor": "fuera_de_tema",
+    "La empresa Textiles Andinos registra quejas mensuales por defectos de costura y no capacita a sus operarios": "caso",
+}
+
+
+class PruebaClasificar(unittest.TestCase):
+    def test_intenciones_esperadas(self):
+        for texto, intencion in ESPERADAS.items():
+            with self.subTest(texto):
+                self.assertEqual(clasificar(texto), intencion)
+                self.assertIn(intencion, INTENCIONES)
+
+    def test_ante_la_duda_es_caso(self):
+        casos = [
+            # Un saludo que sigue con un caso no es solo un saludo
+            "hola, la empresa no tiene registros de calibración",
+            # Fuera de tema pero nombrando la norma
+            "Cuéntame un chiste sobre auditoría ISO 9001",
+            # Pregunta que además describe una empresa
+            "La empresa no tiene registros. ¿Qué no conformidades hay?",
+            # Pregunta más larga que max_palabras_pregunta
+            "¿Qué cláusula aplica " + "palabra " * 45 + "?",
+        ]
+        for texto in casos:
+            with self.subTest(texto):
+                self.assertEqual(clasificar(texto), "caso")
+
+    def test_los_umbrales_de_palabras_se_pueden_configurar(self):
+        self.assertEqual(clasificar("revisar los registros", min_palabras=4), "muy_corto")
+        self.assertEqual(clasificar("revisar los registros", min_palabras=2), "caso")
+        pregunta = "¿Qué exige la norma sobre la información documentada?"
+        self.assertEqual(clasificar(pregunta), "pregunta_iso")
+        self.assertEqual(clasificar(pregunta, max_palabras_pregunta=3), "caso")
+
+
+class PruebaSenales(unittest.TestCase):
+    def test_plegar(self):
+        self.assertEqual(plegar("  ¿Qué   ES\tla CLÁUSULA 7.5? "), "?que es la clausula 7.5?")
+        self.assertEqual(plegar(None), "")
+
+    def test_la_palabra_interrogativa_queda_libre_para_otras_senales(self):
+        self.assertEqual(senales(plegar("¿Quién ganó?")), {"pregunta", "fuera_de_tema"})
+        self.assertEqual(senales(plegar("La empresa tiene quejas")), {"dominio"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+"""Pruebas de MarkdownIncremental: lo emitido por fragmentos es igual a markdown_to_html del texto completo.
+
+Uso (desde Backend/):
+    python -m pytest -q tests
+"""
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from markdown_html import MarkdownIncremental, markdown_to_html  # noqa: E402
+
+TEXTOS = {
+    "analisis": (
+        "  \n### Hallazgos\n\n**No conformidad** en la cláusula 7.5\n* registros incompletos\n"
+        "* falta de ***evidencia***\n\nConclusión final.  \n\n"
+    ),
+    "lista_al_final": "Acciones:\n* revisar\n* capacitar",
+    "etiquetas": "Texto <b>con\netiqueta</b> partida\n<br>\nfin <i",
+    "solo_espacios": " \n \t ",
+    "una_linea": "Sin saltos de línea",
+}
+
+
+def transmitir(texto, cortes):
+    convertidor = MarkdownIncremental()
+    partes, inicio = [], 0
+    for corte in sorted(cortes) + [len(texto)]:
+        partes.append(convertidor.alimentar(texto[inicio:corte]))
+        inicio = corte
+    partes.append(convertidor.cerrar())
+    return partes
+
+
+class PruebaMarkdownIncremental(unittest.TestCase):
+    def test_caracter_por_caracter(self):
+        for nombre, texto in TEXTOS.items():
+            with self.subTest(nombre):
+                partes = transmitir(texto, range(1, len(texto)))
+                self.assertEqual("".join(partes), markdown_to_html(texto.strip()))
+
+    def test_cortes_al_azar(self):
+        azar = random.Random(9001)
+        for nombre, texto in TEXTOS.items():
+            for _ in range(50):
+                cortes = azar.sample(range(1, max(len(texto), 2)), min(5, max(len(texto) - 1, 0)))
+                with self.subTest(nombre, cortes=cortes):
+                    self.assertEqual("".join(transmitir(texto, cortes)), markdown_to_html(texto.strip()))
+
+    def test_emite_las_lineas_completas_sin_esperar_al_final(self):
+        convertidor = MarkdownIncremental()
+        self.assertEqual(convertidor.alimentar("primera línea\nsegun"), "<p>primera línea</p>")
+        self.assertEqual(convertidor.alimentar("da"), "")
+        self.assertEqual(convertidor.cerrar(), "\n<p>segunda</p>")
+
+    def test_retiene_una_etiqueta_sin_cerrar(self):
+        convertidor = MarkdownIncremental()
+        self.assertEqual(convertidor.alimentar("uno <b\n"), "")
+        self.assertEqual(convertidor.alimentar(">dos</b>\ntres"), "<p>uno dos</p>")
+
+    def test_cierra_la_lista_abierta(self):
+        convertidor = MarkdownIncremental()
+        html = convertidor.alimentar("* a\n* b\n") + convertidor.cerrar()
+        self.assertEqual(html, "<ul>\n<li>a</li>\n<li>b</li>\n</ul>")
+
+
+if __name__ == "__main__":
+    unittest.main()
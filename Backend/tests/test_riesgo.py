@@ -0,0 +1,110 @@
+"""Pruebas del registro de riesgos por lote: lectura de JSON y CSV, rechazos y agregados.
+
+Uso (desde Backend/):
+    python -m pytest -q tests
+"""
+import io
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import riesgo  # noqa: E402
+from riesgo import RegistroRechazado  # noqa: E402
+
+
+class FlujoSinReadable:
+    """Como el SpooledTemporaryFile de Python < 3.11: solo read(), sin readable()"""
+
+    def __init__(self, datos):
+        self._datos = io.BytesIO(datos)
+
+    def read(self, cantidad=-1):
+        return self._datos.read(cantidad)
+
+
+class PruebaLeerJson(unittest.TestCase):
+    def test_listas_paralelas(self):
+        impactos, probabilidades = riesgo.leer_json({"impacto": [1, 5, "3"], "probabilidad": [2, 5, 4.0]}, 10)
+        self.assertEqual(impactos.tolist(), [1, 5, 3])
+        self.assertEqual(probabilidades.tolist(), [2, 5, 4])
+
+    def test_lista_de_objetos(self):
+        impactos, probabilidades = riesgo.leer_json(
+            {"riesgos": [{"impacto": 2, "probabilidad": 3}, "no es un objeto", {"impacto": 4}]}, 10
+        )
+        self.assertEqual(impactos.tolist(), [2, 0, 4])
+        self.assertEqual(probabilidades.tolist(), [3, 0, 0])
+
+    def test_valores_fuera_de_escala_quedan_invalidos(self):
+        impactos, _ = riesgo.leer_json({"impacto": [0, 6, 2.5, -1, "x", None, "3,0"], "probabilidad": [1] * 7}, 10)
+        self.assertEqual(impactos.tolist(), [0, 0, 0, 0, 0, 0, 3])
+
+    def test_los_booleanos_no_cuentan_como_numeros(self):
+        # Sin textos en la lista: es el camino que convierte todo el arreglo de una vez
+        impactos, probabilidades = riesgo.leer_json({"impacto": [True, 2, False], "probabilidad": [3, True, 3]}, 10)
+        self.assertEqual(impactos.tolist(), [0, 2, 0])
+        self.assertEqual(probabilidades.tolist(), [3, 0, 3])
+        impactos, _ = riesgo.leer_json({"riesgos": [{"impacto": True, "probabilidad": 1}, {"impacto": "2", "probabilidad": 1}]}, 10)
+        self.assertEqual(impactos.tolist(), [0, 2])
+
+    def test_rechazos(self):
+        casos = {
+            "arreglo en la raíz": [{"impacto": 1, "probabilidad": 1}],
+            "riesgos no es lista": {"riesgos": {"impacto": 1}},
+            "faltan listas": {"impacto": [1]},
+            "largos distintos": {"impacto": [1, 2], "probabilidad": [1]},
+            "listas anidadas": {"impacto": [[1, 2]], "probabilidad": [[1, 2]]},
+            "demasiadas filas": {"impacto": [1] * 4, "probabilidad": [1] * 4},
+        }
+        for nombre, data in casos.items():
+            with self.subTest(nombre):
+                with self.assertRaises(RegistroRechazado):
+                    riesgo.leer_json(data, 3)
+
+
+class PruebaLeerCsv(unittest.TestCase):
+    def leer(self, texto, max_filas=10):
+        return [arreglo.tolist() for arreglo in riesgo.leer_csv(io.BytesIO(texto.encode("utf-8")), max_filas)]
+
+    def test_encabezado_con_columnas_en_otro_orden(self):
+        self.assertEqual(
+            self.leer("﻿Riesgo;Probabilidad;Impacto\nA;2;5\n\nB;1,0;3\nC;4\n"),
+            [[5, 3, 0], [2, 1, 0]],
+        )
+
+    def test_sin_encabezado_usa_las_dos_primeras_columnas(self):
+        self.assertEqual(self.leer("3,4\n5,x\n6,1\n"), [[3, 5, 0], [4, 0, 1]])
+
+    def test_flujo_sin_readable(self):
+        impactos, probabilidades = riesgo.leer_csv(FlujoSinReadable("impacto,probabilidad\n2,2\n".encode("utf-8")), 10)
+        self.assertEqual((impactos.tolist(), probabilidades.tolist()), ([2], [2]))
+
+    def test_rechazos(self):
+        with self.assertRaises(RegistroRechazado):
+            self.leer("")
+        with self.assertRaises(RegistroRechazado):
+            self.leer("impacto,probabilidad\n1,1\n2,2\n3,3\n", max_filas=2)
+
+
+class PruebaAgregar(unittest.TestCase):
+    def test_mapa_distribucion_y_detalle(self):
+        impactos, probabilidades = riesgo.leer_json({"impacto": [1, 3, 5, 0], "probabilidad": [1, 2, 5, 3]}, 10)
+        resultado = riesgo.agregar(impactos, probabilidades, detalle=True)
+        self.assertEqual((resultado["total"], resultado["validos"], resultado["invalidos"]), (4, 3, 1))
+        self.assertEqual(resultado["indices_invalidos"], [3])
+        self.assertEqual(resultado["distribucion"], {"Bajo": 1, "Medio": 1, "Alto": 1})
+        self.assertEqual(resultado["mapa_calor"]["conteos"][2][1], 1)
+        self.assertEqual(resultado["detalle"][1], {"riesgo": 6, "nivel": "Medio"})
+        self.assertIsNone(resultado["detalle"][3])
+
+    def test_sin_filas_validas(self):
+        impactos, probabilidades = riesgo.leer_json({"impacto": [0], "probabilidad": [0]}, 10)
+        resultado = riesgo.agregar(impactos, probabilidades)
+        self.assertIsNone(resultado["riesgo_medio"])
+        self.assertEqual(resultado["percentiles"]["p50"], None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+"""Pruebas del almacén de sesiones: compactación, volcado a disco y tope por caracteres.
+
+Uso (desde Backend/):
+    python -m pytest -q tests
+"""
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sesiones  # noqa: E402
+from sesiones import AlmacenSesiones  # noqa: E402
+
+
+class PruebaSesiones(unittest.TestCase):
+    def setUp(self):
+        self.directorio = tempfile.TemporaryDirectory(prefix="sesiones-")
+
+    def tearDown(self):
+        self.directorio.cleanup()
+
+    def almacen(self, **opciones):
+        return AlmacenSesiones(self.directorio.name, **opciones)
+
+    def test_compacta_los_turnos_viejos_y_conserva_los_recientes(self):
+        almacen = self.almacen(max_turnos=2, turnos_a_conservar=1)
+        id_sesion = almacen.crear()
+        almacen.registrar_analisis(id_sesion, "caso", "<p>análisis</p>", "análisis")
+        almacen.agregar_turno(id_sesion, "pregunta 1", "<p>r1</p>", "r1")
+        self.assertIsNone(almacen.turnos_a_compactar(id_sesion))
+
+        almacen.agregar_turno(id_sesion, "pregunta 2", "<p>r2</p>", "r2")
+        resumen_previo, viejos = almacen.turnos_a_compactar(id_sesion)
+        self.assertIsNone(resumen_previo)
+        self.assertEqual(len(viejos), 4)
+        self.assertTrue(almacen.aplicar_resumen(id_sesion, "resumen", viejos))
+        # La misma compactación no se aplica dos veces
+        self.assertFalse(almacen.aplicar_resumen(id_sesion, "resumen", viejos))
+
+        caso, resumen, turnos = almacen.conversacion(id_sesion)
+        self.assertEqual((caso, resumen), ("caso", "resumen"))
+        self.assertEqual([turno["parts"][0] for turno in turnos], ["pregunta 2", "r2"])
+        self.assertEqual(almacen.estadisticas()["compactaciones"], 1)
+
+    def test_la_sesion_expulsada_se_vuelca_y_se_recupera(self):
+        almacen = self.almacen(max_memoria=1)
+        primera = almacen.crear()
+        almacen.registrar_analisis(primera, "caso uno", "<p>a</p>", "a", texto_pdf="texto del pdf")
+        segunda = almacen.crear()
+
+        estadisticas = almacen.estadisticas()
+        self.assertEqual((estadisticas["en_memoria"], estadisticas["en_disco"], estadisticas["volcadas"]), (1, 1, 1))
+        self.assertEqual(almacen.artefacto(primera, "texto_pdf-1"), "texto del pdf")
+        self.assertEqual(almacen.estadisticas()["recuperadas"], 1)
+        # Al volver la primera, la segunda pasa a disco
+        self.assertTrue(almacen.existe(segunda))
+
+    def test_el_tope_de_caracteres_expulsa_las_menos_usadas(self):
+        almacen = self.almacen(max_caracteres=1000)
+        vieja = almacen.crear()
+        almacen.registrar_analisis(vieja, "x" * 300, "<p>a</p>", "a")
+        nueva = almacen.crear()
+        almacen.registrar_analisis(nueva, "y" * 300, "<p>b</p>", "b")
+
+        estadisticas = almacen.estadisticas()
+        self.assertEqual(estadisticas["en_memoria"], 1)
+        self.assertLessEqual(estadisticas["caracteres_en_memoria"], 1000)
+        self.assertEqual(estadisticas["volcadas"], 1)
+        self.assertEqual(almacen.conversacion(vieja)[0], "x" * 300)
+
+    def test_una_sesion_sola_mas_grande_que_el_tope_se_queda(self):
+        almacen = self.almacen(max_caracteres=10)
+        id_sesion = almacen.crear()
+        almacen.registrar_analisis(id_sesion, "caso largo", "<p>a</p>", "a", texto_pdf="z" * 100)
+        self.assertEqual(almacen.estadisticas()["en_memoria"], 1)
+        self.assertEqual(almacen.estadisticas()["volcadas"], 0)
+
+    def test_sin_directorio_la_expulsada_se_pierde(self):
+        almacen = AlmacenSesiones(None, max_memoria=1)
+        primera = almacen.crear()
+        almacen.crear()
+        self.assertFalse(almacen.existe(primera))
+
+    def test_el_volcado_no_bloquea_a_otras_sesiones(self):
+        almacen = self.almacen(max_memoria=1)
+        primera = almacen.crear()
+        escribiendo, seguir = threading.Event(), threading.Event()
+        volcar = sesiones.AlmacenSesiones._volcar
+
+        def volcar_lento(instancia, sesion):
+            escribiendo.set()
+            seguir.wait(5)
+            return volcar(instancia, sesion)
+
+        with mock.patch.object(sesiones.AlmacenSesiones, "_volcar", volcar_lento):
+            creadora = threading.Thread(target=almacen.crear)
+            creadora.start()
+            self.assertTrue(escribiendo.wait(5))
+            # Mientras la primera se escribe, el almacén sigue atendiendo
+            self.assertEqual(almacen.estadisticas()["en_memoria"], 1)
+
+            recuperada = []
+            lectora = threading.Thread(target=lambda: recuperada.append(almacen.existe(primera)))
+            lectora.start()
+            lectora.join(0.1)
+            # ...pero quien pide la sesión que se está escribiendo espera al archivo
+            self.assertTrue(lectora.is_alive())
+            seguir.set()
+            creadora.join(5)
+            lectora.join(5)
+        self.assertEqual(recuperada, [True])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+"""Pruebas del índice de casos casi repetidos (MinHash + LSH).
+
+Uso (desde Backend/):
+    python -m pytest -q tests
+"""
+import os
+import random
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import similitud  # noqa: E402
+from similitud import IndiceSimilitud, normalizar_caso  # noqa: E402
+
+PALABRAS = (
+    "empresa calidad auditoría proceso cliente quejas producción registros indicadores capacitación "
+    "personal proveedores inventario entregas retrasos errores facturación mantenimiento equipos"
+).split()
+
+
+def caso(azar, palabras=200):
+    return " ".join(f"{azar.choice(PALABRAS)}{azar.randint(0, 300)}" for _ in range(palabras))
+
+
+def editar(azar, texto, cambios=4):
+    palabras = texto.split()
+    for _ in range(cambios):
+        palabras[azar.randrange(len(palabras))] = azar.choice(PALABRAS)
+    return " ".join(palabras)
+
+
+class PruebaNormalizacion(unittest.TestCase):
+    def test_translitera_como_unidecode(self):
+        self.assertEqual(normalizar_caso("  Año de PRODUCCIÓN: Straße, ñandú!  "), "ano de produccion strasse nandu")
+
+    def test_texto_vacio(self):
+        self.assertEqual(normalizar_caso(None), "")
+
+
+class PruebaIndice(unittest.TestCase):
+    def setUp(self):
+        self.azar = random.Random(5)
+        self.indice = IndiceSimilitud(capacidad=200)
+        self.casos = [caso(self.azar) for _ in range(50)]
+        for numero, texto in enumerate(self.casos):
+            self.indice.agregar(texto, f"h{numero}")
+
+    def test_encuentra_caso_editado(self):
+        huella, similitud_estimada = self.indice.buscar(editar(self.azar, self.casos[7]))
+        self.assertEqual(huella, "h7")
+        self.assertGreaterEqual(similitud_estimada, self.indice.umbral)
+
+    def test_ignora_mayusculas_y_tildes(self):
+        self.assertEqual(self.indice.buscar(self.casos[3].upper())[0], "h3")
+
+    def test_caso_nuevo_no_coincide(self):
+        self.assertIsNone(self.indice.buscar(caso(self.azar)))
+
+    def test_buffer_circular_descarta_el_mas_viejo(self):
+        indice = IndiceSimilitud(capacidad=10)
+        for numero, texto in enumerate(self.casos[:11]):
+            indice.agregar(texto, f"h{numero}")
+        self.assertIsNone(indice.buscar(self.casos[0]))
+        self.assertEqual(indice.buscar(self.casos[10])[0], "h10")
+        self.assertEqual(indice.estadisticas()["casos"], 10)
+
+    def test_firma_por_bloques_igual_a_una_pasada(self):
+        texto = " ".join(self.casos)
+        completa = self.indice.firma(texto)
+        anterior = similitud.VENTANAS_POR_BLOQUE
+        similitud.VENTANAS_POR_BLOQUE = 97
+        try:
+            por_bloques = self.indice.firma(texto)
+        finally:
+            similitud.VENTANAS_POR_BLOQUE = anterior
+        self.assertTrue((completa == por_bloques).all())
+
+    def test_guardar_y_cargar(self):
+        with tempfile.TemporaryDirectory() as directorio:
+            ruta = os.path.join(directorio, "indice.npz")
+            indice = IndiceSimilitud(ruta, capacidad=200)
+            for numero, texto in enumerate(self.casos):
+                indice.agregar(texto, f"h{numero}")
+            indice.guardar()
+            cargado = IndiceSimilitud(ruta, capacidad=200)
+            self.assertEqual(cargado.buscar(self.casos[20])[0], "h20")
+            self.assertEqual(cargado.estadisticas()["casos"], 50)
+
+
+if __name__ == "__main__":
+    unittest.main()